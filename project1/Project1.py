@@ -9,10 +9,9 @@
 import cv2
 import numpy as np
 from matplotlib import pyplot as plt
-import scipy.stats
-from scipy.optimize import curve_fit
-from scipy.special import gamma
 from math import sqrt
+import imgStats
+import noiseBaseline
 
 
 #
@@ -20,12 +19,19 @@ from math import sqrt
 #
 
 class Problem1:
-    def __init__(self, imgFile):
+    def __init__(self, imgFile, cache = None):
         """
         Initialization
         :param imgFile: ndarray or str
+        :param cache: cache.ImageCache or None. If given, the preprocessed image
+            and adjDiff come from the cache and no png is written
         """
         # Load image in greyscale and re-scale the intensity to [0, 31]
+        if cache is not None and type(imgFile).__module__ != np.__name__:
+            self.img = cache.image(imgFile)
+            self.rows, self.cols = self.img.shape
+            self.adjDiff = cache.response(imgFile)
+            return
         if type(imgFile).__module__ == np.__name__:
             self.img = imgFile.astype(np.uint8)
             imgFile = "q6"
@@ -61,19 +67,7 @@ class Problem1:
         :param param: tuple.
         :return: int16 ndarray
         """
-        if type == "adjDiff":
-            newImg = cv2.filter2D(img, -1, np.array([-1.0, 1.0]))
-            newImg[0,:] = newImg[1,:]
-            return newImg
-        elif type == "laplacian":
-            return cv2.Laplacian(img, -1, ksize=param)
-        elif type == "sobelx":
-            return cv2.Sobel(img, -1, 1, 0, ksize=param)
-        elif type == "sobely":
-            return cv2.Sobel(img, -1, 0, 1, ksize=param)
-        else:
-            print "Wrong type name."
-            return None
+        return imgStats.gradientFilter(img, type, param)
 
     def GGD(self, x, alpha, beta):
         """
@@ -83,16 +77,17 @@ class Problem1:
         :param beta: float
         :return: ndarray
         """
-        return beta/(2 * alpha * gamma(1/beta)) * np.exp(-(np.abs(x) / alpha) ** beta)
+        return imgStats.GGD(x, alpha, beta)
 
     def GD(self, x, mean, stdDev):
-        return 1/sqrt(2 * np.pi) / stdDev * np.exp(-((x - mean)/stdDev) ** 2)
+        return imgStats.GD(x, mean, stdDev)
 
     def q1(self, label = "H(z)"):
         print "STEP 1"
         self.diffZ = self.adjDiff.astype(np.int8)
         plt.subplots(1,1)
-        self.histr, self.edges, patch = plt.hist(self.diffZ.ravel(), 63, [-31, 31], normed=True, label="histogram {}".format(label))
+        self.histr, self.edges = imgStats.histogram(self.diffZ)
+        plt.bar(self.edges[:-1], self.histr, width=np.diff(self.edges), align='edge', label="histogram {}".format(label))
         plt.legend()
         plt.show()
 
@@ -106,16 +101,16 @@ class Problem1:
         plt.show()
 
     def q2(self):
-        self.mean, self.var, self.kur = np.mean(self.diffZ.ravel()), np.var(self.diffZ.ravel()), scipy.stats.kurtosis(self.diffZ.ravel())
+        self.mean, self.var, self.kur = imgStats.moments(self.diffZ)
         print "STEP 2: mean = {}, var = {}, kur = {}".format(self.mean, self.var, self.kur)
 
     def q3(self):
-        self.param, pcov = curve_fit(self.GGD, self.edges[:-1], self.histr)
+        self.param = np.array(imgStats.fitGGD(self.histr, self.edges))
         print "STEP 3: sigma = {}, beta = {}".format(*self.param)
         # param2 = scipy.stats.gennorm.fit(diffZ.ravel(), loc=0.0)
         x = np.linspace(-32,32, 1000)
         y_GGD = self.GGD(x, *self.param)
-        plt.hist(self.diffZ.ravel(), 63, [-31, 31], normed=True)
+        plt.bar(self.edges[:-1], self.histr, width=np.diff(self.edges), align='edge')
         plt.plot(x, y_GGD, 'k-', label='GGD')
         # plt.plot(x, scipy.stats.gennorm.pdf(x, *param2), 'r-', label='gennorm pdf')
         plt.xlim([-31,32])
@@ -126,7 +121,7 @@ class Problem1:
         print "STEP 4"
         x = np.linspace(-32,32, 1000)
         y_GD = self.GD(x, self.mean, sqrt(self.var))
-        plt.hist(self.diffZ.ravel(), 63, [-31, 31], normed=True, label="histogram {}".format(label))
+        plt.bar(self.edges[:-1], self.histr, width=np.diff(self.edges), align='edge', label="histogram {}".format(label))
         # plt.plot(x, scipy.stats.norm.pdf(x, 0, param1[0]), 'r-', label='Gaussian distribution')
         plt.plot(x, y_GD, 'r-', label='Gaussian distribution')
         plt.xlim([-31,32])
@@ -141,21 +136,17 @@ class Problem1:
 
     def q5(self, label = "H(z)"):
         print "STEP 5"
-        rows, cols = self.img.shape
         times = ["first", "second", "third"]
         lineType = ['b--', 'g-.', 'r:']
         f, ax = plt.subplots(1, 2)
         ax[0].plot(self.edges[:-1], self.histr, 'k-', label="log histogram logH(z) of Step1")
         ax[1].plot(self.logEdges, self.log10Histr, 'k--', label="log histogram logH(z) of Step1")
         fHist, axHist = plt.subplots(1,1)
-        DSdiffZ = self.img
-
-        for ind in xrange(2): # Do the downsampling 2 times
-            DSdiffZ = np.array([ [np.sum(DSdiffZ[2*i:2*(i+1), 2*j: 2*(j+1)]) / 4 for j in xrange(cols/2)] for i in xrange(rows/2) ])
-            rows, cols = DSdiffZ.shape
-            DSdiffZ = self.gradientFilter(DSdiffZ.astype(np.int16))
 
-            histr, edges, patch = axHist.hist(DSdiffZ.ravel(), 63, [-31, 31], normed=True, label="histogram {} of {} downsampling".format(label, times[ind]))
+        # Do the downsampling 2 times
+        for ind, DSdiffZ in enumerate(imgStats.gradientPyramid(self.img, 2)):
+            histr, edges = imgStats.histogram(DSdiffZ)
+            axHist.bar(edges[:-1], histr, width=np.diff(edges), align='edge', alpha=0.5, label="histogram {} of {} downsampling".format(label, times[ind]))
 
             ax[0].plot(edges[:-1], histr, lineType[ind], label="histogram {} of {} downsampling".format(label, times[ind]))
 
@@ -167,13 +158,29 @@ class Problem1:
         plt.xlim([-31, 32])
         plt.show()
 
-    def q6(self):
+    def q6(self, K = 20):
         print "STEP 6"
-        q6 = Problem1(np.random.randint(0,32, [self.rows, self.cols]))
-        q6.q1(" of the uniform noise image")
-        q6.q2()
-        q6.q4(" of the uniform noise image")
-        q6.q5(" of the uniform noise image")
+        baseline = noiseBaseline.noiseBaseline(self.rows, self.cols, K)
+        kur = baseline["kur"]
+        print "STEP 6: kur of {} uniform noise images = {} [{}, {}]".format(K, kur["mean"][0], kur["lo"][0], kur["hi"][0])
+
+        edges = baseline["edges"][:-1]
+        hist = baseline["hist"]
+        times = ["", " of first downsampling", " of second downsampling"]
+        lineType = ['k-', 'b--', 'g-.']
+        f, ax = plt.subplots(1, 2)
+        histr = imgStats.histogram(self.adjDiff)[0]
+        ax[0].plot(edges, histr, 'r-', label="histogram H(z) of the natural image")
+        ax[1].plot(edges[histr != 0], np.log10(histr[histr != 0]), 'r-', label="log histogram logH(z) of the natural image")
+        for ind in xrange(hist["mean"].shape[0]):
+            ax[0].plot(edges, hist["mean"][ind], lineType[ind], label="mean histogram H(z){} of noise".format(times[ind]))
+            ax[0].fill_between(edges, hist["lo"][ind], hist["hi"][ind], alpha=0.3)
+            nz = hist["lo"][ind] > 0
+            ax[1].plot(edges[nz], np.log10(hist["mean"][ind][nz]), lineType[ind], label="mean log histogram logH(z){} of noise".format(times[ind]))
+            ax[1].fill_between(edges[nz], np.log10(hist["lo"][ind][nz]), np.log10(hist["hi"][ind][nz]), alpha=0.3)
+        ax[0].legend(), ax[1].legend()
+        plt.xlim([-31, 32])
+        plt.show()
 
 
 class Problem2:
@@ -185,10 +192,11 @@ class Problem2:
 
 
 
-pb1 = Problem1("natural_scene_1.jpg")
-# pb1.q1()
-# pb1.q2()
-# pb1.q3()
-# pb1.q4()
-# pb1.q5()
-pb1.q6()
\ No newline at end of file
+if __name__ == "__main__":
+    pb1 = Problem1("natural_scene_1.jpg")
+    # pb1.q1()
+    # pb1.q2()
+    # pb1.q3()
+    # pb1.q4()
+    # pb1.q5()
+    pb1.q6()
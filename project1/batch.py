@@ -0,0 +1,289 @@
+# Non-interactive batch mode for the Problem1 statistics.
+#
+# Usage:
+#   python batch.py "scenes/*.jpg" -o results.jsonl -j 8
+#   python batch.py scenes/ -o results.json --plot report/
+#   python batch.py scenes/ --filter adjDiff laplacian sobelx sobely
+#   python batch.py scenes/ --cache /tmp/p1cache
+#   python batch.py scenes/ --spectrum 512
+#   python batch.py scenes/ --cooccurrence
+#
+# Every image is processed by imgStats.imageStats (filterBank.FilterBank when
+# several filters are asked for) on a process pool and the results are
+# written as one table, one record per image and filter. The per-level
+# histogram (and co-occurrence) accumulators of all images are merged into
+# corpus-level statistics, written next to the table as <out>_corpus.json. Plotting is a
+# separate post-processing step (plotTable) that only needs the table.
+
+
+from __future__ import print_function, division
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+from functools import partial
+
+import numpy as np
+
+from imgStats import loadImage, imageStats, fitGGD, HIST_BINS, HIST_RANGE
+from histAccum import HistAccumulator
+from filterBank import FilterBank, parseSpec, specName
+from cache import ImageCache
+from spectrum import spectrumStats
+from cooccurrence import imageCooccurrence, miRecord, JointAccumulator
+
+
+IMG_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+def listImages(source):
+    """
+    Expand a directory or a glob pattern into a sorted list of image files
+    :param source: str
+    :return: list of str
+    """
+    if os.path.isdir(source):
+        files = [os.path.join(source, f) for f in os.listdir(source)]
+        files = [f for f in files if f.lower().endswith(IMG_EXTS)]
+    else:
+        files = glob.glob(source)
+    return sorted(files)
+
+
+# One filter bank and cache per worker process, created on first use
+_banks = {}
+_caches = {}
+
+
+def processImage(imgFile, numDownsample = 2, types = ("adjDiff",), threads = 0, cacheDir = None, cacheBytes = 10 * 2**30,
+                 spectrumSize = None, cooccurrence = False):
+    """
+    Compute the statistics records of one image. Errors are recorded instead
+    of raised, so one broken file does not stop the whole run.
+    :param imgFile: str
+    :param types: sequence of filter types or (type, param) specs
+    :param threads: int, filter threads of the bank when there are several types
+    :param cacheDir: str or None, ImageCache directory for the preprocessed
+        image and filter response
+    :param cacheBytes: int, size limit of the cache
+    :param spectrumSize: int or None, if given add the 1/f slope of the
+        center crop of this size (see spectrum.spectrumStats) to the records
+    :param cooccurrence: bool, add the joint histograms of
+        cooccurrence.imageCooccurrence to the accumulators and their mutual
+        informations to the records
+    :return: (list of dict, one per type,
+              dict of HistAccumulator / JointAccumulator keyed by (name, level))
+    """
+    accums = {}
+    try:
+        cache = None
+        if cacheDir is not None:
+            if cacheDir not in _caches:
+                _caches[cacheDir] = ImageCache(cacheDir, cacheBytes)
+            cache = _caches[cacheDir]
+        img = cache.image(imgFile) if cache is not None else loadImage(imgFile)
+        if len(types) == 1:
+            type, param = parseSpec(types[0])
+            diffZ = cache.response(imgFile, type, param) if cache is not None else None
+            records = [imageStats(img, numDownsample, type, accums, diffZ, param, specName(types[0]))]
+        else:
+            key = (tuple(types), threads)
+            if key not in _banks:
+                _banks[key] = FilterBank(types, threads)
+            records = _banks[key].imageStats(img, numDownsample, accums)
+        extra = spectrumStats(img, spectrumSize) if spectrumSize else {}
+        if cooccurrence:
+            extra.update(miRecord(imageCooccurrence(img, numDownsample=numDownsample, accums=accums)))
+        for record in records:
+            record.update(extra)
+            record["error"] = None
+    except Exception as e:
+        records = [{"error": "{}: {}".format(e.__class__.__name__, e)}]
+        accums = {}
+    for record in records:
+        record["file"] = imgFile
+    return records, accums
+
+
+def runBatch(source, outFile = None, processes = None, chunksize = 4, numDownsample = 2, types = ("adjDiff",), threads = 0,
+             cacheDir = None, cacheBytes = 10 * 2**30, spectrumSize = None, cooccurrence = False, verbose = True):
+    """
+    Run processImage over every image of source on a process pool
+    :param source: str, directory or glob pattern
+    :param outFile: str or None, see writeTable
+    :param processes: int or None, defaults to the number of cores
+    :param chunksize: int, images handed to a worker at a time
+    :param types: sequence of filter types, see processImage
+    :param cacheDir: str or None, see processImage
+    :param spectrumSize: int or None, see processImage
+    :param cooccurrence: bool, see processImage
+    :return: (list of dict in the order of listImages(source) and types,
+              dict of corpus-level accumulators keyed by (name, level))
+    """
+    files = listImages(source)
+    if verbose:
+        print("Processing {} images".format(len(files)))
+
+    worker = partial(processImage, numDownsample=numDownsample, types=tuple(types), threads=threads,
+                     cacheDir=cacheDir, cacheBytes=cacheBytes, spectrumSize=spectrumSize, cooccurrence=cooccurrence)
+    pool = multiprocessing.Pool(processes)
+    try:
+        records, corpus = [], {}
+        for i, (imgRecords, accums) in enumerate(pool.imap(worker, files, chunksize)):
+            records.extend(imgRecords)
+            for key, accum in accums.items():
+                if key in corpus:
+                    corpus[key].merge(accum)
+                else:
+                    corpus[key] = accum
+            if verbose and imgRecords[0]["error"] is not None:
+                print("{}: {}".format(imgRecords[0]["file"], imgRecords[0]["error"]))
+            if verbose and (i + 1) % 1000 == 0:
+                print("{} / {}".format(i + 1, len(files)))
+    finally:
+        pool.close()
+        pool.join()
+
+    if outFile is not None:
+        writeTable(records, outFile)
+        writeTable(corpusTable(corpus), os.path.splitext(outFile)[0] + "_corpus.json")
+    return records, corpus
+
+
+def corpusTable(corpus):
+    """
+    Flatten the corpus accumulators into table records
+    :param corpus: dict of HistAccumulator / JointAccumulator keyed by (name, level)
+    :return: list of dict
+    """
+    records = []
+    keys = sorted(key for key in corpus if isinstance(corpus[key], HistAccumulator))
+    if keys:
+        edges = corpus[keys[0]].histogram()[1]
+        alpha, beta = fitGGD(np.array([corpus[key].counts for key in keys]), edges)
+        for i, (type, level) in enumerate(keys):
+            record = corpus[(type, level)].summary()
+            record["filter"], record["level"] = type, level
+            record["ggdAlpha"], record["ggdBeta"] = float(alpha[i]), float(beta[i])
+            records.append(record)
+
+    for name, level in sorted(key for key in corpus if isinstance(corpus[key], JointAccumulator)):
+        record = corpus[(name, level)].summary()
+        record["joint"], record["level"] = name, level
+        records.append(record)
+    return records
+
+
+def writeTable(records, outFile):
+    """
+    Write the result records. The format follows the extension:
+    .jsonl is one JSON record per line, .parquet needs pandas, anything else
+    is a single JSON list.
+    :param records: list of dict
+    :param outFile: str
+    :return: None
+    """
+    if outFile.endswith(".parquet"):
+        import pandas
+        pandas.DataFrame(records).to_parquet(outFile)
+    elif outFile.endswith(".jsonl"):
+        with open(outFile, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    else:
+        with open(outFile, "w") as f:
+            json.dump(records, f)
+
+
+def readTable(inFile):
+    """
+    Read a table written by writeTable
+    :param inFile: str
+    :return: list of dict
+    """
+    if inFile.endswith(".parquet"):
+        import pandas
+        return pandas.read_parquet(inFile).to_dict("records")
+    with open(inFile) as f:
+        if inFile.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def plotTable(records, outDir):
+    """
+    Optional post-processing: plot the corpus-level histograms and the
+    distribution of the fitted GGD parameters into outDir
+    :param records: list of dict
+    :param outDir: str
+    :return: None
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+    records = [r for r in records if r.get("error") is None]
+    if not records:
+        return
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+
+    for name in sorted(set(r["filter"] for r in records)):
+        plotFilter([r for r in records if r["filter"] == name], os.path.join(outDir, "batch_{}".format(name)))
+
+
+def plotFilter(records, prefix):
+    """
+    Plots of plotTable for the records of one filter
+    :param records: list of dict
+    :param prefix: str, path prefix of the png files
+    :return: None
+    """
+    from matplotlib import pyplot as plt
+
+    edges = np.linspace(HIST_RANGE[0], HIST_RANGE[1], HIST_BINS + 1)[:-1]
+    hist = np.mean([r["hist"] for r in records], axis=0)
+    lineType = ['b--', 'g-.', 'r:']
+    f, ax = plt.subplots(1, 2)
+    ax[0].plot(edges, hist, 'k-', label="mean histogram H(z)")
+    ax[1].plot(edges[hist != 0], np.log10(hist[hist != 0]), 'k-', label="mean log histogram logH(z)")
+    numLevels = min(len(r["histDS"]) for r in records)
+    for ind in range(numLevels):
+        histDS = np.mean([r["histDS"][ind] for r in records], axis=0)
+        ax[0].plot(edges, histDS, lineType[ind % 3], label="downsampling {}".format(ind + 1))
+        ax[1].plot(edges[histDS != 0], np.log10(histDS[histDS != 0]), lineType[ind % 3], label="downsampling {}".format(ind + 1))
+    ax[0].legend(), ax[1].legend()
+    f.savefig(prefix + "_histogram.png")
+    plt.close(f)
+
+    f, ax = plt.subplots(1, 3)
+    for a, key in zip(ax, ["ggdBeta", "kur", "gdKL"]):
+        values = np.array([r[key] for r in records], dtype=float)
+        a.hist(values[np.isfinite(values)], 50)
+        a.set_title(key)
+    f.savefig(prefix + "_params.png")
+    plt.close(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Problem1 statistics over many images")
+    parser.add_argument("source", help="directory or glob pattern of images")
+    parser.add_argument("-o", "--out", default="results.jsonl", help="output table (.json, .jsonl or .parquet)")
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=4)
+    parser.add_argument("--downsample", type=int, default=2, help="number of downsampling steps")
+    parser.add_argument("--filter", nargs="+", default=["adjDiff"], choices=["adjDiff", "laplacian", "sobelx", "sobely"])
+    parser.add_argument("--threads", type=int, default=0, help="filter threads per process for several filters")
+    parser.add_argument("--cache", default=None, help="directory of the preprocessing cache")
+    parser.add_argument("--cache-gb", type=float, default=10, help="size limit of the cache")
+    parser.add_argument("--spectrum", type=int, default=None, help="crop size for the 1/f spectral slope")
+    parser.add_argument("--cooccurrence", action="store_true", help="joint histograms of neighboring differences")
+    parser.add_argument("--plot", default=None, help="directory for the optional plots")
+    args = parser.parse_args()
+
+    records, corpus = runBatch(args.source, args.out, args.processes, args.chunksize, args.downsample, args.filter, args.threads,
+                               args.cache, int(args.cache_gb * 2**30), args.spectrum,
+                               args.cooccurrence)
+    if args.plot is not None:
+        plotTable(records, args.plot)
@@ -0,0 +1,169 @@
+# On-disk cache of the preprocessed images and filter responses of Problem1.
+#
+# Artifacts are keyed by the SHA-1 of the image file content plus the
+# preprocessing parameters, and stored as .npy files that are opened with
+# mmap_mode="r", so several runs and processes share them through the page
+# cache. Files are written to a temporary name and renamed into place, so
+# concurrent writers never expose a partial file. When the cache grows over
+# maxBytes the least recently used files are removed.
+#
+# Each process keeps a running total of the cache size, counted once at
+# startup and updated by its own writes and evictions. The directory is only
+# walked again once that total goes over maxBytes, which also picks up the
+# files other processes wrote meanwhile.
+
+
+from __future__ import print_function, division
+
+import hashlib
+import os
+
+import numpy as np
+
+from imgStats import loadImage, gradientFilter
+
+
+class ImageCache:
+    def __init__(self, cacheDir, maxBytes = 10 * 2**30):
+        """
+        Initialization
+        :param cacheDir: str, created if missing
+        :param maxBytes: int, total size above which files are evicted
+        """
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        if not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir)
+            except OSError:
+                # Another process created it first
+                if not os.path.isdir(cacheDir):
+                    raise
+        # Content hashes of files seen by this process, by (path, size, mtime)
+        self.hashes = {}
+        self.totalBytes = sum(size for mtime, size, path in self.files())
+
+    def fileHash(self, imgFile):
+        """
+        SHA-1 of the file content, remembered while the file is unchanged
+        :param imgFile: str
+        :return: str
+        """
+        st = os.stat(imgFile)
+        key = (os.path.abspath(imgFile), st.st_size, st.st_mtime)
+        if key not in self.hashes:
+            h = hashlib.sha1()
+            with open(imgFile, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            self.hashes[key] = h.hexdigest()
+        return self.hashes[key]
+
+    def path(self, digest, name):
+        return os.path.join(self.cacheDir, digest[:2], "{}_{}.npy".format(digest, name))
+
+    def get(self, digest, name, compute):
+        """
+        Memory-map the artifact, computing and storing it first if missing
+        :param digest: str, content hash
+        :param name: str, artifact name including its parameters
+        :param compute: function returning the ndarray to store
+        :return: read-only ndarray
+        """
+        path = self.path(digest, name)
+        if os.path.exists(path):
+            try:
+                os.utime(path, None)
+                return np.load(path, mmap_mode="r")
+            except (IOError, OSError, ValueError):
+                # Evicted or replaced by another process meanwhile
+                pass
+        self.put(path, compute())
+        return np.load(path, mmap_mode="r")
+
+    def put(self, path, arr):
+        """
+        Atomically write an artifact, then evict if the cache is too large
+        :param path: str
+        :param arr: ndarray
+        :return: None
+        """
+        dirName = os.path.dirname(path)
+        if not os.path.isdir(dirName):
+            try:
+                os.makedirs(dirName)
+            except OSError:
+                if not os.path.isdir(dirName):
+                    raise
+        tmp = "{}.tmp{}".format(path, os.getpid())
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(arr))
+        try:
+            # A file being replaced no longer counts
+            self.totalBytes -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.rename(tmp, path)
+        self.totalBytes += os.path.getsize(path)
+        if self.totalBytes > self.maxBytes:
+            self.evict(keep=path)
+
+    def files(self):
+        """
+        Every cached file
+        :return: list of (mtime, size, path)
+        """
+        files = []
+        for dirPath, dirNames, fileNames in os.walk(self.cacheDir):
+            for fileName in fileNames:
+                if not fileName.endswith(".npy"):
+                    continue
+                path = os.path.join(dirPath, fileName)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def evict(self, keep = None):
+        """
+        Remove least recently used files until the cache fits in maxBytes,
+        and recount the running total from the directory
+        :param keep: str or None, a path never removed (the one just written)
+        :return: int, bytes removed
+        """
+        files = self.files()
+        total = sum(size for mtime, size, path in files)
+        removed = 0
+        for mtime, size, path in sorted(files):
+            if total - removed <= self.maxBytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                removed += size
+            except OSError:
+                pass
+        self.totalBytes = total - removed
+        return removed
+
+    def image(self, imgFile):
+        """
+        The greyscale image re-scaled to [0, 31] as Problem1 loads it
+        :param imgFile: str
+        :return: read-only uint8 ndarray
+        """
+        return self.get(self.fileHash(imgFile), "img8", lambda: loadImage(imgFile))
+
+    def response(self, imgFile, type = "adjDiff", param = 1):
+        """
+        gradientFilter response of the preprocessed image
+        :param imgFile: str
+        :param type: str, see gradientFilter
+        :param param: int
+        :return: read-only int16 ndarray
+        """
+        return self.get(self.fileHash(imgFile), "img8_{}{}".format(type, param),
+                        lambda: gradientFilter(self.image(imgFile).astype(np.int16), type, param))
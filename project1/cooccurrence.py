@@ -0,0 +1,165 @@
+# Joint (co-occurrence) histograms of neighboring gradient responses.
+#
+# Problem1 only looks at the marginal of the adjacent differences. Here pairs
+# of integer responses (horizontal vs vertical difference at a pixel, or a
+# response vs the same response at an offset) are counted into a fixed
+# (bins x bins) table with one bincount over the combined index a * bins + b.
+# The tables are mergeable like HistAccumulator, so they can be summed over
+# images, pyramid levels and worker processes, and summarized by their
+# mutual information.
+
+
+from __future__ import print_function, division
+
+import numpy as np
+
+from imgStats import gradientFilter, HIST_RANGE
+from pyramid import pyramid
+
+
+DEFAULT_OFFSETS = [(0, 1), (1, 0), (1, 1), (0, 2)]
+
+
+class JointAccumulator:
+    def __init__(self, lo = HIST_RANGE[0], hi = HIST_RANGE[1]):
+        """
+        Initialization
+        :param lo: int, smallest value with its own bin
+        :param hi: int, largest value with its own bin
+        """
+        self.lo, self.hi = lo, hi
+        self.bins = hi - lo + 1
+        self.counts = np.zeros((self.bins, self.bins), dtype=np.int64)
+        # Pairs with at least one value outside [lo, hi]
+        self.outside = 0
+
+    def add(self, a, b):
+        """
+        Count the pairs (a[i], b[i])
+        :param a: integer ndarray
+        :param b: integer ndarray of the same shape
+        :return: self
+        """
+        a = np.asarray(a).ravel().astype(np.intp) - self.lo
+        b = np.asarray(b).ravel().astype(np.intp) - self.lo
+        inside = (a >= 0) & (a < self.bins) & (b >= 0) & (b < self.bins)
+        idx = a * self.bins + b
+        if not inside.all():
+            self.outside += int(inside.size - inside.sum())
+            idx = idx[inside]
+        self.counts += np.bincount(idx, minlength=self.bins**2).reshape(self.bins, self.bins)
+        return self
+
+    def merge(self, other):
+        """
+        Merge another accumulator with the same bins into this one
+        :param other: JointAccumulator
+        :return: self
+        """
+        if (other.lo, other.hi) != (self.lo, self.hi):
+            raise ValueError("Cannot merge accumulators with different bins")
+        self.counts += other.counts
+        self.outside += other.outside
+        return self
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    def mutualInformation(self):
+        """
+        Mutual information of the two values in bits
+        :return: float
+        """
+        total = self.counts.sum()
+        if total == 0:
+            return np.nan
+        p = self.counts / total
+        px, py = p.sum(axis=1), p.sum(axis=0)
+        nz = p > 0
+        return float(np.sum(p[nz] * np.log2(p[nz] / np.outer(px, py)[nz])))
+
+    def entropy(self):
+        """
+        Joint entropy in bits
+        :return: float
+        """
+        total = self.counts.sum()
+        if total == 0:
+            return np.nan
+        p = self.counts[self.counts > 0] / total
+        return float(-np.sum(p * np.log2(p)))
+
+    def summary(self):
+        """
+        :return: dict of plain python values
+        """
+        return {
+            "n": self.n, "outside": self.outside,
+            "mi": self.mutualInformation(), "entropy": self.entropy(),
+            "counts": self.counts.tolist(),
+        }
+
+
+def offsetPairs(z, dy, dx):
+    """
+    Aligned views of z and z shifted by (dy, dx), over the pixels where both exist
+    :param z: 2-D ndarray
+    :param dy: int
+    :param dx: int
+    :return: (a, b) with b[i, j] the neighbor at offset (dy, dx) of a[i, j]
+    """
+    rows, cols = z.shape
+    a = z[max(-dy, 0):rows - max(dy, 0), max(-dx, 0):cols - max(dx, 0)]
+    b = z[max(dy, 0):rows + min(dy, 0), max(dx, 0):cols + min(dx, 0)]
+    return a, b
+
+
+def hvPairs(img):
+    """
+    Horizontal and vertical adjacent differences at the same pixels
+    :param img: 2-D integer ndarray
+    :return: (h, v) int16 ndarrays of shape (rows-1, cols-1)
+    """
+    img = img.astype(np.int16)
+    h = img[1:, 1:] - img[1:, :-1]
+    v = img[1:, 1:] - img[:-1, 1:]
+    return h, v
+
+
+def imageCooccurrence(img, offsets = DEFAULT_OFFSETS, numDownsample = 2, type = "adjDiff", accums = None):
+    """
+    Joint histograms of one image and its pyramid levels: "hv" pairs the
+    horizontal and vertical differences, "<type>@dy,dx" pairs the filter
+    response with itself at every offset
+    :param img: 2-D ndarray, intensity in [0, 31]
+    :param offsets: list of (dy, dx)
+    :param numDownsample: int
+    :param type: str, see gradientFilter
+    :param accums: dict or None, the tables are also merged into accums[(name, level)]
+    :return: dict of JointAccumulator keyed by (name, level)
+    """
+    joint = {}
+    levels = [img] + list(pyramid(img, numDownsample))
+    for level, levelImg in enumerate(levels):
+        joint[("hv", level)] = JointAccumulator().add(*hvPairs(levelImg))
+        z = gradientFilter(levelImg.astype(np.int16), type)
+        for dy, dx in offsets:
+            joint[("{}@{},{}".format(type, dy, dx), level)] = JointAccumulator().add(*offsetPairs(z, dy, dx))
+
+    if accums is not None:
+        for key, accum in joint.items():
+            accums.setdefault(key, JointAccumulator()).merge(accum)
+    return joint
+
+
+def miRecord(joint):
+    """
+    Mutual information summary of imageCooccurrence for the batch records
+    :param joint: dict of JointAccumulator keyed by (name, level)
+    :return: dict mapping "mi_<name>" to the list of mutual informations per level
+    """
+    record = {}
+    for (name, level), accum in sorted(joint.items()):
+        record.setdefault("mi_" + name, []).append(accum.mutualInformation())
+    return record
@@ -0,0 +1,131 @@
+# Evaluate several gradient filters of Problem1 on an image in one pass.
+#
+# The image is cast to int16 once, every filter writes into its
+# slice of one preallocated (F, rows, cols) response buffer, and the filters
+# run on a thread pool (OpenCV releases the GIL while filtering). The buffers
+# are kept between images of the same size.
+
+
+from __future__ import print_function, division
+
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from imgStats import gradientFilter, gradientPyramid, statsRecord, HIST_RANGE
+from histAccum import HistAccumulator
+
+
+DEFAULT_SPECS = [("adjDiff", 1), ("laplacian", 1), ("sobelx", 1), ("sobely", 1)]
+
+
+def parseSpec(spec):
+    """
+    :param spec: str type name or (type, param) tuple
+    :return: (type, param)
+    """
+    if isinstance(spec, str):
+        return spec, 1
+    type, param = spec
+    return type, param
+
+
+def specName(spec):
+    """
+    Name of a filter spec used as key in records and accumulators,
+    "laplacian" for param 1 and "laplacian3" for param 3
+    :param spec: str or (type, param)
+    :return: str
+    """
+    type, param = parseSpec(spec)
+    return type if param == 1 else "{}{}".format(type, param)
+
+
+class FilterBank:
+    def __init__(self, specs = DEFAULT_SPECS, threads = None):
+        """
+        Initialization
+        :param specs: list of str or (type, param), see gradientFilter
+        :param threads: int or None, number of filter threads, defaults to
+            one per filter; 0 runs the filters in the calling thread
+        """
+        self.specs = [parseSpec(spec) for spec in specs]
+        self.names = [specName(spec) for spec in self.specs]
+        if threads is None:
+            threads = len(self.specs)
+        self.pool = ThreadPool(threads) if threads > 0 else None
+        # (src, out) buffers keyed by image shape, so the levels of a pyramid
+        # and images of the same size reuse them
+        self.buffers = {}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def _map(self, func, items):
+        if self.pool is None:
+            return [func(item) for item in items]
+        return self.pool.map(func, items)
+
+    def _prepare(self, img):
+        """
+        Cast the image into the shared int16 buffer of its shape
+        :return: (src, out) buffers
+        """
+        shape = img.shape
+        if shape not in self.buffers:
+            if len(self.buffers) >= 8:
+                self.buffers.clear()
+            self.buffers[shape] = (np.empty(shape, dtype=np.int16),
+                                   np.empty((len(self.specs),) + shape, dtype=np.int16))
+        src, out = self.buffers[shape]
+        src[...] = img
+        return src, out
+
+    def responses(self, img):
+        """
+        All filter responses of one image
+        :param img: 2-D ndarray, intensity in [0, 31]
+        :return: int16 ndarray of shape (F, rows, cols). It is the bank's own
+            buffer and is overwritten by the next call.
+        """
+        src, out = self._prepare(img)
+        self._map(lambda i: gradientFilter(src, self.specs[i][0], self.specs[i][1], out[i]),
+                  range(len(self.specs)))
+        return out
+
+    def stats(self, img):
+        """
+        Histogram and moments of every filter response, without keeping the
+        responses around
+        :param img: 2-D ndarray, intensity in [0, 31]
+        :return: list of HistAccumulator, one per filter
+        """
+        src, out = self._prepare(img)
+
+        def work(i):
+            resp = gradientFilter(src, self.specs[i][0], self.specs[i][1], out[i])
+            return HistAccumulator(*HIST_RANGE).add(resp)
+
+        return self._map(work, range(len(self.specs)))
+
+    def imageStats(self, img, numDownsample = 2, accums = None):
+        """
+        The imgStats.imageStats records of every filter. The image level is
+        filtered in one pass; the downsampled levels follow each filter's own
+        response (see imgStats.gradientPyramid), one filter per thread
+        :param img: 2-D ndarray, intensity in [0, 31]
+        :param numDownsample: int
+        :param accums: dict or None, see imgStats.imageStats; keys use specName
+        :return: list of dict, one per filter
+        """
+        def work(i):
+            return [HistAccumulator(*HIST_RANGE).add(resp) for resp in
+                    gradientPyramid(img, numDownsample, self.specs[i][0], self.specs[i][1])]
+
+        chains = self._map(work, range(len(self.specs)))
+        levelAccums = [self.stats(img)] + [list(level) for level in zip(*chains)]
+        return [statsRecord([a[i] for a in levelAccums], name, img.shape, accums)
+                for i, name in enumerate(self.names)]
@@ -0,0 +1,148 @@
+# Batched estimation of the generalized Gaussian distribution
+#
+#   GGD(x; alpha, beta) = beta / (2 alpha Gamma(1/beta)) exp(-(|x| / alpha)^beta)
+#
+# for many histograms (or sample moments) at once. beta starts from moment
+# matching, i.e. inverting the kurtosis
+#
+#   Gamma(5/beta) Gamma(1/beta) / Gamma(3/beta)^2
+#
+# on a precomputed grid, and is then refined by a few Newton steps on the
+# profile log-likelihood, where alpha has the closed form
+#
+#   alpha^beta = beta * E|x|^beta
+#
+# Histogram samples are spread uniformly over their bin, otherwise the spike
+# of integer data at 0 drives the likelihood to beta -> 0. Everything is
+# vectorized over the batch, there is no per-histogram python.
+
+
+from __future__ import print_function, division
+
+import numpy as np
+from scipy.special import gammaln, psi, polygamma
+
+
+BETA_MIN, BETA_MAX = 0.05, 10.0
+
+# Kurtosis of the GGD on a log-spaced grid of beta, decreasing in beta
+_betaGrid = np.logspace(np.log10(BETA_MIN), np.log10(BETA_MAX), 4096)
+_logKurGrid = gammaln(5 / _betaGrid) + gammaln(1 / _betaGrid) - 2 * gammaln(3 / _betaGrid)
+
+
+def ggdKurtosis(beta):
+    """
+    Kurtosis (not excess) of the GGD
+    :param beta: float or ndarray
+    :return: float or ndarray
+    """
+    beta = np.asarray(beta, dtype=np.float64)
+    return np.exp(gammaln(5 / beta) + gammaln(1 / beta) - 2 * gammaln(3 / beta))
+
+
+def betaFromKurtosis(kur):
+    """
+    Invert ggdKurtosis by interpolation on the precomputed grid
+    :param kur: ndarray, excess kurtosis (as scipy.stats.kurtosis)
+    :return: ndarray, beta clipped to [BETA_MIN, BETA_MAX]
+    """
+    logKur = np.log(np.maximum(np.asarray(kur, dtype=np.float64) + 3, 1.0 + 1e-12))
+    # np.interp needs increasing x
+    return np.interp(logKur, _logKurGrid[::-1], _betaGrid[::-1])
+
+
+def alphaFromVar(var, beta):
+    """
+    Scale parameter giving the GGD the variance var
+    :param var: ndarray
+    :param beta: ndarray
+    :return: ndarray
+    """
+    return np.sqrt(var * np.exp(gammaln(1 / beta) - gammaln(3 / beta)))
+
+
+def fitMoments(var, kur):
+    """
+    Moment matching for a batch of zero-mean samples
+    :param var: ndarray, second moments
+    :param kur: ndarray, excess kurtosis
+    :return: (alpha, beta) ndarrays
+    """
+    beta = betaFromKurtosis(kur)
+    return alphaFromVar(np.asarray(var, dtype=np.float64), beta), beta
+
+
+def _absMoments(lo, hi, beta):
+    """
+    E|x|^beta and its first two derivatives in beta, for x uniform on every
+    bin [lo, hi]. Uses the odd antiderivative G(t) = sign(t) |t|^(beta+1) / (beta+1).
+    :param lo: ndarray of shape (K,)
+    :param hi: ndarray of shape (K,)
+    :param beta: ndarray of shape (B,)
+    :return: three ndarrays of shape (B, K)
+    """
+    b1 = (beta + 1)[:, None]
+    G = []
+    for t in (lo, hi):
+        absT = np.abs(t)
+        logT = np.log(np.where(absT > 0, absT, 1))
+        p = np.sign(t) * absT ** b1
+        G.append((p / b1,
+                  p * (logT / b1 - 1 / b1**2),
+                  p * (logT**2 / b1 - 2 * logT / b1**2 + 2 / b1**3)))
+    width = hi - lo
+    return [(G[1][i] - G[0][i]) / width for i in range(3)]
+
+
+def fitHistograms(counts, values, width = 1.0, newtonSteps = 5):
+    """
+    Fit (alpha, beta) to a batch of histograms sharing the same bins. The
+    samples of a bin are taken as uniform over it, which keeps the fit well
+    defined for quantized data with a large mass at 0.
+    :param counts: ndarray of shape (B, K) or (K,), counts or densities
+    :param values: ndarray of shape (K,), the centers of the bins
+    :param width: float, width of the bins (1 for integer data)
+    :param newtonSteps: int, MLE refinement steps after moment matching
+    :return: (alpha, beta, ok) ndarrays of shape (B,) or scalars for 1-D
+        counts; ok is False where the histogram is empty or degenerate
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    squeeze = counts.ndim == 1
+    w = np.atleast_2d(counts)
+    total = w.sum(axis=1)
+    ok = total > 0
+    w = w / np.where(ok, total, 1)[:, None]
+
+    values = np.asarray(values, dtype=np.float64)
+    lo, hi = values - width / 2, values + width / 2
+
+    # Moment matching about zero
+    m2 = np.sum(w * _absMoments(lo, hi, np.array([2.0]))[0], axis=1)
+    m4 = np.sum(w * _absMoments(lo, hi, np.array([4.0]))[0], axis=1)
+    ok &= m2 > 0
+    m2safe = np.where(ok, m2, 1)
+    beta = betaFromKurtosis(m4 / m2safe**2 - 3)
+
+    # Newton on the profile likelihood equation g(beta) = 0 (Do & Vetterli).
+    # Degenerate rows produce nan here and are masked out by ok.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for step in range(newtonSteps):
+            F0, F1, F2 = _absMoments(lo, hi, beta)
+            s0 = np.sum(w * F0, axis=1)
+            s1 = np.sum(w * F1, axis=1) / s0
+            s2 = np.sum(w * F2, axis=1) / s0
+            logS = np.log(beta * s0)
+            g = 1 + psi(1 / beta) / beta - s1 + logS / beta
+            dg = -psi(1 / beta) / beta**2 - polygamma(1, 1 / beta) / beta**3 + 1 / beta**2 \
+                - s2 + s1**2 + s1 / beta - logS / beta**2
+            newBeta = beta - g / dg
+            # Only take the step where it is well defined
+            good = np.isfinite(newBeta) & (dg < 0)
+            beta = np.where(good, np.clip(newBeta, BETA_MIN, BETA_MAX), beta)
+
+        alpha = (beta * np.sum(w * _absMoments(lo, hi, beta)[0], axis=1)) ** (1 / beta)
+    ok &= np.isfinite(alpha) & (alpha > 0)
+    alpha, beta = np.where(ok, alpha, np.nan), np.where(ok, beta, np.nan)
+    if squeeze:
+        return alpha[0], beta[0], bool(ok[0])
+    return alpha, beta, ok
@@ -0,0 +1,142 @@
+# Streaming histogram / moment accumulator for integer filter responses.
+#
+# The responses of Problem1 are small integers, so one np.bincount per image
+# gives both the histogram and the exact moments of that image. Accumulators
+# only hold O(bins) numbers and can be merged, so a corpus (or the outputs of
+# several worker processes) is summarized in one pass without keeping any
+# image around.
+
+
+from __future__ import print_function, division
+
+import numpy as np
+
+
+class HistAccumulator:
+    def __init__(self, lo = -31, hi = 31):
+        """
+        Initialization
+        :param lo: int, smallest value with its own bin
+        :param hi: int, largest value with its own bin
+        """
+        self.lo, self.hi = lo, hi
+        self.counts = np.zeros(hi - lo + 1, dtype=np.int64)
+        self.underflow, self.overflow = 0, 0
+        # Running count, mean and central moment sums of all values added,
+        # including the ones outside [lo, hi]
+        self.n, self.mu, self.M2, self.M3, self.M4 = 0, 0.0, 0.0, 0.0, 0.0
+
+    def add(self, z):
+        """
+        Add the values of an integer array
+        :param z: integer ndarray
+        :return: self
+        """
+        z = np.asarray(z).ravel()
+        if z.size == 0:
+            return self
+        zmin = int(z.min())
+        c = np.bincount((z - zmin).astype(np.intp))
+        v = np.arange(zmin, zmin + len(c), dtype=np.float64)
+
+        # Histogram, values outside [lo, hi] only go to the under/overflow
+        first, last = max(self.lo, zmin), min(self.hi, zmin + len(c) - 1)
+        if first <= last:
+            self.counts[first - self.lo:last - self.lo + 1] += c[first - zmin:last - zmin + 1]
+        self.underflow += int(c[:max(self.lo - zmin, 0)].sum())
+        self.overflow += int(c[max(self.hi + 1 - zmin, 0):].sum())
+
+        # Exact moments of this batch, then merge them into the running ones
+        n = int(c.sum())
+        mu = np.dot(c, v) / n
+        d = v - mu
+        self._mergeMoments(n, mu, np.dot(c, d**2), np.dot(c, d**3), np.dot(c, d**4))
+        return self
+
+    def merge(self, other):
+        """
+        Merge another accumulator with the same bins into this one
+        :param other: HistAccumulator
+        :return: self
+        """
+        if (other.lo, other.hi) != (self.lo, self.hi):
+            raise ValueError("Cannot merge accumulators with different bins")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self._mergeMoments(other.n, other.mu, other.M2, other.M3, other.M4)
+        return self
+
+    def _mergeMoments(self, nb, mub, M2b, M3b, M4b):
+        """
+        Pairwise update of the central moment sums (Chan et al. / Pebay)
+        """
+        na, mua, M2a, M3a, M4a = self.n, self.mu, self.M2, self.M3, self.M4
+        if nb == 0:
+            return
+        if na == 0:
+            self.n, self.mu, self.M2, self.M3, self.M4 = nb, mub, M2b, M3b, M4b
+            return
+        n = na + nb
+        delta = mub - mua
+        self.n = n
+        self.mu = mua + delta * nb / n
+        self.M2 = M2a + M2b + delta**2 * na * nb / n
+        self.M3 = M3a + M3b + delta**3 * na * nb * (na - nb) / n**2 \
+            + 3 * delta * (na * M2b - nb * M2a) / n
+        self.M4 = M4a + M4b + delta**4 * na * nb * (na**2 - na * nb + nb**2) / n**3 \
+            + 6 * delta**2 * (na**2 * M2b + nb**2 * M2a) / n**2 \
+            + 4 * delta * (na * M3b - nb * M3a) / n
+
+    @property
+    def mean(self):
+        return self.mu if self.n else np.nan
+
+    @property
+    def var(self):
+        """
+        Population variance, same as np.var
+        """
+        return self.M2 / self.n if self.n else np.nan
+
+    @property
+    def kurtosis(self):
+        """
+        Excess kurtosis, same as scipy.stats.kurtosis with the default arguments
+        """
+        if self.M2 == 0:
+            return np.nan
+        return self.n * self.M4 / self.M2**2 - 3
+
+    @property
+    def skewness(self):
+        if self.M2 == 0:
+            return np.nan
+        return np.sqrt(self.n) * self.M3 / self.M2**1.5
+
+    def histogram(self, density = True):
+        """
+        The histogram of the values in [lo, hi] with one bin per integer. The
+        bins have the same edges and content as np.histogram(z, hi-lo+1, [lo, hi]),
+        which is what Problem1.q1 plots.
+        :param density: bool
+        :return: (histr, edges)
+        """
+        edges = np.linspace(self.lo, self.hi, len(self.counts) + 1)
+        if not density:
+            return self.counts.copy(), edges
+        total = self.counts.sum()
+        if total == 0:
+            return np.zeros(len(self.counts)), edges
+        return self.counts / (total * np.diff(edges)), edges
+
+    def summary(self):
+        """
+        :return: dict of plain python values
+        """
+        return {
+            "n": self.n, "mean": float(self.mean), "var": float(self.var),
+            "skew": float(self.skewness), "kur": float(self.kurtosis),
+            "underflow": self.underflow, "overflow": self.overflow,
+            "counts": self.counts.tolist(),
+        }
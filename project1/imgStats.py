@@ -0,0 +1,187 @@
+# Headless versions of the Problem1 computations, shared by Project1.py and
+# the batch engine in batch.py. Nothing in here opens a window or writes a file.
+
+
+from __future__ import print_function, division
+
+import cv2
+import numpy as np
+from scipy.special import gamma
+from math import sqrt
+
+from pyramid import responsePyramid
+from histAccum import HistAccumulator
+from ggdFit import fitHistograms
+
+
+# The intensity is re-scaled to [0, 31], so adjacent differences are in [-31, 31]
+HIST_BINS = 63
+HIST_RANGE = (-31, 31)
+
+
+def loadImage(imgFile):
+    """
+    Load image in greyscale and re-scale the intensity to [0, 31]
+    :param imgFile: str
+    :return: uint8 ndarray
+    """
+    img = cv2.imread(imgFile, 0)
+    if img is None:
+        raise IOError("Cannot read image {}".format(imgFile))
+    return img // 8
+
+
+def gradientFilter(img, type = "adjDiff", param = 1, dst = None):
+    """
+    Use different type of gradient filter to convolve the image
+    :param img: ndarray
+    :param type: str
+    :param param: tuple.
+    :param dst: ndarray or None, preallocated output of the same shape and dtype as img
+    :return: int16 ndarray
+    """
+    if type == "adjDiff":
+        newImg = cv2.filter2D(img, -1, np.array([-1.0, 1.0]), dst=dst)
+        newImg[0,:] = newImg[1,:]
+        return newImg
+    elif type == "laplacian":
+        return cv2.Laplacian(img, -1, dst=dst, ksize=param)
+    elif type == "sobelx":
+        return cv2.Sobel(img, -1, 1, 0, dst=dst, ksize=param)
+    elif type == "sobely":
+        return cv2.Sobel(img, -1, 0, 1, dst=dst, ksize=param)
+    else:
+        raise ValueError("Wrong type name: {}".format(type))
+
+
+def GGD(x, alpha, beta):
+    """
+    Generalized Gaussian Distribution
+    :param x: ndarray
+    :param alpha: float
+    :param beta: float
+    :return: ndarray
+    """
+    return beta/(2 * alpha * gamma(1/beta)) * np.exp(-(np.abs(x) / alpha) ** beta)
+
+
+def GD(x, mean, stdDev):
+    return 1/sqrt(2 * np.pi) / stdDev * np.exp(-((x - mean)/stdDev) ** 2)
+
+
+def gradientPyramid(img, levels, type = "adjDiff", param = 1, kind = "mean"):
+    """
+    Gradient filter response of every downsampled level, ready for histogram().
+    As in Problem1.q5, each level downsamples the response of the previous
+    one, not the image.
+    :param img: 2-D ndarray, intensity in [0, 31]
+    :param levels: int
+    :param type: str, see gradientFilter
+    :param param: int, kernel size for laplacian / sobel
+    :param kind: str, see pyramid.pyramid
+    :return: generator of int16 ndarray
+    """
+    respond = lambda level: gradientFilter(level.astype(np.int16), type, param)
+    return responsePyramid(img, levels, respond, kind)
+
+
+def histogram(diffZ):
+    """
+    Normalized histogram of the filter response, same bins as Problem1.q1
+    :param diffZ: integer ndarray
+    :return: (histr, edges)
+    """
+    return HistAccumulator(*HIST_RANGE).add(diffZ).histogram()
+
+
+def moments(diffZ):
+    """
+    :param diffZ: integer ndarray
+    :return: (mean, var, kurtosis)
+    """
+    accum = HistAccumulator(*HIST_RANGE).add(diffZ)
+    return accum.mean, accum.var, accum.kurtosis
+
+
+def fitGGD(histr, edges):
+    """
+    Fit the GGD to a histogram of integer values (see ggdFit.fitHistograms),
+    replaces the curve_fit of the original Problem1.q3
+    :param histr: ndarray of shape (K,) or (B, K) for a batch of histograms
+    :param edges: ndarray, one integer per bin as in histogram()
+    :return: (alpha, beta), nan where the fit is not possible
+    """
+    # Every bin holds exactly one integer, the ceiling of its left edge
+    alpha, beta, ok = fitHistograms(histr, np.ceil(edges[:-1]))
+    return alpha, beta
+
+
+def gaussianKL(histr, edges, mean, var):
+    """
+    KL divergence from the histogram to the Gaussian with the same mean and
+    variance, the number behind the Problem1.q4 plots
+    :param histr: ndarray
+    :param edges: ndarray
+    :param mean: float
+    :param var: float
+    :return: float
+    """
+    if var <= 0:
+        return np.nan
+    p = histr * np.diff(edges)
+    q = GD(edges[:-1], mean, sqrt(var))
+    q = q / q.sum()
+    nz = p > 0
+    return float(np.sum(p[nz] * (np.log(p[nz]) - np.log(np.maximum(q[nz], 1e-300)))))
+
+
+def imageStats(img, numDownsample = 2, type = "adjDiff", accums = None, diffZ = None, param = 1, name = None):
+    """
+    Run the q1-q5 computations of Problem1 on one image without any display
+    :param img: ndarray, intensity in [0, 31]
+    :param numDownsample: int
+    :param type: str, gradient filter type
+    :param accums: dict or None. If given, the histogram of every level is
+        also merged into accums[(name, level)], level 0 being the image itself
+    :param diffZ: ndarray or None, the gradientFilter response of img if it
+        is already known (e.g. from cache.ImageCache)
+    :param param: int, kernel size for laplacian / sobel
+    :param name: str or None, filter name of the record and accumulators,
+        defaults to type (see filterBank.specName)
+    :return: dict of plain python values
+    """
+    if diffZ is None:
+        diffZ = gradientFilter(img.astype(np.int16), type, param)
+    levelAccums = [HistAccumulator(*HIST_RANGE).add(diffZ)]
+    for DSdiffZ in gradientPyramid(img, numDownsample, type, param):
+        levelAccums.append(HistAccumulator(*HIST_RANGE).add(DSdiffZ))
+    return statsRecord(levelAccums, type if name is None else name, img.shape, accums)
+
+
+def statsRecord(levelAccums, name, shape, accums = None):
+    """
+    Turn the histograms of the pyramid levels of one filter response into the
+    record of imageStats
+    :param levelAccums: list of HistAccumulator, level 0 first
+    :param name: str, filter name
+    :param shape: (rows, cols) of the image
+    :param accums: dict or None, see imageStats
+    :return: dict of plain python values
+    """
+    accum = levelAccums[0]
+    histr, edges = accum.histogram()
+    mean, var, kur = accum.mean, accum.var, accum.kurtosis
+    alpha, beta = fitGGD(histr, edges)
+    histDS = [a.histogram()[0].tolist() for a in levelAccums[1:]]
+
+    if accums is not None:
+        for level, a in enumerate(levelAccums):
+            accums.setdefault((name, level), HistAccumulator(*HIST_RANGE)).merge(a)
+
+    return {
+        "rows": shape[0], "cols": shape[1], "filter": name,
+        "mean": float(mean), "var": float(var), "kur": float(kur),
+        "ggdAlpha": float(alpha), "ggdBeta": float(beta),
+        "gdKL": gaussianKL(histr, edges, mean, var),
+        "hist": histr.tolist(), "histDS": histDS,
+    }
@@ -0,0 +1,136 @@
+# Monte Carlo baseline of the Problem1 statistics on uniform noise images.
+#
+# Problem1.q6 compares a natural image with one uniform noise image. Here K
+# noise replicates are generated as one (K, rows, cols) array per chunk, all
+# replicates of a chunk are filtered with a single gradientFilter call and
+# histogrammed with a single bincount, and the chunks can run on a process
+# pool with their own seeds. The result is the mean and a confidence band of
+# every statistic over the replicates.
+
+
+from __future__ import print_function, division
+
+import multiprocessing
+
+import numpy as np
+
+from imgStats import gradientFilter, HIST_RANGE
+from pyramid import responsePyramid
+from tiling import filterHalo
+
+
+def batchGradient(imgs, type = "adjDiff", param = 1):
+    """
+    gradientFilter of every image of a batch with one OpenCV call. The images
+    are stacked vertically, each padded with the rows the border handling of
+    OpenCV (reflect 101) would use, so no filter reads across two images.
+    :param imgs: ndarray of shape (K, rows, cols)
+    :param type: str, see gradientFilter
+    :param param: int
+    :return: int16 ndarray of shape (K, rows, cols)
+    """
+    K, rows, cols = imgs.shape
+    halo = filterHalo(type, param)
+    padded = np.pad(imgs.astype(np.int16), ((0, 0), (halo, halo), (0, 0)), mode="reflect")
+    out = gradientFilter(padded.reshape(K * (rows + 2 * halo), cols), type, param)
+    out = out.reshape(K, rows + 2 * halo, cols)[:, halo:halo + rows]
+    if type == "adjDiff":
+        out[:, 0, :] = out[:, 1, :]
+    return out
+
+
+def batchStats(diffs, lo = HIST_RANGE[0], hi = HIST_RANGE[1]):
+    """
+    Histogram and moments of every replicate with one bincount
+    :param diffs: integer ndarray of shape (K, ...)
+    :param lo: int, see HistAccumulator
+    :param hi: int
+    :return: dict of hist (K, hi-lo+1) densities as HistAccumulator.histogram,
+        mean, var, kur (K,)
+    """
+    K = diffs.shape[0]
+    z = diffs.reshape(K, -1)
+    zmin, zmax = int(z.min()), int(z.max())
+    width = zmax - zmin + 1
+    idx = (z - zmin).astype(np.intp) + (np.arange(K, dtype=np.intp) * width)[:, None]
+    counts = np.bincount(idx.ravel(), minlength=K * width).reshape(K, width).astype(np.float64)
+
+    v = np.arange(zmin, zmax + 1, dtype=np.float64)
+    n = counts.sum(axis=1)
+    mean = counts.dot(v) / n
+    d = v[None, :] - mean[:, None]
+    var = np.sum(counts * d**2, axis=1) / n
+    m4 = np.sum(counts * d**4, axis=1) / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kur = m4 / var**2 - 3
+
+    hist = np.zeros((K, hi - lo + 1))
+    first, last = max(lo, zmin), min(hi, zmax)
+    if first <= last:
+        hist[:, first - lo:last - lo + 1] = counts[:, first - zmin:last - zmin + 1]
+    binWidth = (hi - lo) / (hi - lo + 1)
+    total = hist.sum(axis=1, keepdims=True)
+    hist = hist / np.where(total > 0, total * binWidth, 1)
+    return {"hist": hist, "mean": mean, "var": var, "kur": kur}
+
+
+def noiseChunk(args):
+    """
+    Statistics of one seeded chunk of noise replicates, for Pool.map
+    :param args: (seed, chunk index, K, rows, cols, numDownsample, type, param)
+    :return: dict of ndarrays of shape (K, levels, ...)
+    """
+    seed, ind, K, rows, cols, numDownsample, type, param = args
+    rng = np.random.RandomState([seed, ind])
+    imgs = rng.randint(0, 32, size=(K, rows, cols)).astype(np.uint8)
+
+    levels = [batchStats(batchGradient(imgs, type, param))]
+    respond = lambda level: batchGradient(level, type, param)
+    for resp in responsePyramid(imgs, numDownsample, respond):
+        levels.append(batchStats(resp))
+    return dict((key, np.stack([l[key] for l in levels], axis=1)) for key in levels[0])
+
+
+def noiseBaseline(rows, cols, K = 100, chunk = 10, processes = 1, seed = 0,
+                  numDownsample = 2, type = "adjDiff", param = 1, confidence = 0.95):
+    """
+    Generate K uniform [0, 31] noise images of the given size and summarize
+    the Problem1 statistics over them
+    :param rows: int
+    :param cols: int
+    :param K: int, number of replicates
+    :param chunk: int, replicates generated and filtered together
+    :param processes: int, chunks run on a process pool when > 1
+    :param seed: int, the result only depends on seed and chunk
+    :param numDownsample: int
+    :param type: str, gradient filter type
+    :param param: int
+    :param confidence: float, coverage of the percentile band
+    :return: dict. For every statistic (hist, mean, var, kur) a dict with the
+        replicates ("samples", shape (K, levels, ...)), their "mean",
+        standard error "sem" and percentile band "lo" / "hi"; plus "edges".
+    """
+    jobs = [(seed, i, min(chunk, K - start), rows, cols, numDownsample, type, param)
+            for i, start in enumerate(range(0, K, chunk))]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(noiseChunk, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [noiseChunk(job) for job in jobs]
+
+    tail = 100 * (1 - confidence) / 2
+    baseline = {"edges": np.linspace(HIST_RANGE[0], HIST_RANGE[1], HIST_RANGE[1] - HIST_RANGE[0] + 2)}
+    for key in results[0]:
+        samples = np.concatenate([r[key] for r in results])
+        baseline[key] = {
+            "samples": samples,
+            "mean": samples.mean(axis=0),
+            "sem": samples.std(axis=0, ddof=1) / np.sqrt(K) if K > 1 else np.zeros(samples.shape[1:]),
+            "lo": np.percentile(samples, tail, axis=0),
+            "hi": np.percentile(samples, 100 - tail, axis=0),
+        }
+    return baseline
@@ -0,0 +1,80 @@
+# Multi-level image pyramids for the downsampling step of Problem1.q5.
+#
+# Each level is computed from the previous one with array reshapes (or
+# cv2.pyrDown for the Gaussian pyramid), no per-pixel python. The levels are
+# produced lazily, so only two of them are alive at any time.
+#
+# q5 does not downsample the image itself: every level is the filter response
+# of the downsampled previous level's response. responsePyramid builds those.
+
+
+from __future__ import print_function, division
+
+import cv2
+import numpy as np
+
+
+def blockMean(img):
+    """
+    Average every 2x2 block of the image. An odd last row / column is dropped,
+    and integer images are floored like the original q5 loop did.
+    :param img: ndarray of shape (..., rows, cols), leading axes are a batch
+    :return: ndarray of shape (..., rows//2, cols//2), same dtype as img
+    """
+    rows, cols = img.shape[-2] // 2, img.shape[-1] // 2
+    blocks = img[..., :2*rows, :2*cols].reshape(img.shape[:-2] + (rows, 2, cols, 2))
+    if np.issubdtype(img.dtype, np.integer):
+        return (blocks.sum(axis=(-3, -1), dtype=np.int64) // 4).astype(img.dtype)
+    return blocks.mean(axis=(-3, -1)).astype(img.dtype)
+
+
+def gaussianReduce(img):
+    """
+    Gaussian blur then drop every other row and column (cv2.pyrDown)
+    :param img: 2-D ndarray
+    :return: ndarray of shape ((rows+1)//2, (cols+1)//2)
+    """
+    if img.dtype not in (np.uint8, np.uint16, np.int16, np.float32, np.float64):
+        img = img.astype(np.float32)
+    return cv2.pyrDown(img)
+
+
+def pyramid(img, levels, kind = "mean"):
+    """
+    Lazily build the downsampled levels of an image. Level 0 (the image
+    itself) is not yielded, so pyramid(img, 2) gives the two images of q5.
+    Stops early once a level would be smaller than 2x2.
+    :param img: 2-D ndarray, or a (K, rows, cols) batch for kind "mean"
+    :param levels: int
+    :param kind: str, "mean" for 2x2 block means, "gaussian" for cv2.pyrDown
+    :return: generator of ndarray
+    """
+    return responsePyramid(img, levels, None, kind)
+
+
+def responsePyramid(img, levels, respond, kind = "mean"):
+    """
+    Lazily build the levels of Problem1.q5: downsample, apply respond, and
+    downsample that response again for the next level.
+    :param img: 2-D ndarray, or a (K, rows, cols) batch for kind "mean"
+    :param levels: int
+    :param respond: function of a downsampled level returning its response,
+        or None to yield the downsampled levels themselves
+    :param kind: str, "mean" for 2x2 block means, "gaussian" for cv2.pyrDown
+    :return: generator of ndarray
+    """
+    if kind == "mean":
+        reduce = blockMean
+    elif kind == "gaussian":
+        reduce = gaussianReduce
+    else:
+        raise ValueError("Wrong pyramid kind: {}".format(kind))
+
+    for ind in range(levels):
+        if min(img.shape[-2:]) < 4:
+            return
+        img = reduce(img)
+        if respond is not None:
+            img = respond(img)
+        yield img
+
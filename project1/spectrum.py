@@ -0,0 +1,173 @@
+# Radially averaged power spectra and 1/f slopes of natural images.
+#
+# Same-sized crops are stacked into one (B, rows, cols) array and transformed
+# with a single rfft2. The map from every rfft2 coefficient to its radial
+# frequency bin only depends on the crop shape, so it is computed once per
+# shape and the radial averages of the whole batch are one bincount. The
+# log-log slope is a closed-form least squares fit, vectorized over the batch.
+#
+# Usage:
+#   python spectrum.py "scenes/*.jpg" --crop 512 -o spectra.json
+
+
+from __future__ import print_function, division
+
+import argparse
+import json
+
+import numpy as np
+
+from imgStats import loadImage
+
+
+# (rows, cols, window) -> (bin index, coefficient weight, counts, window array)
+_radialCache = {}
+
+
+def radialBins(rows, cols, window = True):
+    """
+    Radial frequency bin of every rfft2 coefficient of a rows x cols image.
+    Bin k holds the integer radii in [k - 0.5, k + 0.5) in cycles per
+    min(rows, cols) pixels, up to the Nyquist frequency.
+    :param rows: int
+    :param cols: int
+    :param window: bool, also build the 2-D Hann window of the crop
+    :return: (idx, weight, counts, hann) where idx is an intp ndarray of the
+        rfft2 shape (bins over Nyquist get the index numBins and are ignored),
+        weight counts the coefficients rfft2 leaves out by symmetry, counts is
+        the weighted number of coefficients per bin, hann is None without window
+    """
+    key = (rows, cols, window)
+    if key not in _radialCache:
+        n = min(rows, cols)
+        fy = np.fft.fftfreq(rows)[:, None] * n
+        fx = np.fft.rfftfreq(cols)[None, :] * n
+        numBins = n // 2 + 1
+        idx = np.minimum(np.rint(np.sqrt(fy**2 + fx**2)).astype(np.intp), numBins)
+
+        weight = np.full(fx.shape[1], 2.0)
+        weight[0] = 1
+        if cols % 2 == 0:
+            weight[-1] = 1
+        weight = np.broadcast_to(weight, idx.shape)
+
+        counts = np.bincount(idx.ravel(), weight.ravel(), minlength=numBins + 1)[:numBins]
+        hann = np.outer(np.hanning(rows), np.hanning(cols)) if window else None
+        _radialCache[key] = (idx, weight, counts, hann)
+    return _radialCache[key]
+
+
+def powerSpectra(imgs, window = True):
+    """
+    Radially averaged power spectra of a batch of same-sized images
+    :param imgs: ndarray of shape (B, rows, cols) or (rows, cols)
+    :param window: bool, remove the mean and apply a Hann window first to
+        limit the leakage of the image borders
+    :return: (freqs, spectra) with freqs of shape (numBins,) in cycles per
+        pixel and spectra of shape (B, numBins) or (numBins,)
+    """
+    imgs = np.asarray(imgs, dtype=np.float64)
+    squeeze = imgs.ndim == 2
+    imgs = imgs.reshape((-1,) + imgs.shape[-2:])
+    B, rows, cols = imgs.shape
+    idx, weight, counts, hann = radialBins(rows, cols, window)
+    numBins = len(counts)
+
+    if window:
+        imgs = (imgs - imgs.mean(axis=(1, 2), keepdims=True)) * hann
+    power = np.abs(np.fft.rfft2(imgs)) ** 2 * weight
+
+    offsets = (np.arange(B, dtype=np.intp) * (numBins + 1))[:, None, None]
+    sums = np.bincount((idx + offsets).ravel(), power.ravel(), minlength=B * (numBins + 1))
+    spectra = sums.reshape(B, numBins + 1)[:, :numBins] / np.maximum(counts, 1)
+    freqs = np.arange(numBins) / min(rows, cols)
+    return freqs, (spectra[0] if squeeze else spectra)
+
+
+def fitSlope(freqs, spectra, fmin = None, fmax = None):
+    """
+    Least squares fit of log10 P = intercept + slope * log10 f per spectrum
+    :param freqs: ndarray of shape (numBins,)
+    :param spectra: ndarray of shape (B, numBins) or (numBins,)
+    :param fmin: float, lowest frequency used, defaults to the first bin above 0
+    :param fmax: float, highest frequency used, defaults to Nyquist
+    :return: (slope, intercept) ndarrays of shape (B,) or floats
+    """
+    spectra = np.asarray(spectra, dtype=np.float64)
+    squeeze = spectra.ndim == 1
+    spectra = np.atleast_2d(spectra)
+    use = freqs > 0
+    if fmin is not None:
+        use &= freqs >= fmin
+    if fmax is not None:
+        use &= freqs <= fmax
+
+    x = np.log10(freqs[use])
+    with np.errstate(divide="ignore"):
+        y = np.log10(spectra[:, use])
+    xc = x - x.mean()
+    slope = (y - y.mean(axis=1, keepdims=True)).dot(xc) / np.dot(xc, xc)
+    intercept = y.mean(axis=1) - slope * x.mean()
+    if squeeze:
+        return slope[0], intercept[0]
+    return slope, intercept
+
+
+def centerCrop(img, size):
+    """
+    :param img: 2-D ndarray
+    :param size: int
+    :return: size x size view of the center of img
+    """
+    rows, cols = img.shape
+    if rows < size or cols < size:
+        raise ValueError("Image {}x{} is smaller than the crop {}".format(rows, cols, size))
+    r0, c0 = (rows - size) // 2, (cols - size) // 2
+    return img[r0:r0 + size, c0:c0 + size]
+
+
+def spectrumStats(img, size, fmin = None, fmax = None):
+    """
+    1/f statistics of the center crop of one image, for the batch records
+    :param img: 2-D ndarray
+    :param size: int, crop size, reduced to the image size if larger
+    :return: dict of plain python values
+    """
+    freqs, spectrum = powerSpectra(centerCrop(img, min(size, min(img.shape))))
+    slope, intercept = fitSlope(freqs, spectrum, fmin, fmax)
+    return {"specSlope": float(slope), "specIntercept": float(intercept)}
+
+
+def fileSpectra(files, size, batchSize = 64, fmin = None, fmax = None):
+    """
+    Spectra and slopes of the center crops of many image files, transformed
+    batchSize crops at a time
+    :param files: list of str
+    :param size: int, crop size
+    :param batchSize: int
+    :return: list of dict, one per file
+    """
+    records = []
+    for start in range(0, len(files), batchSize):
+        batch = files[start:start + batchSize]
+        crops = np.stack([centerCrop(loadImage(f), size) for f in batch])
+        freqs, spectra = powerSpectra(crops)
+        slope, intercept = fitSlope(freqs, spectra, fmin, fmax)
+        for i, f in enumerate(batch):
+            records.append({"file": f, "specSlope": float(slope[i]), "specIntercept": float(intercept[i]),
+                            "spectrum": spectra[i].tolist()})
+    return records
+
+
+if __name__ == "__main__":
+    from batch import listImages
+
+    parser = argparse.ArgumentParser(description="Radially averaged power spectra of many images")
+    parser.add_argument("source", help="directory or glob pattern of images")
+    parser.add_argument("--crop", type=int, default=256, help="size of the center crops")
+    parser.add_argument("--batch", type=int, default=64, help="crops per rfft2 call")
+    parser.add_argument("-o", "--out", default="spectra.json")
+    args = parser.parse_args()
+
+    with open(args.out, "w") as f:
+        json.dump(fileSpectra(listImages(args.source), args.crop, args.batch), f)
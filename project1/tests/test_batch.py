@@ -0,0 +1,34 @@
+from __future__ import print_function, division
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import batch
+from filterBank import FilterBank
+
+IMG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "natural_scene_1.jpg")
+
+
+def test_processImage_single_spec_matches_bank():
+    spec = ("laplacian", 3)
+    bank = FilterBank([spec, "adjDiff"], threads = 0)
+    try:
+        expected = bank.imageStats(batch.loadImage(IMG_FILE))[0]
+    finally:
+        bank.close()
+
+    cacheDir = tempfile.mkdtemp()
+    try:
+        for kwargs in [{}, {"cacheDir": cacheDir}]:
+            records, accums = batch.processImage(IMG_FILE, types = [spec], **kwargs)
+            assert len(records) == 1
+            record = records[0]
+            assert record["error"] is None
+            assert record["filter"] == "laplacian3"
+            assert sorted(accums) == [("laplacian3", 0), ("laplacian3", 1), ("laplacian3", 2)]
+            for key in expected:
+                np.testing.assert_equal(record[key], expected[key])
+    finally:
+        shutil.rmtree(cacheDir)
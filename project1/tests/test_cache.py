@@ -0,0 +1,35 @@
+from __future__ import print_function, division
+import shutil
+import tempfile
+
+import numpy as np
+
+from cache import ImageCache
+
+
+def test_put_walks_only_when_over_limit():
+    cacheDir = tempfile.mkdtemp()
+    try:
+        arr = np.zeros(1000, dtype=np.uint8)
+        cache = ImageCache(cacheDir, maxBytes = 5 * 1128)
+        walks = []
+        files = cache.files
+        cache.files = lambda: walks.append(1) or files()
+
+        for i in range(5):
+            cache.get("%040x" % i, "a", lambda: arr)
+        assert walks == []
+        assert cache.totalBytes == sum(size for mtime, size, path in files())
+
+        # Rewriting a file does not count it twice
+        cache.put(cache.path("%040x" % 0, "a"), arr)
+        assert walks == []
+
+        for i in range(5, 8):
+            cache.get("%040x" % i, "a", lambda: arr)
+        assert len(walks) == 3
+        assert cache.totalBytes <= cache.maxBytes
+        assert cache.totalBytes == sum(size for mtime, size, path in files())
+        assert ImageCache(cacheDir, cache.maxBytes).totalBytes == cache.totalBytes
+    finally:
+        shutil.rmtree(cacheDir)
@@ -0,0 +1,32 @@
+from __future__ import print_function, division
+
+import numpy as np
+
+from histAccum import HistAccumulator
+
+
+def test_merge_matches_single_accumulator():
+    rng = np.random.RandomState(0)
+    # Heavy-tailed, skewed, and partly outside [lo, hi]
+    z = np.concatenate([np.round(rng.laplace(3, 6, 5000)), rng.randint(-5, 40, 700)]).astype(np.int16)
+    rng.shuffle(z)
+
+    whole = HistAccumulator().add(z)
+    for cuts in [[2500], [1, 17, 3000], [0, 4000, 4000, 5699]]:
+        merged = HistAccumulator()
+        for part in np.split(z, cuts):
+            merged.merge(HistAccumulator().add(part))
+        assert merged.n == whole.n == z.size
+        np.testing.assert_array_equal(merged.counts, whole.counts)
+        assert (merged.underflow, merged.overflow) == (whole.underflow, whole.overflow)
+        for name in ["mean", "var", "skewness", "kurtosis"]:
+            np.testing.assert_allclose(getattr(merged, name), getattr(whole, name), rtol=1e-10)
+
+    # And both match the moments computed directly
+    d = z - z.mean()
+    np.testing.assert_allclose(whole.mean, z.mean(), rtol=1e-12)
+    np.testing.assert_allclose(whole.var, z.var(), rtol=1e-12)
+    np.testing.assert_allclose(whole.skewness, np.mean(d**3) / np.mean(d**2)**1.5, rtol=1e-10)
+    np.testing.assert_allclose(whole.kurtosis, np.mean(d**4) / np.mean(d**2)**2 - 3, rtol=1e-10)
+    histr, edges = whole.histogram()
+    np.testing.assert_allclose(histr, np.histogram(z, whole.hi - whole.lo + 1, [whole.lo, whole.hi], density=True)[0])
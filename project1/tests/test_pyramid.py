@@ -0,0 +1,53 @@
+from __future__ import print_function, division
+
+import numpy as np
+
+import imgStats
+from filterBank import FilterBank
+
+
+def baselineDownsample(img):
+    # The 2x2 block mean of the original Problem1.q5
+    rows, cols = img.shape
+    return np.array([[np.sum(img[2*i:2*(i+1), 2*j:2*(j+1)]) // 4 for j in range(cols//2)]
+                     for i in range(rows//2)])
+
+
+def baselineLevels(img, type, levels = 2):
+    # The loop of the original Problem1.q5: the filter response is what gets
+    # downsampled for the next level
+    DSdiffZ = img
+    result = []
+    for ind in range(levels):
+        DSdiffZ = baselineDownsample(DSdiffZ)
+        DSdiffZ = imgStats.gradientFilter(DSdiffZ.astype(np.int16), type)
+        result.append(DSdiffZ)
+    return result
+
+
+def makeImage(rows = 37, cols = 50):
+    return np.random.RandomState(0).randint(0, 32, (rows, cols)).astype(np.uint8)
+
+
+def test_gradientPyramid_matches_q5_loop():
+    img = makeImage()
+    for type in ["adjDiff", "laplacian", "sobelx", "sobely"]:
+        levels = list(imgStats.gradientPyramid(img, 2, type))
+        expected = baselineLevels(img, type)
+        assert len(levels) == len(expected)
+        for level, ref in zip(levels, expected):
+            np.testing.assert_array_equal(level, ref)
+
+
+def test_filterBank_matches_imageStats():
+    img = makeImage()
+    bank = FilterBank(threads = 0)
+    try:
+        records = bank.imageStats(img)
+    finally:
+        bank.close()
+    for name, record in zip(bank.names, records):
+        expected = imgStats.imageStats(img, type = name)
+        assert sorted(record) == sorted(expected)
+        for key in expected:
+            np.testing.assert_equal(record[key], expected[key])
@@ -0,0 +1,116 @@
+# Tiled gradient filtering for images that do not fit in memory.
+#
+# The image is read from a memory-mapped .npy or raw file in bands of rows,
+# each band padded with the halo rows the filter needs. The halo is cut off
+# again after filtering, so the concatenated tiles are exactly the response
+# gradientFilter gives on the whole image. Peak memory is a few copies of
+# one band.
+#
+# Usage:
+#   python tiling.py mosaic.npy --filter laplacian --param 3 --tile-rows 2048
+#   python tiling.py mosaic.raw --shape 60000 80000
+
+
+from __future__ import print_function, division
+
+import argparse
+import json
+
+import numpy as np
+
+from imgStats import gradientFilter, HIST_RANGE
+from histAccum import HistAccumulator
+
+
+def openSource(path, shape = None, dtype = np.uint8):
+    """
+    Memory-map a greyscale image without reading it
+    :param path: str, .npy file or raw file of shape rows x cols
+    :param shape: (rows, cols), needed for raw files
+    :param dtype: numpy dtype of raw files
+    :return: read-only ndarray backed by the file
+    """
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    if shape is None:
+        raise ValueError("Raw image {} needs a shape".format(path))
+    return np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape))
+
+
+def filterHalo(type = "adjDiff", param = 1):
+    """
+    Number of rows above and below a tile the filter reads
+    :param type: str
+    :param param: int, kernel size for laplacian / sobel
+    :return: int
+    """
+    if type == "adjDiff":
+        return 1
+    return max(1, param // 2)
+
+
+def iterBands(src, tileRows, halo):
+    """
+    Split the rows of src into bands with halo rows on both sides
+    :param src: ndarray, typically memory-mapped
+    :param tileRows: int
+    :param halo: int
+    :return: generator of (r0, r1, band, top) where band holds the rows
+        [r0 - top, r1 + halo) clipped to the image, read into memory
+    """
+    rows = src.shape[0]
+    for r0 in range(0, rows, tileRows):
+        r1 = min(r0 + tileRows, rows)
+        top = min(halo, r0)
+        yield r0, r1, np.array(src[r0 - top:min(r1 + halo, rows)]), top
+
+
+def tiledGradient(src, type = "adjDiff", param = 1, tileRows = 1024, quantize = True):
+    """
+    Lazily compute the gradient filter response band by band
+    :param src: ndarray of shape (rows, cols), e.g. from openSource
+    :param type: str, see gradientFilter
+    :param param: int, kernel size for laplacian / sobel
+    :param tileRows: int
+    :param quantize: bool, re-scale the intensity to [0, 31] as Problem1 does
+    :return: generator of (r0, int16 ndarray of rows [r0, r0 + tileRows))
+    """
+    if src.shape[0] < 2:
+        raise ValueError("Image needs at least 2 rows")
+    halo = filterHalo(type, param)
+    # A band of a single row would make adjDiff copy a halo row over it
+    tileRows = max(tileRows, halo + 1)
+    for r0, r1, band, top in iterBands(src, tileRows, halo):
+        if quantize:
+            band //= 8
+        resp = gradientFilter(band.astype(np.int16), type, param)
+        yield r0, resp[top:top + r1 - r0]
+
+
+def tiledStats(src, type = "adjDiff", param = 1, tileRows = 1024, quantize = True, accum = None):
+    """
+    Histogram and moments of the filter response of a large image
+    :param src: ndarray of shape (rows, cols), e.g. from openSource
+    :param accum: HistAccumulator or None, the tiles are added to it
+    :return: HistAccumulator
+    """
+    if accum is None:
+        accum = HistAccumulator(*HIST_RANGE)
+    for r0, resp in tiledGradient(src, type, param, tileRows, quantize):
+        accum.add(resp)
+    return accum
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Problem1 statistics of an image larger than RAM")
+    parser.add_argument("source", help=".npy or raw greyscale image")
+    parser.add_argument("--shape", type=int, nargs=2, default=None, help="rows cols of a raw image")
+    parser.add_argument("--filter", default="adjDiff", choices=["adjDiff", "laplacian", "sobelx", "sobely"])
+    parser.add_argument("--param", type=int, default=1, help="kernel size for laplacian / sobel")
+    parser.add_argument("--tile-rows", type=int, default=1024)
+    parser.add_argument("--no-quantize", action="store_true", help="the source is already in [0, 31]")
+    args = parser.parse_args()
+
+    src = openSource(args.source, args.shape)
+    accum = tiledStats(src, args.filter, args.param, args.tile_rows, not args.no_quantize)
+    print(json.dumps(accum.summary()))
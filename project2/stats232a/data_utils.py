@@ -7,7 +7,8 @@ import os
 from scipy.misc import imread
 import platform
 import struct
-from array import array as pyarray
+
+from stats232a.dataset import NormalizedArray
 
 def load_pickle(f):
     version = platform.python_version_tuple()
@@ -84,7 +85,48 @@ def get_CIFAR10_data(num_training=49000, num_validation=1000, num_test=1000,
     }
 
 
-def load_mnist(dataset="training", digits=np.arange(10), path=".", size = 60000):
+# numpy dtypes of the IDX type codes
+IDX_DTYPES = {
+    0x08: np.dtype('u1'), 0x09: np.dtype('i1'), 0x0B: np.dtype('>i2'),
+    0x0C: np.dtype('>i4'), 0x0D: np.dtype('>f4'), 0x0E: np.dtype('>f8'),
+}
+
+def read_idx(filename):
+    """
+    Memory-map the payload of an IDX file (the format of the MNIST files)
+    without reading or copying it.
+
+    Inputs:
+    - filename: Path of the IDX file
+
+    Returns:
+    A read-only array with the shape and dtype given by the IDX header.
+    """
+    with open(filename, 'rb') as f:
+        zero, type_code, ndim = struct.unpack(">HBB", f.read(4))
+        if zero != 0 or type_code not in IDX_DTYPES:
+            raise ValueError("%s is not an IDX file" % filename)
+        shape = struct.unpack(">" + "I" * ndim, f.read(4 * ndim))
+    return np.memmap(filename, dtype=IDX_DTYPES[type_code], mode='r',
+                     offset=4 + 4 * ndim, shape=shape)
+
+def load_mnist(dataset="training", digits=np.arange(10), path=".", size = 60000,
+               dtype=float):
+    """
+    Load MNIST images and labels from the IDX files.
+
+    Inputs:
+    - dataset: "training" or "testing"
+    - digits: The digits to keep
+    - path: Directory containing the IDX files
+    - size: Maximum number of images returned, the first ones of the file
+    - dtype: dtype of the images. With np.uint8 and all digits the images are
+      a view of the memory-mapped file and nothing is copied.
+
+    Returns a tuple of:
+    - images: Array of shape (N, rows, cols, 1)
+    - labels: Array of shape (N,)
+    """
     if dataset == "training":
         fname_img = os.path.join(path, 'train-images-idx3-ubyte')
         fname_lbl = os.path.join(path, 'train-labels-idx1-ubyte')
@@ -95,65 +137,106 @@ def load_mnist(dataset="training", digits=np.arange(10), path=".", size = 60000)
     else:
         raise ValueError("dataset must be 'testing' or 'training'")
 
-    flbl = open(fname_lbl, 'rb')
-    magic_nr, size = struct.unpack(">II", flbl.read(8))
-    lbl = pyarray("b", flbl.read())
-    flbl.close()
-
-    fimg = open(fname_img, 'rb')
-    magic_nr, size, rows, cols = struct.unpack(">IIII", fimg.read(16))
-    img = pyarray("B", fimg.read())
-    fimg.close()
-
-    ind = [ k for k in range(size) if lbl[k] in digits ]
-    N = size #int(len(ind) * size/100.)
-    images = np.zeros((N, rows, cols, 1), dtype=float)
-    labels = np.zeros((N, 1), dtype=int)
-    for i in range(N): #int(len(ind) * size/100.)):
-        images[i] = np.array(img[ ind[i]*rows*cols : (ind[i]+1)*rows*cols ])\
-            .reshape((rows, cols, 1)).astype(float)
-        labels[i] = lbl[ind[i]]
-    labels = [label[0] for label in labels]
-    labels = np.array(labels)
-    return images, labels
+    lbl = read_idx(fname_lbl)
+    img = read_idx(fname_img)
+    img = img.reshape(img.shape + (1,))
+
+    # Lookup table of the digits kept, indexed by label
+    keep = np.zeros(256, dtype=bool)
+    keep[np.asarray(digits)] = True
+    mask = keep[lbl]
+    if mask.all():
+        images, labels = img[:size], lbl[:size]
+    else:
+        ind = np.flatnonzero(mask)[:size]
+        images, labels = img[ind], lbl[ind]
+    return images.astype(dtype, copy=False), np.array(labels, dtype=int)
+
+MNIST_KEYS = ('X_train', 'y_train', 'X_val', 'y_val', 'X_test', 'y_test')
+
+def _mnist_cache_valid(cache_dir, sources):
+    """
+    True if every array of a get_mnist_data cache exists and is newer than
+    the IDX files it was computed from. IDX files that were removed are not
+    checked, so a cache kept without them is still used.
+    """
+    files = [os.path.join(cache_dir, k + '.npy') for k in MNIST_KEYS]
+    if not all(os.path.exists(f) for f in files):
+        return False
+    sources = [f for f in sources if os.path.exists(f)]
+    newest = max(os.path.getmtime(f) for f in sources) if sources else 0
+    return all(os.path.getmtime(f) >= newest for f in files)
 
 def get_mnist_data(num_training=59000, num_validation=1000, num_test=1000,
-                     subtract_mean=True):
+                     subtract_mean=True, dtype=np.float32, cache=True, lazy=False):
     """
     Load the MNIST dataset from disk and perform preprocessing to prepare
     it for classifiers. 
+
+    The preprocessed arrays are saved as .npy files under
+    stats232a/datasets/mnist_cache the first time, and later calls with the
+    same arguments memory-map them (copy-on-write) instead of parsing and
+    normalizing the IDX files again. Pass cache=False to skip the cache.
+
+    With lazy=True nothing is converted or cached: X_train, X_val and X_test
+    are NormalizedArray views of the memory-mapped uint8 IDX data that
+    subtract the mean from each minibatch as it is read.
     """
     # Load the raw MNIST data
     mnist_dir = 'stats232a/datasets'
-    X_train, y_train = load_mnist(dataset="training", path=mnist_dir, size=num_training + num_validation)
-    X_test, y_test = load_mnist(dataset="testing", path=mnist_dir, size=num_test)
+    cache_dir = os.path.join(mnist_dir, 'mnist_cache', '%d_%d_%d_%s_%s' % (
+        num_training, num_validation, num_test, subtract_mean, np.dtype(dtype).name))
+    sources = [os.path.join(mnist_dir, f) for f in (
+        'train-images-idx3-ubyte', 'train-labels-idx1-ubyte',
+        't10k-images-idx3-ubyte', 't10k-labels-idx1-ubyte')]
+    cache = cache and not lazy
+    if cache and _mnist_cache_valid(cache_dir, sources):
+        return dict((k, np.load(os.path.join(cache_dir, k + '.npy'), mmap_mode='c'))
+                    for k in MNIST_KEYS)
 
-    # Subsample the data
-    mask = list(range(num_training, num_training + num_validation))
-    X_val = X_train[mask]
-    y_val = y_train[mask]
-    mask = list(range(num_training))
-    X_train = X_train[mask]
-    y_train = y_train[mask]
+    X_train, y_train = load_mnist(dataset="training", path=mnist_dir, size=num_training + num_validation,
+                                  dtype=np.uint8)
+    X_test, y_test = load_mnist(dataset="testing", path=mnist_dir, size=num_test, dtype=np.uint8)
 
-    # Normalize the data: subtract the mean image
-    if subtract_mean:
-        mean_image = np.mean(X_train, axis=0)
-        X_train -= mean_image
-        X_val -= mean_image
-        X_test -= mean_image
+    # Subsample the data and transpose so that channels come first; these
+    # are views of the uint8 data
+    X_val = X_train[num_training:num_training + num_validation].transpose(0, 3, 1, 2)
+    y_val = y_train[num_training:num_training + num_validation]
+    X_train = X_train[:num_training].transpose(0, 3, 1, 2)
+    y_train = y_train[:num_training]
+    X_test = X_test.transpose(0, 3, 1, 2)
 
-    # Transpose so that channels come first
-    X_train = X_train.transpose(0, 3, 1, 2).copy()
-    X_val = X_val.transpose(0, 3, 1, 2).copy()
-    X_test = X_test.transpose(0, 3, 1, 2).copy()
+    # Normalize the data: subtract the mean image, converting to dtype in
+    # the same pass
+    mean_image = None
+    if subtract_mean:
+        mean_image = np.mean(X_train, axis=0, dtype=np.float64).astype(dtype)
+    def prepare(X):
+        if lazy:
+            return NormalizedArray(X, mean_image, dtype=dtype)
+        out = np.empty(X.shape, dtype=dtype)
+        if mean_image is None:
+            out[...] = X
+        else:
+            np.subtract(X, mean_image, out=out)
+        return out
 
     # Package data into a dictionary
-    return {
-      'X_train': X_train, 'y_train': y_train,
-      'X_val': X_val, 'y_val': y_val,
-      'X_test': X_test, 'y_test': y_test,
+    data = {
+      'X_train': prepare(X_train), 'y_train': y_train,
+      'X_val': prepare(X_val), 'y_val': y_val,
+      'X_test': prepare(X_test), 'y_test': y_test,
     }
+    if cache:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        for k, v in data.items():
+            filename = os.path.join(cache_dir, k + '.npy')
+            tmp = '%s.tmp%d' % (filename, os.getpid())
+            with open(tmp, 'wb') as f:
+                np.save(f, v)
+            os.rename(tmp, filename)
+    return data
 
 
 def load_models(models_dir):
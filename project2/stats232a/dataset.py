@@ -0,0 +1,103 @@
+from __future__ import print_function, division
+from builtins import object
+
+import numpy as np
+
+"""
+This file implements dataset views that keep the raw (e.g. uint8) data and
+normalize samples only when they are read. A view stands in for a float array
+of data anywhere the Solver reads samples: it has a shape, and indexing it or
+gathering from it with np.take returns normalized float arrays, one minibatch
+at a time. The raw data can be a read-only memory map shared by several
+processes.
+
+Example usage:
+
+data = get_mnist_data(lazy=True)
+data['X_train']         # NormalizedArray over uint8 data, 1 byte per value
+data['X_train'][:100]   # float32 array of shape (100, 1, 28, 28)
+"""
+
+
+class NormalizedArray(object):
+    """
+    Read-only view of raw data normalized on access as
+
+    (data - mean) * scale
+
+    computed in the output dtype, without an intermediate copy in the dtype
+    of the data or in float64.
+    """
+
+    def __init__(self, data, mean=None, scale=None, dtype=np.float32):
+        """
+        Inputs:
+        - data: Array of raw data, of shape (N, d_1, ..., d_k)
+        - mean: Optional array broadcastable to (d_1, ..., d_k), e.g. a mean
+          image or per-channel means of shape (C, 1, 1)
+        - scale: Optional scalar or array broadcastable to (d_1, ..., d_k)
+          multiplied in after subtracting the mean
+        - dtype: dtype of the arrays returned
+        """
+        self.data = data
+        self.dtype = np.dtype(dtype)
+        self.mean = None if mean is None else np.asarray(mean, dtype=self.dtype)
+        self.scale = None if scale is None else np.asarray(scale, dtype=self.dtype)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def normalize(self, raw, out=None):
+        """
+        Normalize an array of raw samples.
+
+        Inputs:
+        - raw: Array of raw data, of shape (M, d_1, ..., d_k)
+        - out: Optional array of the same shape and of dtype self.dtype the
+          result is written to
+
+        Returns the normalized array (out if it was given).
+        """
+        if out is None:
+            out = np.empty(raw.shape, dtype=self.dtype)
+        if self.mean is None:
+            out[...] = raw
+        else:
+            np.subtract(raw, self.mean, out=out)
+        if self.scale is not None:
+            np.multiply(out, self.scale, out=out)
+        return out
+
+    def __getitem__(self, index):
+        return self.normalize(np.asarray(self.data[index]))
+
+    def take(self, indices, axis=None, out=None, mode='raise'):
+        """
+        Gather normalized samples; this is what np.take(view, ...) calls.
+        Only axis=0 is supported.
+        """
+        if axis != 0:
+            raise ValueError('NormalizedArray only supports take along axis 0')
+        return self.normalize(np.take(self.data, indices, axis=0, mode=mode), out=out)
+
+    def subset(self, indices):
+        """
+        Returns a NormalizedArray over a copy of the raw samples at indices,
+        with the same normalization, e.g. to shuffle an epoch without
+        converting it.
+        """
+        view = NormalizedArray(np.take(self.data, indices, axis=0), dtype=self.dtype)
+        view.mean, view.scale = self.mean, self.scale
+        return view
+
+    def __array__(self, dtype=None, copy=None):
+        X = self.normalize(np.asarray(self.data))
+        return X if dtype is None else X.astype(dtype, copy=False)
@@ -0,0 +1,133 @@
+from __future__ import print_function, division
+from builtins import object
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+"""
+This file implements data augmentation of whole minibatches of images of
+shape (N, C, H, W). Every function draws one random transformation per image
+but works on the minibatch with a few array operations, without a Python loop
+over the images. They all have the interface
+
+def augment(X, rng, out=None):
+
+Inputs:
+  - X: Array of images, of shape (N, C, H, W)
+  - rng: numpy RandomState
+  - out: Optional array of the shape and dtype of X the result is written to;
+    it may be X itself. If None, a new array is returned.
+
+Returns:
+  - out: The augmented images
+
+An Augmenter chains them and has the same interface, which is that of the
+transform of a BatchPrefetcher, so the Solver can run the augmentation on its
+prefetch thread (see the augment argument of Solver).
+"""
+
+
+def _output(X, out):
+    return np.empty_like(X) if out is None else out
+
+
+def random_crop(X, rng, pad=4, out=None):
+    """
+    Pad every image with pad zeros on each side and crop it back to H x W at
+    a random offset. The crops are read from a strided view holding every
+    possible window of the padded minibatch, so all of them are gathered at
+    once.
+    """
+    N, C, H, W = X.shape
+    out = _output(X, out)
+    # Copied before out is written, since out may be X
+    padded = np.pad(X, ((0, 0), (0, 0), (pad, pad), (pad, pad)), mode='constant')
+    sN, sC, sH, sW = padded.strides
+    windows = as_strided(padded, shape=(N, C, 2 * pad + 1, 2 * pad + 1, H, W),
+                         strides=(sN, sC, sH, sW, sH, sW))
+    dy = rng.randint(2 * pad + 1, size=N)
+    dx = rng.randint(2 * pad + 1, size=N)
+    n = np.arange(N)[:, None]
+    c = np.arange(C)[None, :]
+    out[...] = windows[n, c, dy[:, None], dx[:, None]]
+    return out
+
+
+def random_flip(X, rng, out=None):
+    """
+    Flip each image horizontally with probability 1/2.
+    """
+    out = _output(X, out)
+    if out is not X:
+        out[...] = X
+    mask = rng.rand(X.shape[0]) < 0.5
+    # The gather copies the flipped images before they are written back
+    out[mask] = out[mask][..., ::-1]
+    return out
+
+
+def color_jitter(X, rng, brightness=0.0, contrast=0.0, out=None):
+    """
+    Scale the contrast of each image about its mean by a factor drawn from
+    [1 - contrast, 1 + contrast] and shift its brightness by an offset drawn
+    from [-brightness, brightness], in the units of the data. Integer images
+    (e.g. uint8) are jittered in float32, then rounded and clipped to the
+    range of their dtype.
+    """
+    N = X.shape[0]
+    out = _output(X, out)
+    integer = np.issubdtype(X.dtype, np.integer)
+    dtype = np.float32 if integer else X.dtype
+    scale = rng.uniform(1 - contrast, 1 + contrast, size=N).astype(dtype)
+    shift = rng.uniform(-brightness, brightness, size=N).astype(dtype)
+    mean = X.mean(axis=(1, 2, 3), dtype=dtype)
+    # out = scale * (X - mean) + mean + shift, one multiply and one add
+    offset = (shift + mean * (1 - scale)).reshape(N, 1, 1, 1)
+    if not integer:
+        np.multiply(X, scale.reshape(N, 1, 1, 1), out=out)
+        out += offset
+        return out
+    result = np.multiply(X, scale.reshape(N, 1, 1, 1), dtype=dtype)
+    result += offset
+    info = np.iinfo(X.dtype)
+    np.rint(result, out=result)
+    np.clip(result, info.min, info.max, out=result)
+    out[...] = result
+    return out
+
+
+class Augmenter(object):
+    """
+    Random crop with padding, horizontal flip and color jitter, each skipped
+    when disabled.
+
+    Example usage:
+
+    solver = Solver(model, data, prefetch=2,
+                    augment=Augmenter(crop_pad=4, flip=True, brightness=0.1))
+    """
+
+    def __init__(self, crop_pad=4, flip=True, brightness=0.0, contrast=0.0):
+        """
+        Inputs:
+        - crop_pad: Padding of random_crop; 0 disables cropping.
+        - flip: Boolean; whether to apply random_flip.
+        - brightness, contrast: Ranges of color_jitter; it is skipped when
+          both are 0.
+        """
+        self.crop_pad = crop_pad
+        self.flip = flip
+        self.brightness = brightness
+        self.contrast = contrast
+
+    def __call__(self, X, rng, out=None):
+        out = _output(X, out)
+        if out is not X:
+            out[...] = X
+        if self.crop_pad > 0:
+            random_crop(out, rng, self.crop_pad, out=out)
+        if self.flip:
+            random_flip(out, rng, out=out)
+        if self.brightness > 0 or self.contrast > 0:
+            color_jitter(out, rng, self.brightness, self.contrast, out=out)
+        return out
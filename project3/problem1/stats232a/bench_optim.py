@@ -0,0 +1,118 @@
+from __future__ import print_function, division
+from builtins import range
+import time
+
+import numpy as np
+
+from stats232a import optim
+
+"""
+Micro-benchmark of the update rules in optim.py against the allocating
+formulations they replace, on a weight matrix the size of the first layer of
+a FullyConnectedNet on CIFAR-10. It also checks that both give the same
+numbers.
+
+Run from the directory containing stats232a:
+
+python -m stats232a.bench_optim
+"""
+
+
+def sgd_momentum_alloc(w, dw, config):
+    config.setdefault('learning_rate', 1e-2)
+    config.setdefault('momentum', 0.9)
+    v = config.get('velocity', np.zeros_like(w))
+    v = config['momentum']*v - config['learning_rate']*dw
+    w += v
+    config['velocity'] = v
+    return w, config
+
+
+def rmsprop_alloc(x, dx, config):
+    config.setdefault('learning_rate', 1e-2)
+    config.setdefault('decay_rate', 0.99)
+    config.setdefault('epsilon', 1e-8)
+    config.setdefault('cache', np.zeros_like(x))
+    decay_rate = config['decay_rate']
+    cache = decay_rate*config['cache'] + (1-decay_rate) * dx**2
+    x += -config['learning_rate'] * dx / (np.sqrt(cache) + config['epsilon'])
+    config['cache'] = cache
+    return x, config
+
+
+def adam_alloc(x, dx, config):
+    config.setdefault('learning_rate', 1e-3)
+    config.setdefault('beta1', 0.9)
+    config.setdefault('beta2', 0.999)
+    config.setdefault('epsilon', 1e-8)
+    config.setdefault('m', np.zeros_like(x))
+    config.setdefault('v', np.zeros_like(x))
+    config.setdefault('t', 1)
+    beta1, beta2, t = config['beta1'], config['beta2'], config['t'] + 1
+    m = beta1*config['m'] + (1-beta1)*dx
+    mt = m / (1-beta1**t)
+    v = beta2*config['v'] + (1-beta2)*(dx**2)
+    vt = v / (1-beta2**t)
+    x += -config['learning_rate'] * mt / (np.sqrt(vt) + config['epsilon'])
+    config['m'], config['v'], config['t'] = m, v, t
+    return x, config
+
+
+RULES = [
+  ('sgd_momentum', sgd_momentum_alloc, optim.sgd_momentum),
+  ('rmsprop', rmsprop_alloc, optim.rmsprop),
+  ('adam', adam_alloc, optim.adam),
+]
+
+
+def time_rule(rule, w, grads):
+    """
+    Returns the seconds per step of rule over the gradients, and the result.
+    """
+    w = w.copy()
+    config = {}
+    rule(w, grads[0], config)
+    start = time.time()
+    for dw in grads:
+        w, config = rule(w, dw, config)
+    return (time.time() - start) / len(grads), w
+
+
+def allocated_per_step(rule, w, dw):
+    """
+    Returns the peak bytes allocated by one step after the first, or None
+    where tracemalloc is unavailable (Python 2).
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    w = w.copy()
+    config = {}
+    rule(w, dw, config)
+    tracemalloc.start()
+    rule(w, dw, config)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def benchmark(shape=(3072, 100), steps=50, dtype=np.float64, seed=0):
+    rng = np.random.RandomState(seed)
+    w = rng.randn(*shape).astype(dtype)
+    grads = [rng.randn(*shape).astype(dtype) for _ in range(steps)]
+    print('Update rules on a %s %s array, %d steps' % (shape, np.dtype(dtype).name, steps))
+    for name, alloc, inplace in RULES:
+        t_alloc, w_alloc = time_rule(alloc, w, grads)
+        t_inplace, w_inplace = time_rule(inplace, w, grads)
+        b_alloc = allocated_per_step(alloc, w, grads[0])
+        b_inplace = allocated_per_step(inplace, w, grads[0])
+        print('%-12s allocating %7.3f ms/step, in place %7.3f ms/step (%.2fx); '
+              'same result: %s' % (name, t_alloc * 1e3, t_inplace * 1e3,
+              t_alloc / t_inplace, np.array_equal(w_alloc, w_inplace)))
+        if b_alloc is not None:
+            print('%-12s allocated per step: %d bytes vs %d bytes' % ('', b_alloc, b_inplace))
+
+
+if __name__ == '__main__':
+    benchmark()
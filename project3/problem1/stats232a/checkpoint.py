@@ -0,0 +1,138 @@
+from __future__ import print_function, division
+from future import standard_library
+standard_library.install_aliases()
+from builtins import object
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+"""
+This file implements the checkpoint files of the Solver. A checkpoint is a
+compressed .npz archive holding named arrays (parameters and optimizer state)
+and one JSON string with everything else (counters, histories, settings).
+Checkpoints are written to a temporary file and renamed into place, so an
+interrupted write never leaves a truncated checkpoint behind.
+"""
+
+META_KEY = 'meta.json'
+
+
+def save_npz(filename, arrays, meta):
+    """
+    Write a checkpoint.
+
+    Inputs:
+    - filename: Path of the .npz file
+    - arrays: Dictionary mapping names to numpy arrays
+    - meta: JSON-serializable dictionary
+    """
+    tmp = '%s.tmp%d' % (filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **dict(arrays, **{META_KEY: np.array(json.dumps(meta))}))
+    os.rename(tmp, filename)
+
+
+def load_npz(filename):
+    """
+    Read a checkpoint written by save_npz.
+
+    Returns a tuple of:
+    - arrays: Dictionary mapping names to numpy arrays
+    - meta: Dictionary
+    """
+    with np.load(filename) as f:
+        arrays = dict((k, f[k]) for k in f.files if k != META_KEY)
+        meta = json.loads(str(f[META_KEY]))
+    return arrays, meta
+
+
+class CheckpointWriter(object):
+    """
+    Writes checkpoints on a background thread and deletes old ones.
+
+    After every write the files kept are the keep_last most recent ones and
+    the keep_best ones with the highest score; the others written by this
+    writer are removed. Writing the same filename again replaces the file and
+    its score.
+    """
+
+    def __init__(self, keep_last=None, keep_best=0, background=True):
+        """
+        Inputs:
+        - keep_last: Number of most recent checkpoints to keep; None keeps all.
+        - keep_best: Number of best-scoring checkpoints to keep in addition.
+        - background: If False, submit() writes before returning.
+        """
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        # (filename, score) in the order they were written
+        self.written = []
+        self._thread = None
+        if background:
+            self._jobs = queue.Queue(maxsize=2)
+            self._error = None
+            self._thread = threading.Thread(target=self._work)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                self._write(*job)
+            except Exception as e:
+                self._error = e
+
+    def _write(self, filename, arrays, meta, score):
+        save_npz(filename, arrays, meta)
+        self.written = [w for w in self.written if w[0] != filename]
+        self.written.append((filename, score))
+        self._prune()
+
+    def _prune(self):
+        if self.keep_last is None:
+            return
+        keep = set(w[0] for w in self.written[-self.keep_last:] if self.keep_last > 0)
+        best = sorted(self.written, key=lambda w: -w[1])[:self.keep_best]
+        keep.update(w[0] for w in best)
+        for filename, score in self.written:
+            if filename not in keep:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+        self.written = [w for w in self.written if w[0] in keep]
+
+    def submit(self, filename, arrays, meta, score=0.0):
+        """
+        Queue a checkpoint. The arrays must not be modified afterwards, so
+        pass copies of arrays that keep changing.
+
+        Inputs:
+        - filename: Path of the .npz file
+        - arrays: Dictionary mapping names to numpy arrays
+        - meta: JSON-serializable dictionary
+        - score: Number used to rank checkpoints for keep_best
+        """
+        if self._thread is None:
+            self._write(filename, arrays, meta, score)
+            return
+        if self._error is not None:
+            raise self._error
+        self._jobs.put((filename, arrays, meta, score))
+
+    def close(self):
+        """
+        Wait until the queued checkpoints are written.
+        """
+        if self._thread is not None:
+            self._jobs.put(None)
+            self._thread.join()
+            self._thread = None
+            if self._error is not None:
+                raise self._error
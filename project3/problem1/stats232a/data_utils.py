@@ -7,6 +7,8 @@ import os
 from scipy.misc import imread
 import platform
 
+from stats232a.dataset import NormalizedArray
+
 def load_pickle(f):
     version = platform.python_version_tuple()
     if version[0] == '2':
@@ -41,45 +43,156 @@ def load_CIFAR10(ROOT):
     return Xtr, Ytr, Xte, Yte
 
 
+CIFAR10_CACHE_KEYS = ('X_train', 'y_train', 'X_test', 'y_test')
+
+def _save_npy(filename, array):
+    """ write a .npy file atomically, so readers never see a partial file """
+    tmp = '%s.tmp%d' % (filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.rename(tmp, filename)
+
+def _cache_valid(files, sources):
+    """ true if all files exist and are newer than all existing sources """
+    if not all(os.path.exists(f) for f in files):
+        return False
+    sources = [f for f in sources if os.path.exists(f)]
+    newest = max(os.path.getmtime(f) for f in sources) if sources else 0
+    return all(os.path.getmtime(f) >= newest for f in files)
+
+def build_CIFAR10_cache(ROOT, cache_dir):
+    """
+    Convert the CIFAR-10 batches once into uint8 .npy files of shape
+    (N, 3, 32, 32), the layout of the pickled rows, so no transpose is needed.
+    The training batches are written straight into the file one at a time,
+    without holding all of them in memory.
+
+    Inputs:
+    - ROOT: Directory of the pickled CIFAR-10 batches
+    - cache_dir: Directory the files X_train.npy, y_train.npy, X_test.npy and
+      y_test.npy are written to
+    """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    batches = [os.path.join(ROOT, 'data_batch_%d' % (b, )) for b in range(1,6)]
+    ys = []
+    filename = os.path.join(cache_dir, 'X_train.npy')
+    tmp = '%s.tmp%d' % (filename, os.getpid())
+    X = None
+    start = 0
+    for f in batches:
+        with open(f, 'rb') as fo:
+            datadict = load_pickle(fo)
+        data = np.asarray(datadict['data'], dtype=np.uint8).reshape(-1, 3, 32, 32)
+        if X is None:
+            X = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8,
+                                          shape=(len(batches) * data.shape[0], 3, 32, 32))
+        X[start:start + data.shape[0]] = data
+        start += data.shape[0]
+        ys.append(np.array(datadict['labels']))
+    X.flush()
+    del X
+    os.rename(tmp, filename)
+    _save_npy(os.path.join(cache_dir, 'y_train.npy'), np.concatenate(ys))
+
+    with open(os.path.join(ROOT, 'test_batch'), 'rb') as fo:
+        datadict = load_pickle(fo)
+    _save_npy(os.path.join(cache_dir, 'X_test.npy'),
+              np.asarray(datadict['data'], dtype=np.uint8).reshape(-1, 3, 32, 32))
+    _save_npy(os.path.join(cache_dir, 'y_test.npy'), np.array(datadict['labels']))
+
+def load_CIFAR10_cache(ROOT, cache_dir):
+    """
+    Open the uint8 CIFAR-10 cache read-only with mmap, building it first if
+    it is missing or older than the batches. The pages are shared through the
+    page cache by every process that opens the files.
+
+    Returns a dictionary with the keys of CIFAR10_CACHE_KEYS, where the
+    images have shape (N, 3, 32, 32).
+    """
+    files = [os.path.join(cache_dir, k + '.npy') for k in CIFAR10_CACHE_KEYS]
+    sources = [os.path.join(ROOT, 'data_batch_%d' % (b, )) for b in range(1,6)]
+    sources.append(os.path.join(ROOT, 'test_batch'))
+    if not _cache_valid(files, sources):
+        build_CIFAR10_cache(ROOT, cache_dir)
+    return dict((k, np.load(f, mmap_mode='r')) for k, f in zip(CIFAR10_CACHE_KEYS, files))
+
+def cached_mean_image(X, cache_file, source):
+    """
+    Mean image of X as float32, accumulated in float64 without a float64
+    copy of X. It is saved to cache_file and read from there next time, unless
+    the file source that X was read from is newer.
+    """
+    if _cache_valid([cache_file], [source]):
+        return np.load(cache_file)
+    mean_image = np.mean(X, axis=0, dtype=np.float64).astype(np.float32)
+    _save_npy(cache_file, mean_image)
+    return mean_image
+
 def get_CIFAR10_data(num_training=49000, num_validation=1000, num_test=1000,
-                     subtract_mean=True):
+                     subtract_mean=True, dtype=np.float32, cache=True, lazy=False):
     """
     Load the CIFAR-10 dataset from disk and perform preprocessing to prepare
     it for classifiers. These are the same steps as we used for the SVM, but
     condensed to a single function.
+
+    With cache=True the batches are converted once to the uint8 .npy files of
+    build_CIFAR10_cache and the mean image is saved next to them, so later
+    calls read those instead of unpickling. Each returned array is then made
+    from the memory-mapped uint8 data in a single pass that converts to dtype
+    and subtracts the mean.
+
+    With lazy=True nothing is converted: X_train, X_val and X_test are
+    NormalizedArray views of the raw data that subtract the mean from each
+    minibatch as it is read, at a quarter of the memory of float32 arrays
+    (an eighth of float64) with the uint8 cache.
     """
     # Load the raw CIFAR-10 data
     cifar10_dir = 'stats232a/datasets/cifar-10-batches-py'
-    X_train, y_train, X_test, y_test = load_CIFAR10(cifar10_dir)
-
-    # Subsample the data
-    mask = list(range(num_training, num_training + num_validation))
-    X_val = X_train[mask]
-    y_val = y_train[mask]
-    mask = list(range(num_training))
-    X_train = X_train[mask]
-    y_train = y_train[mask]
-    mask = list(range(num_test))
-    X_test = X_test[mask]
-    y_test = y_test[mask]
+    if not cache:
+        X_train, y_train, X_test, y_test = load_CIFAR10(cifar10_dir)
+        # Transpose so that channels come first
+        X_train = X_train.transpose(0, 3, 1, 2)
+        X_test = X_test.transpose(0, 3, 1, 2)
+    else:
+        cache_dir = 'stats232a/datasets/cifar-10-cache'
+        raw = load_CIFAR10_cache(cifar10_dir, cache_dir)
+        X_train, y_train, X_test, y_test = [raw[k] for k in CIFAR10_CACHE_KEYS]
+
+    # Subsample the data; slices are views
+    X_val = X_train[num_training:num_training + num_validation]
+    y_val = y_train[num_training:num_training + num_validation]
+    X_train = X_train[:num_training]
+    y_train = y_train[:num_training]
+    X_test = X_test[:num_test]
+    y_test = y_test[:num_test]
 
     # Normalize the data: subtract the mean image
+    mean_image = None
     if subtract_mean:
-        mean_image = np.mean(X_train, axis=0)
-        X_train -= mean_image
-        X_val -= mean_image
-        X_test -= mean_image
+        if cache:
+            mean_image = cached_mean_image(
+                X_train, os.path.join(cache_dir, 'mean_%d.npy' % num_training),
+                os.path.join(cache_dir, 'X_train.npy'))
+        else:
+            mean_image = np.mean(X_train, axis=0)
+        mean_image = mean_image.astype(dtype)
 
-    # Transpose so that channels come first
-    X_train = X_train.transpose(0, 3, 1, 2).copy()
-    X_val = X_val.transpose(0, 3, 1, 2).copy()
-    X_test = X_test.transpose(0, 3, 1, 2).copy()
+    def prepare(X):
+        if lazy:
+            return NormalizedArray(X, mean_image, dtype=dtype)
+        out = np.empty(X.shape, dtype=dtype)
+        if mean_image is None:
+            out[...] = X
+        else:
+            np.subtract(X, mean_image, out=out)
+        return out
 
     # Package data into a dictionary
     return {
-      'X_train': X_train, 'y_train': y_train,
-      'X_val': X_val, 'y_val': y_val,
-      'X_test': X_test, 'y_test': y_test,
+      'X_train': prepare(X_train), 'y_train': np.array(y_train),
+      'X_val': prepare(X_val), 'y_val': np.array(y_val),
+      'X_test': prepare(X_test), 'y_test': np.array(y_test),
     }
 
 
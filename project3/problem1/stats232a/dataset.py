@@ -0,0 +1,409 @@
+from __future__ import print_function, division
+from future import standard_library
+standard_library.install_aliases()
+from builtins import range
+from builtins import object
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+"""
+This file implements dataset views that keep the raw (e.g. uint8) data and
+normalize samples only when they are read. A view stands in for a float array
+of data anywhere the Solver reads samples: it has a shape, and indexing it or
+gathering from it with np.take returns normalized float arrays, one minibatch
+at a time. The raw data can be a read-only memory map shared by several
+processes.
+
+Example usage:
+
+data = get_CIFAR10_data(lazy=True)
+data['X_train']         # NormalizedArray over uint8 data, 1 byte per value
+data['X_train'][:100]   # float32 array of shape (100, 3, 32, 32)
+
+It also implements a sharded on-disk format for training sets larger than
+memory: a directory of .npy shards of shard_size samples each (the last one
+may be shorter) and an index.json describing them. A ShardStream reads the
+shards as a batch source for the Solver, one shard ahead on a background
+thread, so only a few shards are ever in memory:
+
+write_shards(X_uint8, y, 'train_shards', shard_size=10000)
+shards = ShardedDataset('train_shards')
+X_train = NormalizedArray(shards.X, mean_image)
+data = {'X_train': X_train, 'y_train': shards.y, 'X_val': X_val, 'y_val': y_val}
+stream = ShardStream(shards, 100, mean=mean_image)
+solver = Solver(model, data, batch_source=stream)
+solver.train()
+stream.close()
+
+shards.X and shards.y are read-only arrays over memory-mapped shards. The
+Solver only reads X_train to check training accuracy on a subsample, so it
+must be normalized like the minibatches of the stream, here by wrapping
+shards.X in a NormalizedArray with the same mean. The Solver does not close
+the stream, so its reader thread runs until stream.close() is called.
+"""
+
+INDEX_FILE = 'index.json'
+
+
+class NormalizedArray(object):
+    """
+    Read-only view of raw data normalized on access as
+
+    (data - mean) * scale
+
+    computed in the output dtype, without an intermediate copy in the dtype
+    of the data or in float64.
+    """
+
+    def __init__(self, data, mean=None, scale=None, dtype=np.float32):
+        """
+        Inputs:
+        - data: Array of raw data, of shape (N, d_1, ..., d_k)
+        - mean: Optional array broadcastable to (d_1, ..., d_k), e.g. a mean
+          image or per-channel means of shape (C, 1, 1)
+        - scale: Optional scalar or array broadcastable to (d_1, ..., d_k)
+          multiplied in after subtracting the mean
+        - dtype: dtype of the arrays returned
+        """
+        self.data = data
+        self.dtype = np.dtype(dtype)
+        self.mean = None if mean is None else np.asarray(mean, dtype=self.dtype)
+        self.scale = None if scale is None else np.asarray(scale, dtype=self.dtype)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def ndim(self):
+        return self.data.ndim
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def normalize(self, raw, out=None):
+        """
+        Normalize an array of raw samples.
+
+        Inputs:
+        - raw: Array of raw data, of shape (M, d_1, ..., d_k)
+        - out: Optional array of the same shape and of dtype self.dtype the
+          result is written to
+
+        Returns the normalized array (out if it was given).
+        """
+        if out is None:
+            out = np.empty(raw.shape, dtype=self.dtype)
+        if self.mean is None:
+            out[...] = raw
+        else:
+            np.subtract(raw, self.mean, out=out)
+        if self.scale is not None:
+            np.multiply(out, self.scale, out=out)
+        return out
+
+    def __getitem__(self, index):
+        return self.normalize(np.asarray(self.data[index]))
+
+    def take(self, indices, axis=None, out=None, mode='raise'):
+        """
+        Gather normalized samples; this is what np.take(view, ...) calls.
+        Only axis=0 is supported.
+        """
+        if axis != 0:
+            raise ValueError('NormalizedArray only supports take along axis 0')
+        return self.normalize(np.take(self.data, indices, axis=0, mode=mode), out=out)
+
+    def subset(self, indices):
+        """
+        Returns a NormalizedArray over a copy of the raw samples at indices,
+        with the same normalization, e.g. to shuffle an epoch without
+        converting it.
+        """
+        view = NormalizedArray(np.take(self.data, indices, axis=0), dtype=self.dtype)
+        view.mean, view.scale = self.mean, self.scale
+        return view
+
+    def __array__(self, dtype=None, copy=None):
+        X = self.normalize(np.asarray(self.data))
+        return X if dtype is None else X.astype(dtype, copy=False)
+
+
+class ShardWriter(object):
+    """
+    Writes samples added in chunks of any size into shards of shard_size
+    samples, so a dataset larger than memory can be converted piece by piece.
+    Call close() to write the last shard and the index.
+    """
+
+    def __init__(self, directory, shard_size=10000):
+        """
+        Inputs:
+        - directory: Directory the shards and index are written to; it is
+          created if needed.
+        - shard_size: Number of samples per shard
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.shard_size = shard_size
+        self.shards = []
+        self._pending = []
+        self._num_pending = 0
+
+    def add(self, X, y):
+        """
+        Inputs:
+        - X: Array of data, of shape (M, d_1, ..., d_k)
+        - y: Array of labels, of shape (M,)
+        """
+        self._pending.append((np.asarray(X), np.asarray(y)))
+        self._num_pending += len(y)
+        while self._num_pending >= self.shard_size:
+            self._flush(self.shard_size)
+
+    def _flush(self, size):
+        X = np.concatenate([p[0] for p in self._pending])
+        y = np.concatenate([p[1] for p in self._pending])
+        i = len(self.shards)
+        shard = {'X': 'X_%05d.npy' % i, 'y': 'y_%05d.npy' % i, 'size': size}
+        np.save(os.path.join(self.directory, shard['X']), X[:size])
+        np.save(os.path.join(self.directory, shard['y']), y[:size])
+        self.shards.append(shard)
+        self._pending = [(X[size:], y[size:])] if size < len(y) else []
+        self._num_pending = len(y) - size
+        # The shape and dtype of a sample, from the first shard
+        if i == 0:
+            self._sample = {'X': [list(X.shape[1:]), X.dtype.str],
+                            'y': [list(y.shape[1:]), y.dtype.str]}
+
+    def close(self):
+        if self._num_pending > 0:
+            self._flush(self._num_pending)
+        if not self.shards:
+            raise ValueError('No samples were added')
+        index = {
+          'num_samples': sum(shard['size'] for shard in self.shards),
+          'shard_size': self.shard_size,
+          'shards': self.shards,
+          'sample': self._sample,
+        }
+        # Written last, so a directory with an index has all of its shards
+        with open(os.path.join(self.directory, INDEX_FILE), 'w') as f:
+            json.dump(index, f)
+
+
+def write_shards(X, y, directory, shard_size=10000):
+    """
+    Write a dataset in the sharded format.
+
+    Inputs:
+    - X: Array of data, of shape (N, d_1, ..., d_k); it is read one shard at
+      a time, so it can be a memory map.
+    - y: Array of labels, of shape (N,)
+    - directory: Directory the shards and index are written to
+    - shard_size: Number of samples per shard
+    """
+    writer = ShardWriter(directory, shard_size)
+    for start in range(0, len(y), shard_size):
+        writer.add(X[start:start + shard_size], y[start:start + shard_size])
+    writer.close()
+
+
+class ShardedDataset(object):
+    """
+    A dataset written by ShardWriter. X and y are ShardedArrays over the
+    memory-mapped shards, and load() reads whole shards.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.num_samples = index['num_samples']
+        self.shards = index['shards']
+        self.num_shards = len(self.shards)
+        # First sample of every shard, and num_samples at the end
+        self.offsets = np.cumsum([0] + [shard['size'] for shard in self.shards])
+        self.X = ShardedArray(self, 'X', *index['sample']['X'])
+        self.y = ShardedArray(self, 'y', *index['sample']['y'])
+
+    def load(self, i, mmap_mode=None):
+        """
+        Returns a tuple (X, y) of the arrays of shard i.
+        """
+        return tuple(np.load(os.path.join(self.directory, self.shards[i][key]),
+                             mmap_mode=mmap_mode) for key in ('X', 'y'))
+
+
+class ShardedArray(object):
+    """
+    Read-only array of one key ('X' or 'y') over all shards of a
+    ShardedDataset. Indexing and np.take gather from memory-mapped shards.
+    """
+
+    def __init__(self, dataset, key, sample_shape, dtype):
+        self.dataset = dataset
+        self.key = key
+        self.shape = (dataset.num_samples,) + tuple(sample_shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+        self._maps = {}
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _shard(self, i):
+        if i not in self._maps:
+            path = os.path.join(self.dataset.directory, self.dataset.shards[i][self.key])
+            self._maps[i] = np.load(path, mmap_mode='r')
+        return self._maps[i]
+
+    def take(self, indices, axis=None, out=None, mode='raise'):
+        """
+        Gather samples; this is what np.take(array, ...) calls. Only axis=0
+        is supported.
+        """
+        if axis != 0:
+            raise ValueError('ShardedArray only supports take along axis 0')
+        indices = np.asarray(indices)
+        flat = indices.ravel()
+        if flat.size and (flat.min() < -len(self) or flat.max() >= len(self)):
+            raise IndexError('index out of bounds for ShardedArray of size %d' % len(self))
+        flat = np.where(flat < 0, flat + len(self), flat)
+        result = out
+        if out is None or indices.ndim != 1:
+            result = np.empty((flat.size,) + self.shape[1:], dtype=self.dtype)
+        # One gather per shard touched
+        shard = np.searchsorted(self.dataset.offsets, flat, side='right') - 1
+        for i in np.unique(shard):
+            mask = shard == i
+            result[mask] = self._shard(i)[flat[mask] - self.dataset.offsets[i]]
+        result = result.reshape(indices.shape + self.shape[1:])
+        if out is not None and result is not out:
+            out[...] = result
+            return out
+        return result
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            index = np.arange(*index.indices(len(self)))
+        elif np.ndim(index) == 0:
+            return self.take(np.array([index]), axis=0)[0]
+        return self.take(index, axis=0)
+
+    def __array__(self, dtype=None, copy=None):
+        X = self[:]
+        return X if dtype is None else X.astype(dtype, copy=False)
+
+
+class ShardStream(object):
+    """
+    Batch source (see feeder.py) streaming a ShardedDataset.
+
+    Every pass over the data visits the shards in a new random order. A
+    shuffle buffer holds buffer_shards shards plus the samples left over from
+    the last buffer, and minibatches are drawn from a random permutation of
+    it, so every sample is seen about once per pass. A background thread
+    reads the next shard from disk while minibatches are served from the
+    buffer.
+    """
+
+    def __init__(self, dataset, batch_size, buffer_shards=2, rng=None,
+                 mean=None, scale=None, dtype=None):
+        """
+        Inputs:
+        - dataset: A ShardedDataset
+        - batch_size: Number of samples per minibatch
+        - buffer_shards: Number of shards shuffled together
+        - rng: numpy RandomState; default is a new one seeded from the global
+          numpy random state, so that the stream does not draw from
+          np.random on the thread that serves it (e.g. a prefetch thread).
+        - mean, scale, dtype: If any is given, samples are normalized as by
+          NormalizedArray, with dtype float32 unless given.
+        """
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.buffer_shards = buffer_shards
+        self.num_samples = dataset.num_samples
+        if rng is None:
+            rng = np.random.RandomState(np.random.randint(2**31 - 1))
+        self.rng = rng
+        self.normalize = None
+        if mean is not None or scale is not None or dtype is not None:
+            self.normalize = (mean, scale, dtype or np.float32)
+        self.X_raw = None
+        self.X_buffer = None
+        self.y_buffer = None
+        self.order = np.zeros(0, dtype=np.intp)
+        self.pos = 0
+
+        # The shard order has its own random state, since it is drawn on the
+        # reader thread
+        self._order_rng = np.random.RandomState(self.rng.randint(2**31 - 1))
+        self._loaded = queue.Queue(maxsize=1)
+        self._stop = False
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            for i in self._order_rng.permutation(self.dataset.num_shards):
+                if self._stop:
+                    return
+                try:
+                    self._loaded.put((self.dataset.load(i), None))
+                except Exception as e:
+                    # Re-raised on the consumer thread
+                    self._loaded.put((None, e))
+                    return
+
+    def _refill(self):
+        # Keep the samples not served yet and add the next shards
+        rest = self.order[self.pos:]
+        Xs, ys = [], []
+        if self.X_raw is not None:
+            Xs.append(np.take(self.X_raw, rest, axis=0))
+            ys.append(np.take(self.y_buffer, rest, axis=0))
+        for _ in range(self.buffer_shards):
+            shard, error = self._loaded.get()
+            if error is not None:
+                raise error
+            Xs.append(shard[0])
+            ys.append(shard[1])
+        self.X_raw = np.concatenate(Xs)
+        self.X_buffer = self.X_raw
+        if self.normalize is not None:
+            self.X_buffer = NormalizedArray(self.X_raw, *self.normalize)
+        self.y_buffer = np.concatenate(ys)
+        self.order = self.rng.permutation(len(self.y_buffer))
+        self.pos = 0
+
+    def next_batch(self, out=None):
+        while self.pos + self.batch_size > len(self.order):
+            self._refill()
+        batch_mask = self.order[self.pos:self.pos + self.batch_size]
+        self.pos += self.batch_size
+        if out is None:
+            return self.X_buffer[batch_mask], self.y_buffer[batch_mask]
+        X_buf, y_buf = out
+        np.take(self.X_buffer, batch_mask, axis=0, out=X_buf)
+        np.take(self.y_buffer, batch_mask, axis=0, out=y_buf)
+        return X_buf, y_buf
+
+    def close(self):
+        """
+        Stop the reader thread.
+        """
+        self._stop = True
+        while self._thread.is_alive():
+            try:
+                self._loaded.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join(0.01)
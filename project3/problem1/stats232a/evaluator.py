@@ -0,0 +1,131 @@
+from __future__ import print_function, division
+from future import standard_library
+standard_library.install_aliases()
+from builtins import range
+from builtins import object
+import queue
+import threading
+
+import numpy as np
+
+"""
+This file implements accuracy evaluation for the Solver, including an
+evaluator that runs on a background thread so that training does not stop
+while the accuracy of a snapshot of the model is computed.
+"""
+
+
+def accuracy(model, X, y, batch_size=100):
+    """
+    Fraction of correctly classified samples.
+
+    Inputs:
+    - model: A model object conforming to the Solver API
+    - X: Array of data, of shape (N, d_1, ..., d_k)
+    - y: Array of labels, of shape (N,)
+    - batch_size: Split X and y into batches of this size to avoid using
+      too much memory.
+
+    Returns:
+    - acc: Scalar giving the fraction of instances that were correctly
+      classified by the model.
+    """
+    N = X.shape[0]
+    y_pred = np.empty(N, dtype=np.intp)
+    for start in range(0, N, batch_size):
+        end = start + batch_size
+        scores = model.loss(X[start:end])
+        y_pred[start:end] = np.argmax(scores, axis=1)
+    return np.mean(y_pred == y)
+
+
+def fixed_subset(X, y, num_samples=None):
+    """
+    Gather a random subset once, to be evaluated on repeatedly.
+
+    Inputs:
+    - X: Array of data, of shape (N, d_1, ..., d_k)
+    - y: Array of labels, of shape (N,)
+    - num_samples: Size of the subset; if None or at least N, X and y are
+      returned as they are.
+
+    Returns a tuple (X_subset, y_subset) of samples drawn without replacement,
+    kept in their original order for sequential access.
+    """
+    N = X.shape[0]
+    if num_samples is None or N <= num_samples:
+        return X, y
+    mask = np.sort(np.random.choice(N, num_samples, replace=False))
+    return X[mask], y[mask]
+
+
+class AsyncEvaluator(object):
+    """
+    Evaluates model snapshots on fixed datasets on a background thread.
+
+    submit() queues a snapshot (a copy of the model the caller will not touch
+    again) and returns immediately unless max_pending snapshots are already
+    waiting. Results come back in submission order through poll() and
+    close().
+    """
+
+    def __init__(self, subsets, batch_size=100, max_pending=2):
+        """
+        Inputs:
+        - subsets: List of (X, y) pairs every snapshot is evaluated on
+        - batch_size: Batch size of the forward passes
+        - max_pending: Number of snapshots that can wait for evaluation
+          before submit() blocks.
+        """
+        self.subsets = subsets
+        self.batch_size = batch_size
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._done = queue.Queue()
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            model, tag = job
+            try:
+                accs = [accuracy(model, X, y, self.batch_size) for X, y in self.subsets]
+                self._done.put((model, tag, accs, None))
+            except Exception as e:
+                self._done.put((model, tag, None, e))
+
+    def submit(self, model, tag=None):
+        """
+        Inputs:
+        - model: Snapshot of the model to evaluate
+        - tag: Anything the caller wants back with the result
+        """
+        self._jobs.put((model, tag))
+
+    def poll(self):
+        """
+        Returns a list of (model, tag, accs) for the snapshots evaluated since
+        the last call, where accs holds one accuracy per subset.
+        """
+        results = []
+        while True:
+            try:
+                model, tag, accs, error = self._done.get_nowait()
+            except queue.Empty:
+                return results
+            if error is not None:
+                raise error
+            results.append((model, tag, accs))
+
+    def close(self):
+        """
+        Wait for the snapshots still queued and stop the thread.
+
+        Returns the results not yet returned by poll().
+        """
+        self._jobs.put(None)
+        self._thread.join()
+        return self.poll()
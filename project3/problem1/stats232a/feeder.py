@@ -0,0 +1,200 @@
+from __future__ import print_function, division
+from future import standard_library
+standard_library.install_aliases()
+from builtins import range
+from builtins import object
+import queue
+import threading
+
+import numpy as np
+
+"""
+This file implements minibatch sources for the Solver. A batch source has a
+single method:
+
+def next_batch(out=None):
+
+Inputs:
+  - out: Optional tuple (X_buf, y_buf) of preallocated arrays with the shape
+    of one minibatch. A source may gather the minibatch into these buffers and
+    return them instead of allocating new arrays.
+
+Returns:
+  - X_batch: Array of shape (batch_size, d_1, ..., d_k)
+  - y_batch: Array of shape (batch_size,)
+
+The arrays returned by a source are only valid until the next call, since
+they may be buffers that are reused.
+"""
+
+
+class RandomBatches(object):
+    """
+    Minibatches of indices sampled uniformly with replacement. This is the
+    sampling the Solver has always used.
+    """
+
+    def __init__(self, X, y, batch_size, rng=None):
+        """
+        Inputs:
+        - X: Array of data, of shape (N, d_1, ..., d_k)
+        - y: Array of labels, of shape (N,)
+        - batch_size: Number of samples per minibatch
+        - rng: numpy RandomState used for sampling; default is the global
+          numpy random state.
+        """
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.rng = np.random if rng is None else rng
+
+    def next_batch(self, out=None):
+        batch_mask = self.rng.choice(self.X.shape[0], self.batch_size)
+        if out is None:
+            return self.X[batch_mask], self.y[batch_mask]
+        X_buf, y_buf = out
+        np.take(self.X, batch_mask, axis=0, out=X_buf)
+        np.take(self.y, batch_mask, axis=0, out=y_buf)
+        return X_buf, y_buf
+
+
+class EpochBatches(object):
+    """
+    Minibatches sampled without replacement. At the start of every epoch the
+    indices are permuted once and the data is gathered into a shuffled copy
+    in that order, so each minibatch is a contiguous slice of the copy (a
+    view, no gather) and an epoch visits every sample exactly once. Samples
+    left over when N is not a multiple of batch_size are skipped in that
+    epoch.
+    """
+
+    def __init__(self, X, y, batch_size, rng=None):
+        """
+        Inputs:
+        - X: Array of data, of shape (N, d_1, ..., d_k)
+        - y: Array of labels, of shape (N,)
+        - batch_size: Number of samples per minibatch
+        - rng: numpy RandomState used for shuffling; default is the global
+          numpy random state.
+        """
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.rng = np.random if rng is None else rng
+        self.X_epoch = None
+        self.y_epoch = None
+        self.pos = 0
+
+    def _shuffle(self):
+        order = self.rng.permutation(self.X.shape[0])
+        # A new copy every epoch rather than reusing the last one, since the
+        # consumer (or a prefetcher) may still hold a slice of it. Dataset
+        # views shuffle their raw data and normalize each slice when read.
+        if hasattr(self.X, 'subset'):
+            self.X_epoch = self.X.subset(order)
+        else:
+            self.X_epoch = np.take(self.X, order, axis=0)
+        self.y_epoch = np.take(self.y, order, axis=0)
+        self.pos = 0
+
+    def next_batch(self, out=None):
+        """
+        Returns views of the shuffled copy; out is not used.
+        """
+        if self.X_epoch is None or self.pos + self.batch_size > self.X.shape[0]:
+            self._shuffle()
+        start, end = self.pos, self.pos + self.batch_size
+        self.pos = end
+        return self.X_epoch[start:end], self.y_epoch[start:end]
+
+
+class BatchPrefetcher(object):
+    """
+    Wraps a batch source and prepares the next minibatches on a background
+    thread while the model computes on the current one.
+
+    The worker gathers each minibatch into one of num_prefetch + 1
+    preallocated slots: up to num_prefetch slots are filled ahead of time and
+    one is held by the consumer. A slot is handed back to the worker when the
+    consumer asks for the next minibatch, so no arrays are allocated after the
+    first minibatch. numpy releases the GIL while copying, so the gather runs
+    concurrently with the forward and backward passes.
+
+    The prefetcher is itself a batch source. Call close() to stop the worker.
+    """
+
+    def __init__(self, source, num_prefetch=2, transform=None, rng=None):
+        """
+        Inputs:
+        - source: A batch source to read minibatches from. Only the worker
+          thread calls it once the prefetcher is constructed.
+        - num_prefetch: Number of minibatches prepared ahead of time.
+        - transform: Optional function transform(X_batch, rng, out) applied to
+          every minibatch on the worker thread (e.g. data augmentation). It
+          writes the transformed minibatch into out, which may be X_batch
+          itself, and returns it.
+        - rng: numpy RandomState passed to transform.
+        """
+        self.source = source
+        self.transform = transform
+        self.rng = np.random.RandomState() if rng is None else rng
+
+        # The first minibatch gives the shape and dtype of the slots
+        X_batch, y_batch = source.next_batch()
+        self.slots = [(np.empty_like(X_batch), np.empty_like(y_batch))
+                      for _ in range(num_prefetch + 1)]
+        self.slots[0][0][...] = X_batch
+        self.slots[0][1][...] = y_batch
+
+        self._free = queue.Queue()
+        self._ready = queue.Queue(maxsize=num_prefetch + 1)
+        self._held = None
+        self._stop = False
+        for i in range(1, num_prefetch + 1):
+            self._free.put(i)
+        self._ready.put(self._finish(0, *self.slots[0]))
+
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _finish(self, i, X_batch, y_batch):
+        if self.transform is not None:
+            X_batch = self.transform(X_batch, self.rng, out=self.slots[i][0])
+        return i, X_batch, y_batch, None
+
+    def _work(self):
+        while True:
+            i = self._free.get()
+            if i is None or self._stop:
+                return
+            try:
+                X_batch, y_batch = self.source.next_batch(out=self.slots[i])
+                self._ready.put(self._finish(i, X_batch, y_batch))
+            except Exception as e:
+                # Re-raised on the consumer thread
+                self._ready.put((i, None, None, e))
+                return
+
+    def next_batch(self, out=None):
+        if self._held is not None:
+            self._free.put(self._held)
+        i, X_batch, y_batch, error = self._ready.get()
+        if error is not None:
+            raise error
+        self._held = i
+        return X_batch, y_batch
+
+    def close(self):
+        """
+        Stop the worker thread. Minibatches still queued are dropped.
+        """
+        self._stop = True
+        self._free.put(None)
+        # Unblock a worker waiting for room in the ready queue
+        while self._thread.is_alive():
+            try:
+                self._ready.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join(0.01)
@@ -44,6 +44,29 @@ def sgd(w, dw, config=None):
     return w, config
 
 
+def _scratch(config, w, dw, n):
+    """
+    Preallocated temporary arrays for an update rule, kept in config so they
+    are allocated on the first call only. They have the dtype numpy would
+    give the temporaries of the expressions they replace.
+    """
+    scratch = config.get('_scratch')
+    dtype = np.result_type(w, dw)
+    if scratch is None or scratch[0].shape != w.shape or scratch[0].dtype != dtype:
+        scratch = [np.empty(w.shape, dtype=dtype) for _ in range(n)]
+        config['_scratch'] = scratch
+    return scratch
+
+
+def _state(config, key, w, dw):
+    """
+    Optimizer state array config[key], initialized to zeros.
+    """
+    if key not in config:
+        config[key] = np.zeros(w.shape, dtype=np.result_type(w, dw))
+    return config[key]
+
+
 def sgd_momentum(w, dw, config=None):
     """
     Performs stochastic gradient descent with momentum.
@@ -58,18 +81,20 @@ def sgd_momentum(w, dw, config=None):
     if config is None: config = {}
     config.setdefault('learning_rate', 1e-2)
     config.setdefault('momentum', 0.9)
-    v = config.get('velocity', np.zeros_like(w))
+    v = _state(config, 'velocity', w, dw)
 
     next_w = None
     mu = config.get('momentum')
     learning_rate = config.get('learning_rate')
 
-    # Momentum update rule
-    v = mu*v - learning_rate*dw
+    # Momentum update rule, v = mu*v - learning_rate*dw, in place
+    tmp, = _scratch(config, w, dw, 1)
+    np.multiply(v, mu, out=v)
+    np.multiply(dw, learning_rate, out=tmp)
+    np.subtract(v, tmp, out=v)
     w += v
 
     next_w = w
-    config['velocity'] = v
 
     return next_w, config
 
@@ -91,22 +116,29 @@ def rmsprop(x, dx, config=None):
     config.setdefault('learning_rate', 1e-2)
     config.setdefault('decay_rate', 0.99)
     config.setdefault('epsilon', 1e-8)
-    config.setdefault('cache', np.zeros_like(x))
+    cache = _state(config, 'cache', x, dx)
 
     next_x = None
-    cache = config.get('cache')
     decay_rate = config.get('decay_rate')
     epsilon = config.get('epsilon')
     learning_rate = config.get('learning_rate')
 
-    cache = decay_rate*cache + (1-decay_rate) * dx**2
-    x += -learning_rate * dx / (np.sqrt(cache) + epsilon)
+    # cache = decay_rate*cache + (1-decay_rate) * dx**2
+    a, b = _scratch(config, x, dx, 2)
+    np.multiply(cache, decay_rate, out=cache)
+    np.multiply(dx, dx, out=a)
+    np.multiply(a, 1 - decay_rate, out=a)
+    np.add(cache, a, out=cache)
 
+    # x += -learning_rate * dx / (np.sqrt(cache) + epsilon)
+    np.sqrt(cache, out=a)
+    np.add(a, epsilon, out=a)
+    np.multiply(dx, -learning_rate, out=b)
+    np.divide(b, a, out=b)
+    x += b
 
     next_x = x
 
-    config['cache'] = cache
-
     return next_x, config
 
 
@@ -129,30 +161,238 @@ def adam(x, dx, config=None):
     config.setdefault('beta1', 0.9)
     config.setdefault('beta2', 0.999)
     config.setdefault('epsilon', 1e-8)
-    config.setdefault('m', np.zeros_like(x))
-    config.setdefault('v', np.zeros_like(x))
+    m = _state(config, 'm', x, dx)
+    v = _state(config, 'v', x, dx)
     config.setdefault('t', 1)
 
     next_x = None
-    m = config.get('m')
-    v = config.get('v')
     beta1 = config.get('beta1')
     beta2 = config.get('beta2')
     t = config.get('t') + 1
     learning_rate = config.get('learning_rate')
     epsilon = config.get('epsilon')
 
-    new_m = beta1*m + (1-beta1)*dx
-    mt = new_m / (1-beta1**t)
-    new_v = beta2*v + (1-beta2)*(dx**2)
-    vt = new_v / (1-beta2**t)
-    x += -learning_rate * mt / (np.sqrt(vt) + epsilon)
+    # m = beta1*m + (1-beta1)*dx and v = beta2*v + (1-beta2)*(dx**2)
+    a, b = _scratch(config, x, dx, 2)
+    np.multiply(m, beta1, out=m)
+    np.multiply(dx, 1 - beta1, out=a)
+    np.add(m, a, out=m)
+    np.multiply(v, beta2, out=v)
+    np.multiply(dx, dx, out=a)
+    np.multiply(a, 1 - beta2, out=a)
+    np.add(v, a, out=v)
+
+    # x += -learning_rate * mt / (np.sqrt(vt) + epsilon) with the bias
+    # corrected mt = m / (1-beta1**t) and vt = v / (1-beta2**t)
+    np.divide(v, 1 - beta2**t, out=a)
+    np.sqrt(a, out=a)
+    np.add(a, epsilon, out=a)
+    np.divide(m, 1 - beta1**t, out=b)
+    np.multiply(b, -learning_rate, out=b)
+    np.divide(b, a, out=b)
+    x += b
 
     next_x = x
-    config['m'] = new_m
-    config['v'] = new_v
     config['t'] = t
 
+    return next_x, config
 
 
-    return next_x, config
+def _trust_ratio(w_norm, u_norm):
+    """
+    Ratio of the norm of the weights to the norm of their update, or 1 when
+    either is zero (e.g. biases initialized to zero).
+    """
+    if w_norm > 0 and u_norm > 0:
+        return w_norm / u_norm
+    return 1.0
+
+
+def lars(w, dw, config=None):
+    """
+    Uses Layer-wise Adaptive Rate Scaling (You et al., 2017): SGD with
+    momentum where the learning rate of each parameter array is scaled by the
+    ratio of the norm of its weights to the norm of its gradient, which keeps
+    training stable at very large batch sizes. The rule must be applied to
+    each layer separately, so it cannot be used with a ParamArena.
+
+    config format:
+    - learning_rate: Scalar global learning rate.
+    - momentum: Scalar between 0 and 1 giving the momentum value.
+    - trust_coefficient: Scalar eta; the layer learning rate is
+      eta * ||w|| / (||dw|| + weight_decay * ||w||) times learning_rate.
+    - weight_decay: Scalar weight decay added to the gradient. The models add
+      their own L2 regularization to dw, so this is 0 by default.
+    - epsilon: Small scalar used for smoothing to avoid dividing by zero.
+    - velocity: A numpy array of the same shape as w and dw used to store a
+      moving average of the scaled gradients.
+    """
+    if config is None: config = {}
+    config.setdefault('learning_rate', 1e-2)
+    config.setdefault('momentum', 0.9)
+    config.setdefault('trust_coefficient', 1e-3)
+    config.setdefault('weight_decay', 0.0)
+    config.setdefault('epsilon', 1e-8)
+    v = _state(config, 'velocity', w, dw)
+
+    weight_decay = config['weight_decay']
+    w_norm = np.linalg.norm(w)
+    g_norm = np.linalg.norm(dw)
+    local_lr = config['trust_coefficient'] * _trust_ratio(
+        w_norm, g_norm + weight_decay * w_norm + config['epsilon'])
+
+    # v = momentum*v - learning_rate*local_lr*(dw + weight_decay*w)
+    g, = _scratch(config, w, dw, 1)
+    np.multiply(w, weight_decay, out=g)
+    np.add(g, dw, out=g)
+    np.multiply(g, config['learning_rate'] * local_lr, out=g)
+    np.multiply(v, config['momentum'], out=v)
+    np.subtract(v, g, out=v)
+    w += v
+
+    return w, config
+
+
+def lamb(x, dx, config=None):
+    """
+    Uses the LAMB update rule (You et al., 2019): the Adam step, plus
+    decoupled weight decay, rescaled for each parameter array by the ratio of
+    the norm of its weights to the norm of the step. The rule must be applied
+    to each layer separately, so it cannot be used with a ParamArena.
+
+    config format:
+    - learning_rate: Scalar learning rate.
+    - beta1: Decay rate for moving average of first moment of gradient.
+    - beta2: Decay rate for moving average of second moment of gradient.
+    - epsilon: Small scalar used for smoothing to avoid dividing by zero.
+    - weight_decay: Scalar decoupled weight decay; 0 by default since the
+      models regularize dw themselves.
+    - m: Moving average of gradient.
+    - v: Moving average of squared gradient.
+    - t: Iteration number.
+    """
+    if config is None: config = {}
+    config.setdefault('learning_rate', 1e-3)
+    config.setdefault('beta1', 0.9)
+    config.setdefault('beta2', 0.999)
+    config.setdefault('epsilon', 1e-6)
+    config.setdefault('weight_decay', 0.0)
+    m = _state(config, 'm', x, dx)
+    v = _state(config, 'v', x, dx)
+    config.setdefault('t', 0)
+
+    beta1 = config['beta1']
+    beta2 = config['beta2']
+    t = config['t'] + 1
+
+    a, r = _scratch(config, x, dx, 2)
+    np.multiply(m, beta1, out=m)
+    np.multiply(dx, 1 - beta1, out=a)
+    np.add(m, a, out=m)
+    np.multiply(v, beta2, out=v)
+    np.multiply(dx, dx, out=a)
+    np.multiply(a, 1 - beta2, out=a)
+    np.add(v, a, out=v)
+
+    # r = mt / (sqrt(vt) + epsilon) + weight_decay * x
+    np.divide(v, 1 - beta2**t, out=a)
+    np.sqrt(a, out=a)
+    np.add(a, config['epsilon'], out=a)
+    np.divide(m, 1 - beta1**t, out=r)
+    np.divide(r, a, out=r)
+    np.multiply(x, config['weight_decay'], out=a)
+    np.add(r, a, out=r)
+
+    trust = _trust_ratio(np.linalg.norm(x), np.linalg.norm(r))
+    np.multiply(r, config['learning_rate'] * trust, out=r)
+    x -= r
+    config['t'] = t
+
+    return x, config
+
+
+# Update rules that compute norms over each parameter array, and so must not
+# be applied to the flat buffer of a ParamArena
+LAYERWISE_RULES = ('lars', 'lamb')
+
+
+class ParamArena(object):
+    """
+    Keeps all parameters of a model in one contiguous buffer, with
+    model.params[k] a view into it, and their gradients in a second buffer
+    of the same layout. An update rule then runs once over the whole buffer
+    instead of once per parameter, and the optimizer state it keeps in config
+    (velocity, cache, m, v) is a single contiguous array as well.
+
+    This works for the update rules above that act on each element
+    independently, i.e. all but those in LAYERWISE_RULES. All parameters must
+    have the same dtype.
+
+    Example usage:
+
+    arena = ParamArena(model.params)
+    arena.bind(model)
+    config = {'learning_rate': 1e-3}
+    loss, grads = model.loss(X, y)
+    arena.set_grads(grads)
+    config = arena.step(adam, config)
+    """
+
+    def __init__(self, params):
+        """
+        Inputs:
+        - params: Dictionary mapping parameter names to numpy arrays; only
+          their shapes and dtype are used.
+        """
+        dtypes = set(np.asarray(v).dtype for v in params.values())
+        if len(dtypes) != 1:
+            raise ValueError('Parameters of a ParamArena must share one dtype, got %s'
+                             % ', '.join(sorted(str(d) for d in dtypes)))
+        dtype = dtypes.pop()
+
+        self.slices = {}
+        size = 0
+        for k in sorted(params):
+            n = np.asarray(params[k]).size
+            self.slices[k] = (size, size + n, np.asarray(params[k]).shape)
+            size += n
+        self.w = np.zeros(size, dtype=dtype)
+        self.dw = np.zeros(size, dtype=dtype)
+        self.params = self._views(self.w)
+        self.grads = self._views(self.dw)
+
+    def _views(self, flat):
+        return dict((k, flat[start:end].reshape(shape))
+                    for k, (start, end, shape) in self.slices.items())
+
+    def bind(self, model):
+        """
+        Copy the values of model.params into the arena and replace them by
+        views of it.
+        """
+        for k, w in self.params.items():
+            if model.params[k] is not w:
+                w[...] = model.params[k]
+                model.params[k] = w
+
+    def set_grads(self, grads):
+        """
+        Copy the gradients returned by model.loss into the gradient buffer.
+        """
+        for k, dw in self.grads.items():
+            dw[...] = grads[k]
+
+    def step(self, update_rule, config):
+        """
+        Apply an update rule to all parameters at once.
+
+        Inputs:
+        - update_rule: One of the update rules above
+        - config: Its config dictionary, shared by all parameters
+
+        Returns the config dictionary to be passed to the next step.
+        """
+        next_w, config = update_rule(self.w, self.dw, config)
+        if next_w is not self.w:
+            self.w[...] = next_w
+        return config
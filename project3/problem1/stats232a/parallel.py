@@ -0,0 +1,244 @@
+from __future__ import print_function, division
+from builtins import range
+from builtins import object
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import traceback
+
+import numpy as np
+
+"""
+This file implements data-parallel loss and gradient computation for the
+Solver. Every minibatch is split into num_workers shards; the calling process
+computes the first shard and worker processes compute the others. The
+workers work with the fork and spawn start methods alike.
+
+The model parameters, the minibatch and one gradient buffer per worker live in
+shared memory, so nothing but a few integers goes through pipes each step:
+workers see parameter updates made by the Solver as soon as they happen, and
+their gradients are reduced by summing the shared buffers.
+"""
+
+
+def _layout(arrays, align=64):
+    """
+    Byte offsets for packing named arrays into one buffer.
+
+    Inputs:
+    - arrays: Dictionary mapping names to numpy arrays
+    - align: Every array starts at a multiple of this many bytes
+
+    Returns a tuple of:
+    - layout: List of (name, offset, shape, dtype), sorted by name
+    - nbytes: Total size of the buffer
+    """
+    layout = []
+    nbytes = 0
+    for k in sorted(arrays):
+        a = np.asarray(arrays[k])
+        layout.append((k, nbytes, a.shape, a.dtype))
+        nbytes += -(-a.nbytes // align) * align
+    return layout, max(nbytes, align)
+
+
+def _views(buf, layout, base=0):
+    """
+    Inputs:
+    - buf: Writable buffer, e.g. a RawArray
+    - layout: List of (name, offset, shape, dtype) from _layout
+    - base: Byte offset of the layout within buf
+
+    Returns a dictionary mapping names to numpy arrays that are views of buf.
+    """
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    views = {}
+    for k, offset, shape, dtype in layout:
+        size = int(np.prod(shape)) * dtype.itemsize
+        start = base + offset
+        views[k] = raw[start:start + size].view(dtype).reshape(shape)
+    return views
+
+
+def _worker(conn, model, rank, bufs, layout, nbytes, X_spec, y_spec):
+    """
+    Main loop of a worker process: receive the bounds of a shard of the
+    shared minibatch, compute its loss and gradient and write them, scaled by
+    the shard's share of the minibatch, to the worker's shared buffers.
+
+    The shared buffers are passed as RawArrays and the numpy views of them are
+    made here, since numpy arrays passed to a process are only shared when it
+    is forked; with the spawn start method they would arrive as copies.
+
+    Inputs:
+    - conn: Connection to the calling process
+    - model: The model; its params are replaced by views of the shared ones
+    - rank: Index of the worker's shard and gradient buffer
+    - bufs: Tuple of the RawArrays (params, grads, losses, X, y)
+    - layout, nbytes: Layout of the parameters, from _layout
+    - X_spec, y_spec: Tuples (shape, dtype) of the minibatch buffers
+    """
+    params_buf, grads_buf, loss_buf, X_buf, y_buf = bufs
+    model.params.update(_views(params_buf, layout))
+    grads = _views(grads_buf, layout, rank * nbytes)
+    loss = np.frombuffer(loss_buf)
+    X = np.frombuffer(X_buf, X_spec[1]).reshape(X_spec[0])
+    y = np.frombuffer(y_buf, y_spec[1]).reshape(y_spec[0])
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        start, end, N = msg
+        try:
+            if end > start:
+                l, g = model.loss(X[start:end], y[start:end])
+                scale = (end - start) / N
+                loss[rank] = l * scale
+                for k, dw in grads.items():
+                    np.multiply(g[k], scale, out=dw, casting='unsafe')
+            else:
+                loss[rank] = 0
+                for dw in grads.values():
+                    dw.fill(0)
+            conn.send(None)
+        except Exception:
+            conn.send(traceback.format_exc())
+    conn.close()
+
+
+class DataParallel(object):
+    """
+    Splits model.loss over a minibatch across num_workers processes.
+
+    On construction the values of model.params are moved into shared memory
+    and replaced by views of it; the update rules modify them in place, and
+    sync_params() copies back any parameter that an update rule replaced by a
+    new array. The workers are started by the first call to loss(), which also
+    fixes the largest minibatch they accept.
+
+    Only model.params is shared. Any other state a model keeps between calls
+    (for example running averages of batch normalization) is only updated in
+    the calling process, from the first shard.
+    """
+
+    def __init__(self, model, num_workers):
+        """
+        Inputs:
+        - model: A model object conforming to the Solver API
+        - num_workers: Number of shards per minibatch, including the one
+          computed by the calling process.
+        """
+        self.model = model
+        self.num_workers = num_workers
+        self.layout, self.nbytes = _layout(model.params)
+
+        self._params_buf = RawArray('b', self.nbytes)
+        self.params = _views(self._params_buf, self.layout)
+        for k, w in self.params.items():
+            w[...] = model.params[k]
+            model.params[k] = w
+
+        # Row r holds the scaled gradient of shard r, and the sum goes to the
+        # last row
+        self._grads_buf = RawArray('b', self.nbytes * (num_workers + 1))
+        self.grads = [_views(self._grads_buf, self.layout, r * self.nbytes)
+                      for r in range(num_workers + 1)]
+        self._loss_buf = RawArray('d', num_workers)
+        self.losses = np.frombuffer(self._loss_buf)
+
+        self.X = None
+        self.y = None
+        self._procs = []
+        self._conns = []
+
+    def _start(self, X_batch, y_batch):
+        self._X_buf = RawArray('b', X_batch.nbytes)
+        self._y_buf = RawArray('b', y_batch.nbytes)
+        self.X = np.frombuffer(self._X_buf, X_batch.dtype).reshape(X_batch.shape)
+        self.y = np.frombuffer(self._y_buf, y_batch.dtype).reshape(y_batch.shape)
+
+        bufs = (self._params_buf, self._grads_buf, self._loss_buf,
+                self._X_buf, self._y_buf)
+        for rank in range(1, self.num_workers):
+            parent, child = multiprocessing.Pipe()
+            p = multiprocessing.Process(
+                target=_worker,
+                args=(child, self.model, rank, bufs, self.layout, self.nbytes,
+                      (self.X.shape, self.X.dtype), (self.y.shape, self.y.dtype)))
+            p.daemon = True
+            p.start()
+            child.close()
+            self._procs.append(p)
+            self._conns.append(parent)
+
+    def loss(self, X, y):
+        """
+        Data-parallel equivalent of model.loss(X, y) for training.
+
+        Inputs:
+        - X: Array of shape (N, d_1, ..., d_k), a minibatch of input data
+        - y: Array of shape (N,), labels for X
+
+        Returns a tuple of:
+        - loss: Scalar loss of the whole minibatch
+        - grads: Dictionary mapping parameter names to gradients. They are
+          shared buffers overwritten by the next call.
+        """
+        if self.X is None:
+            self._start(X, y)
+        N = X.shape[0]
+        if N > self.X.shape[0] or X.shape[1:] != self.X.shape[1:]:
+            raise ValueError('Minibatch of shape %s does not fit the shared '
+                             'buffer of shape %s' % (X.shape, self.X.shape))
+        self.X[:N] = X
+        self.y[:N] = y
+
+        # Rounding up keeps the first shard non-empty when N < num_workers
+        bounds = np.ceil(np.linspace(0, N, self.num_workers + 1)).astype(int)
+        for rank, conn in enumerate(self._conns, 1):
+            conn.send((bounds[rank], bounds[rank + 1], N))
+
+        # The calling process computes the first shard meanwhile
+        end = bounds[1]
+        loss, grads = self.model.loss(self.X[:end], self.y[:end])
+        scale = end / N
+        self.losses[0] = loss * scale
+        for k, dw in self.grads[0].items():
+            np.multiply(grads[k], scale, out=dw, casting='unsafe')
+
+        errors = [conn.recv() for conn in self._conns]
+        errors = [e for e in errors if e is not None]
+        if errors:
+            raise RuntimeError('Data-parallel worker failed:\n%s' % errors[0])
+
+        total = self.grads[-1]
+        for k, dw in total.items():
+            dw[...] = self.grads[0][k]
+            for g in self.grads[1:-1]:
+                dw += g[k]
+        return float(self.losses.sum()), total
+
+    def sync_params(self):
+        """
+        Make sure every entry of model.params is the shared view, copying
+        values that an update rule returned as a new array.
+        """
+        for k, w in self.params.items():
+            if self.model.params[k] is not w:
+                w[...] = self.model.params[k]
+                self.model.params[k] = w
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (IOError, OSError):
+                pass
+        for p in self._procs:
+            p.join()
+        self._procs = []
+        self._conns = []
+        self.X = None
+        self.y = None
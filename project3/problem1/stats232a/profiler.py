@@ -0,0 +1,184 @@
+from __future__ import print_function, division
+from builtins import object
+import csv
+import json
+import sys
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+"""
+This file implements the timing instrumentation of the Solver. Every training
+iteration is split into phases, each timed with a monotonic clock:
+
+- sample: getting the next minibatch from the batch source
+- loss: the forward and backward pass of model.loss
+- update: applying the update rule to the parameters
+- eval: checking train and val accuracy (submitting and collecting snapshots
+  when evaluation is asynchronous)
+- checkpoint: copying the training state and queuing or writing a checkpoint
+
+The Solver uses a NullTimer unless profiling is enabled, whose methods do
+nothing, so the instrumentation costs a few method calls per iteration.
+"""
+
+PHASES = ('sample', 'loss', 'update', 'eval', 'checkpoint')
+
+# Monotonic clock with the best resolution available
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None
+    where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class NullTimer(object):
+    """
+    Timer that records nothing.
+    """
+
+    def tic(self):
+        return 0.0
+
+    def toc(self, phase, start):
+        pass
+
+    def begin(self):
+        pass
+
+    def end(self, iteration, epoch, num_images):
+        pass
+
+    def close(self):
+        pass
+
+
+class StepTimer(object):
+    """
+    Records the time spent in each phase of every iteration.
+
+    Usage:
+
+    timer.begin()
+    start = timer.tic()
+    ...
+    timer.toc('loss', start)
+    timer.end(t, epoch, batch_size)
+    """
+
+    def __init__(self, log_file=None):
+        """
+        Inputs:
+        - log_file: If not None, every iteration is also appended to this
+          file, as CSV if the name ends with .csv and as one JSON object per
+          line otherwise.
+        """
+        self.records = []
+        self._current = None
+        self._start = None
+        self._log = None
+        self._writer = None
+        if log_file is not None:
+            self._log = open(log_file, 'w')
+            if log_file.endswith('.csv'):
+                self._writer = csv.writer(self._log)
+                self._writer.writerow(self.columns())
+
+    @staticmethod
+    def columns():
+        return ['iteration', 'epoch'] + list(PHASES) + ['total', 'images_per_sec', 'peak_rss']
+
+    def tic(self):
+        return clock()
+
+    def toc(self, phase, start):
+        # Work outside of an iteration (e.g. after the last one) is not timed
+        if self._current is not None:
+            self._current[phase] += clock() - start
+
+    def begin(self):
+        self._current = dict((phase, 0.0) for phase in PHASES)
+        self._start = clock()
+
+    def end(self, iteration, epoch, num_images):
+        """
+        Finish the record of an iteration.
+
+        Inputs:
+        - iteration: Iteration number
+        - epoch: Epoch number
+        - num_images: Number of training samples the iteration processed
+        """
+        record = self._current
+        record['total'] = clock() - self._start
+        record['iteration'] = iteration
+        record['epoch'] = epoch
+        record['images_per_sec'] = num_images / record['total'] if record['total'] > 0 else float('nan')
+        record['peak_rss'] = peak_rss()
+        self.records.append(record)
+        self._current = None
+        if self._writer is not None:
+            self._writer.writerow([record[c] for c in self.columns()])
+        elif self._log is not None:
+            self._log.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+            self._writer = None
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Returns a dictionary with, for every phase and the total, a dictionary
+        of the mean, the given percentiles (as 'p50' etc.) and the sum of the
+        seconds per iteration; plus the mean images_per_sec over the whole
+        run and the peak_rss in bytes.
+        """
+        summary = {}
+        if not self.records:
+            return summary
+        for key in PHASES + ('total',):
+            seconds = np.array([r[key] for r in self.records])
+            stats = {'mean': float(seconds.mean()), 'sum': float(seconds.sum())}
+            for p, value in zip(percentiles, np.percentile(seconds, percentiles)):
+                stats['p%d' % p] = float(value)
+            summary[key] = stats
+        total = summary['total']['sum']
+        images = sum(r['images_per_sec'] * r['total'] for r in self.records)
+        summary['images_per_sec'] = images / total if total > 0 else float('nan')
+        summary['peak_rss'] = self.records[-1]['peak_rss']
+        return summary
+
+
+def format_summary(summary):
+    """
+    Returns the summary of a StepTimer as a printable table.
+    """
+    if not summary:
+        return 'No iterations timed'
+    total = summary['total']['sum']
+    lines = ['%-10s %10s %10s %10s %10s %7s' % ('phase', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms', 'share')]
+    for key in PHASES + ('total',):
+        s = summary[key]
+        lines.append('%-10s %10.3f %10.3f %10.3f %10.3f %6.1f%%' % (
+            key, s['mean'] * 1e3, s['p50'] * 1e3, s['p90'] * 1e3, s['p99'] * 1e3,
+            100 * s['sum'] / total if total > 0 else 0))
+    lines.append('%.1f images/sec' % summary['images_per_sec'])
+    if summary['peak_rss'] is not None:
+        lines.append('peak RSS %.1f MB' % (summary['peak_rss'] / 2**20))
+    return '\n'.join(lines)
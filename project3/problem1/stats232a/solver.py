@@ -3,12 +3,19 @@ from future import standard_library
 standard_library.install_aliases()
 from builtins import range
 from builtins import object
-import os
-import pickle as pickle
+import copy
 
 import numpy as np
 
 from stats232a import optim
+from stats232a.feeder import RandomBatches, EpochBatches, BatchPrefetcher
+from stats232a.parallel import DataParallel
+from stats232a.evaluator import accuracy, fixed_subset, AsyncEvaluator
+from stats232a.checkpoint import CheckpointWriter, load_npz
+from stats232a.profiler import NullTimer, StepTimer, format_summary
+
+# Key of the single entry of optim_configs when param_arena is used
+ARENA_KEY = '_arena'
 
 
 class Solver(object):
@@ -90,6 +97,8 @@ class Solver(object):
           'X_val': Array, shape (N_val, d_1, ..., d_k) of validation images
           'y_train': Array, shape (N_train,) of labels for training images
           'y_val': Array, shape (N_val,) of labels for validation images
+          X_train and X_val may also be dataset views (see dataset.py) that
+          normalize raw data one minibatch at a time.
 
         Optional arguments:
         - update_rule: A string giving the name of an update rule in optim.py.
@@ -102,17 +111,62 @@ class Solver(object):
           learning rate is multiplied by this value.
         - batch_size: Size of minibatches used to compute loss and gradient
           during training.
+        - accum_steps: Number of minibatches whose gradients are averaged
+          before each update; default is 1. The effective batch size is
+          batch_size * accum_steps while memory use stays that of batch_size.
         - num_epochs: The number of epochs to run for during training.
         - print_every: Integer; training losses will be printed every
           print_every iterations.
         - verbose: Boolean; if set to false then no output will be printed
           during training.
+        - profile: If true, time the phases of every iteration (see
+          profiler.py) into solver.timing_history and summarize them in
+          solver.timing_summary at the end of train(). If a string, the
+          per-iteration records are also written to this file (CSV if it
+          ends with .csv, JSON lines otherwise). Default is False.
         - num_train_samples: Number of training samples used to check training
           accuracy; default is 1000; set to None to use entire training set.
         - num_val_samples: Number of validation samples to use to check val
           accuracy; default is None, which uses the entire validation set.
         - checkpoint_name: If not None, then save model checkpoints here every
-          epoch.
+          epoch, as '<checkpoint_name>_epoch_<epoch>.npz' files that resume()
+          can continue from.
+        - checkpoint_keep_last: Number of most recent checkpoints to keep;
+          default is None, which keeps all of them.
+        - checkpoint_keep_best: Number of checkpoints with the best validation
+          accuracy to keep in addition; default is 0.
+        - checkpoint_async: Boolean; if true (default), checkpoints are written
+          on a background thread from a copy of the training state.
+        - eval_mode: How train and val accuracy are checked during training.
+          'sync' (default) subsamples the data anew at every check; 'fixed'
+          draws the subsamples once at the start of train(); 'async' also
+          evaluates a snapshot of the model on a background thread, so the
+          accuracies are appended to the histories some iterations later.
+        - sampler: How training minibatches are drawn. 'random' (default)
+          samples every minibatch with replacement; 'epoch' shuffles the
+          training set once per epoch and serves contiguous slices of the
+          shuffled copy, so every sample is seen once per epoch.
+        - prefetch: Number of training minibatches to prepare ahead of time on
+          a background thread; default is 0, which samples and gathers every
+          minibatch on the training thread.
+        - batch_source: Optional batch source (see feeder.py) with a
+          num_samples attribute, e.g. a dataset.ShardStream, serving the
+          training minibatches of batch_size samples instead of the sampler.
+          X_train and y_train are then only used to check training accuracy.
+          The caller owns the source: the Solver never closes it, so a source
+          with a background reader such as a ShardStream must be close()d
+          once training is done.
+        - augment: Optional function augment(X_batch, rng, out) applied to
+          every training minibatch, e.g. an augment.Augmenter. It runs on the
+          prefetch thread when prefetch > 0, hiding its cost behind the
+          forward and backward passes, and on the training thread otherwise.
+        - param_arena: Boolean; if true, keep all parameters, gradients and
+          optimizer state in flat buffers (see optim.ParamArena) so the
+          update rule runs once per step over all parameters. Requires an
+          update rule that acts elementwise and num_workers == 1.
+        - num_workers: Number of processes that compute the loss and gradient
+          of each minibatch, each on its own shard (see parallel.py); default
+          is 1.
         """
         self.model = model
         self.X_train = data['X_train']
@@ -125,13 +179,25 @@ class Solver(object):
         self.optim_config = kwargs.pop('optim_config', {})
         self.lr_decay = kwargs.pop('lr_decay', 1.0)
         self.batch_size = kwargs.pop('batch_size', 100)
+        self.accum_steps = kwargs.pop('accum_steps', 1)
         self.num_epochs = kwargs.pop('num_epochs', 10)
         self.num_train_samples = kwargs.pop('num_train_samples', 1000)
         self.num_val_samples = kwargs.pop('num_val_samples', None)
 
         self.checkpoint_name = kwargs.pop('checkpoint_name', None)
+        self.checkpoint_keep_last = kwargs.pop('checkpoint_keep_last', None)
+        self.checkpoint_keep_best = kwargs.pop('checkpoint_keep_best', 0)
+        self.checkpoint_async = kwargs.pop('checkpoint_async', True)
         self.print_every = kwargs.pop('print_every', 10)
         self.verbose = kwargs.pop('verbose', True)
+        self.profile = kwargs.pop('profile', False)
+        self.eval_mode = kwargs.pop('eval_mode', 'sync')
+        self.sampler = kwargs.pop('sampler', 'random')
+        self.prefetch = kwargs.pop('prefetch', 0)
+        self.batch_source = kwargs.pop('batch_source', None)
+        self.augment = kwargs.pop('augment', None)
+        self.num_workers = kwargs.pop('num_workers', 1)
+        self.param_arena = kwargs.pop('param_arena', False)
 
         # Throw an error if there are extra keyword arguments
         if len(kwargs) > 0:
@@ -144,6 +210,16 @@ class Solver(object):
             raise ValueError('Invalid update_rule "%s"' % self.update_rule)
         self.update_rule = getattr(optim, self.update_rule)
 
+        if self.sampler not in ('random', 'epoch'):
+            raise ValueError('Invalid sampler "%s"' % self.sampler)
+        if self.eval_mode not in ('sync', 'fixed', 'async'):
+            raise ValueError('Invalid eval_mode "%s"' % self.eval_mode)
+        if self.param_arena and self.num_workers > 1:
+            raise ValueError('param_arena cannot be combined with num_workers > 1')
+        if self.param_arena and self.update_rule.__name__ in optim.LAYERWISE_RULES:
+            raise ValueError('param_arena cannot be used with the layer-wise update_rule "%s"'
+                             % self.update_rule.__name__)
+
         self._reset()
 
 
@@ -159,9 +235,23 @@ class Solver(object):
         self.loss_history = []
         self.train_acc_history = []
         self.val_acc_history = []
-
-        # Make a deep copy of the optim_config for each parameter
+        self._batches = None
+        self._parallel = None
+        self._checkpoints = None
+        self._grad_sums = None
+        self._timer = NullTimer()
+        self.timing_history = []
+        self.timing_summary = {}
+
+        # Make a deep copy of the optim_config for each parameter, or a single
+        # one for the arena holding all of them
         self.optim_configs = {}
+        self._arena = None
+        if self.param_arena:
+            self._arena = optim.ParamArena(self.model.params)
+            self._arena.bind(self.model)
+            self.optim_configs[ARENA_KEY] = {k: v for k, v in self.optim_config.items()}
+            return
         for p in self.model.params:
             d = {k: v for k, v in self.optim_config.items()}
             self.optim_configs[p] = d
@@ -172,45 +262,216 @@ class Solver(object):
         Make a single gradient update. This is called by train() and should not
         be called manually.
         """
-        # Make a minibatch of training data
-        num_train = self.X_train.shape[0]
-        batch_mask = np.random.choice(num_train, self.batch_size)
-        X_batch = self.X_train[batch_mask]
-        y_batch = self.y_train[batch_mask]
-
-        # Compute loss and gradient
-        loss, grads = self.model.loss(X_batch, y_batch)
+        # Compute loss and gradient, averaged over accum_steps minibatches
+        loss, grads = self._minibatch_loss()
+        if self.accum_steps > 1:
+            if self._grad_sums is None:
+                self._grad_sums = {k: np.empty_like(g) for k, g in grads.items()}
+            for k, g in grads.items():
+                self._grad_sums[k][...] = g
+            for i in range(1, self.accum_steps):
+                next_loss, grads = self._minibatch_loss()
+                loss += next_loss
+                for k, g in grads.items():
+                    self._grad_sums[k] += g
+            loss /= self.accum_steps
+            grads = self._grad_sums
+            for g in grads.values():
+                g /= self.accum_steps
         self.loss_history.append(loss)
 
         # Perform a parameter update
-        for p, w in self.model.params.items():
-            dw = grads[p]
-            config = self.optim_configs[p]
-            next_w, next_config = self.update_rule(w, dw, config)
-            self.model.params[p] = next_w
-            self.optim_configs[p] = next_config
+        start = self._timer.tic()
+        if self._arena is not None:
+            self._arena.set_grads(grads)
+            config = self.optim_configs[ARENA_KEY]
+            self.optim_configs[ARENA_KEY] = self._arena.step(self.update_rule, config)
+        else:
+            for p, w in self.model.params.items():
+                dw = grads[p]
+                config = self.optim_configs[p]
+                next_w, next_config = self.update_rule(w, dw, config)
+                self.model.params[p] = next_w
+                self.optim_configs[p] = next_config
+        if self._parallel is not None:
+            self._parallel.sync_params()
+        self._timer.toc('update', start)
+
+
+    def _minibatch_loss(self):
+        """
+        Loss and gradient of the next training minibatch. This is called by
+        _step() and should not be called manually.
+        """
+        # Make a minibatch of training data
+        start = self._timer.tic()
+        if self._batches is None:
+            self._open_batches()
+        X_batch, y_batch = self._batches.next_batch()
+        if self.augment is not None and self.prefetch == 0:
+            # Not in place, since the minibatch may be a view of X_train
+            X_batch = self.augment(X_batch, np.random)
+        self._timer.toc('sample', start)
+
+        # Compute loss and gradient
+        start = self._timer.tic()
+        if self.num_workers > 1:
+            if self._parallel is None:
+                self._parallel = DataParallel(self.model, self.num_workers)
+            loss, grads = self._parallel.loss(X_batch, y_batch)
+        else:
+            loss, grads = self.model.loss(X_batch, y_batch)
+        self._timer.toc('loss', start)
+        return loss, grads
+
+
+    def _open_batches(self):
+        """
+        Set up the source of training minibatches. This is called by _step()
+        and should not be called manually.
+        """
+        sampler = RandomBatches if self.sampler == 'random' else EpochBatches
+        if self.batch_source is not None:
+            source = self.batch_source
+        elif self.prefetch > 0:
+            # The worker gets its own random state so that its sampling does
+            # not interleave with the main thread's use of np.random
+            rng = np.random.RandomState(np.random.randint(2**31 - 1))
+            source = sampler(self.X_train, self.y_train, self.batch_size, rng)
+        else:
+            source = sampler(self.X_train, self.y_train, self.batch_size)
+        self._batches = source
+        if self.prefetch > 0:
+            # The augmentation draws from its own random state as well
+            augment_rng = None
+            if self.augment is not None:
+                augment_rng = np.random.RandomState(np.random.randint(2**31 - 1))
+            self._batches = BatchPrefetcher(source, self.prefetch, self.augment,
+                                            augment_rng)
+
+
+    def _close_batches(self):
+        """
+        Stop the prefetch worker and the data-parallel workers, if any.
+        """
+        if isinstance(self._batches, BatchPrefetcher):
+            self._batches.close()
+        self._batches = None
+        if self._parallel is not None:
+            self._parallel.close()
+            self._parallel = None
 
 
-    def _save_checkpoint(self):
-        if self.checkpoint_name is None: return
-        checkpoint = {
-          'model': self.model,
-          'update_rule': self.update_rule,
+    def _checkpoint_state(self):
+        """
+        Copy the training state into arrays and a JSON-serializable dictionary
+        for a checkpoint: parameters, best parameters, optimizer state,
+        counters, histories and the numpy random state.
+        """
+        arrays = {}
+        for k, v in self.model.params.items():
+            arrays['params/%s' % k] = np.array(v)
+        for k, v in self.best_params.items():
+            arrays['best_params/%s' % k] = np.array(v)
+        optim_configs = {}
+        for p, config in self.optim_configs.items():
+            optim_configs[p] = {}
+            for k, v in config.items():
+                if k.startswith('_'):
+                    # Scratch space of the update rule
+                    continue
+                if isinstance(v, np.ndarray):
+                    arrays['optim/%s/%s' % (p, k)] = v.copy()
+                else:
+                    optim_configs[p][k] = v
+        rng_name, rng_keys, rng_pos, rng_has_gauss, rng_gauss = np.random.get_state()
+        arrays['rng/keys'] = rng_keys
+
+        meta = {
+          'update_rule': self.update_rule.__name__,
           'lr_decay': self.lr_decay,
           'optim_config': self.optim_config,
+          'optim_configs': optim_configs,
           'batch_size': self.batch_size,
           'num_train_samples': self.num_train_samples,
           'num_val_samples': self.num_val_samples,
           'epoch': self.epoch,
-          'loss_history': self.loss_history,
-          'train_acc_history': self.train_acc_history,
-          'val_acc_history': self.val_acc_history,
+          'best_val_acc': float(self.best_val_acc),
+          'loss_history': [float(l) for l in self.loss_history],
+          'train_acc_history': [float(a) for a in self.train_acc_history],
+          'val_acc_history': [float(a) for a in self.val_acc_history],
+          'rng': [rng_name, int(rng_pos), int(rng_has_gauss), float(rng_gauss)],
         }
-        filename = '%s_epoch_%d.pkl' % (self.checkpoint_name, self.epoch)
+        return arrays, meta
+
+
+    def _save_checkpoint(self):
+        if self.checkpoint_name is None: return
+        start = self._timer.tic()
+        if self._checkpoints is None:
+            self._checkpoints = CheckpointWriter(self.checkpoint_keep_last,
+                                                 self.checkpoint_keep_best,
+                                                 self.checkpoint_async)
+        arrays, meta = self._checkpoint_state()
+        filename = '%s_epoch_%d.npz' % (self.checkpoint_name, self.epoch)
         if self.verbose:
             print('Saving checkpoint to "%s"' % filename)
-        with open(filename, 'wb') as f:
-            pickle.dump(checkpoint, f)
+        score = self.val_acc_history[-1] if self.val_acc_history else 0.0
+        self._checkpoints.submit(filename, arrays, meta, score)
+        self._timer.toc('checkpoint', start)
+
+
+    def _close_checkpoints(self):
+        """
+        Wait for the checkpoints still being written.
+        """
+        if self._checkpoints is not None:
+            self._checkpoints.close()
+            self._checkpoints = None
+
+
+    def resume(self, path):
+        """
+        Restore the state saved in a checkpoint, so that train() continues the
+        run from there up to num_epochs. With the default sampler and no
+        prefetching the continued run draws the same minibatches as the
+        original one; otherwise the sampling starts afresh from the restored
+        random state.
+
+        Inputs:
+        - path: Checkpoint file written by this Solver
+        """
+        arrays, meta = load_npz(path)
+        if meta['update_rule'] != self.update_rule.__name__:
+            raise ValueError('Checkpoint was written with update_rule "%s", not "%s"'
+                             % (meta['update_rule'], self.update_rule.__name__))
+
+        self.best_params = {}
+        for name, v in arrays.items():
+            kind, _, k = name.partition('/')
+            if kind == 'params' and self._arena is not None:
+                self.model.params[k][...] = v
+            elif kind == 'params':
+                self.model.params[k] = v.astype(self.model.params[k].dtype)
+            elif kind == 'best_params':
+                self.best_params[k] = v.astype(self.model.params[k].dtype)
+
+        self.optim_configs = {}
+        for p, config in meta['optim_configs'].items():
+            self.optim_configs[p] = dict(config)
+        for name, v in arrays.items():
+            if name.startswith('optim/'):
+                p, k = name[len('optim/'):].rsplit('/', 1)
+                self.optim_configs[p][k] = v
+
+        self.epoch = meta['epoch']
+        self.best_val_acc = meta['best_val_acc']
+        self.loss_history = meta['loss_history']
+        self.train_acc_history = meta['train_acc_history']
+        self.val_acc_history = meta['val_acc_history']
+
+        rng_name, rng_pos, rng_has_gauss, rng_gauss = meta['rng']
+        np.random.set_state((rng_name, arrays['rng/keys'], rng_pos, rng_has_gauss, rng_gauss))
 
 
     def check_accuracy(self, X, y, num_samples=None, batch_size=100):
@@ -239,68 +500,135 @@ class Solver(object):
             y = y[mask]
 
         # Compute predictions in batches
-        num_batches = N // batch_size
-        if N % batch_size != 0:
-            num_batches += 1
-        y_pred = []
-        for i in range(num_batches):
-            start = i * batch_size
-            end = (i + 1) * batch_size
-            scores = self.model.loss(X[start:end])
-            y_pred.append(np.argmax(scores, axis=1))
-        y_pred = np.hstack(y_pred)
-        acc = np.mean(y_pred == y)
+        return accuracy(self.model, X, y, batch_size)
+
+
+    def _record_accuracy(self, train_acc, val_acc, params, tag):
+        """
+        Append a train and val accuracy to the histories and keep track of the
+        best parameters. This is called by train() and should not be called
+        manually.
+
+        Inputs:
+        - train_acc, val_acc: Accuracies of params
+        - params: Parameters that were evaluated. They are copied unless they
+          belong to a snapshot.
+        - tag: Tuple (epoch, iteration, num_iterations) of the evaluation
+        """
+        self.train_acc_history.append(train_acc)
+        self.val_acc_history.append(val_acc)
+
+        if self.verbose:
+            epoch, t, num_iterations = tag
+            print('(Epoch %d / %d, iteration %d / %d) train acc: %f; val_acc: %f' % (
+                   epoch, self.num_epochs, t+1, num_iterations, train_acc, val_acc))
+
+        # Keep track of the best model
+        if val_acc > self.best_val_acc:
+            self.best_val_acc = val_acc
+            self.best_params = {}
+            for k, v in params.items():
+                self.best_params[k] = v if self.eval_mode == 'async' else v.copy()
 
-        return acc
+        # After the best model is updated, so the checkpoint holds it
+        self._save_checkpoint()
 
 
     def train(self):
         """
-        Run optimization to train the model.
+        Run optimization to train the model, from the current epoch (0 unless
+        the Solver was resumed from a checkpoint) up to num_epochs.
         """
         num_train = self.X_train.shape[0]
-        iterations_per_epoch = max(num_train // self.batch_size, 1)
+        if self.batch_source is not None:
+            num_train = self.batch_source.num_samples
+        iterations_per_epoch = max(num_train // (self.batch_size * self.accum_steps), 1)
         num_iterations = self.num_epochs * iterations_per_epoch
-
-        for t in range(num_iterations):
-            self._step()
-
-            # Maybe print training loss
-            #if self.verbose and t % self.print_every == 0:
-            #    print('(Iteration %d / %d) loss: %f' % (
-            #           t + 1, num_iterations, self.loss_history[-1]))
-
-            # At the end of every epoch, increment the epoch counter and decay
-            # the learning rate.
-            epoch_end = (t + 1) % iterations_per_epoch == 0
-            if epoch_end:
-                self.epoch += 1
-                for k in self.optim_configs:
-                    self.optim_configs[k]['learning_rate'] *= self.lr_decay
-
-            # Check train and val accuracy on the first iteration, the last
-            # iteration, and at the end of each epoch.
-            first_it = (t == 0)
-            last_it = (t == num_iterations - 1)
-            if first_it or last_it or epoch_end or t % self.print_every == 0:
-                train_acc = self.check_accuracy(self.X_train, self.y_train,
-                    num_samples=self.num_train_samples)
-                val_acc = self.check_accuracy(self.X_val, self.y_val,
-                    num_samples=self.num_val_samples)
-                self.train_acc_history.append(train_acc)
-                self.val_acc_history.append(val_acc)
-                self._save_checkpoint()
-
-                if self.verbose:
-                    print('(Epoch %d / %d, iteration %d / %d) train acc: %f; val_acc: %f' % (
-                           self.epoch, self.num_epochs, t+1, num_iterations, train_acc, val_acc))
-
-                # Keep track of the best model
-                if val_acc > self.best_val_acc:
-                    self.best_val_acc = val_acc
-                    self.best_params = {}
-                    for k, v in self.model.params.items():
-                        self.best_params[k] = v.copy()
+        first_t = min(self.epoch * iterations_per_epoch, num_iterations)
+        if self._arena is not None:
+            # model.params may have been replaced since, e.g. by the best
+            # parameters at the end of the last train()
+            self._arena.bind(self.model)
+
+        # Evaluation data; with fixed subsets check_accuracy does not
+        # subsample again
+        X_train_eval, y_train_eval = self.X_train, self.y_train
+        X_val_eval, y_val_eval = self.X_val, self.y_val
+        if self.eval_mode != 'sync':
+            X_train_eval, y_train_eval = fixed_subset(self.X_train, self.y_train,
+                                                      self.num_train_samples)
+            X_val_eval, y_val_eval = fixed_subset(self.X_val, self.y_val,
+                                                  self.num_val_samples)
+        if self.profile:
+            log_file = self.profile if isinstance(self.profile, str) else None
+            self._timer = StepTimer(log_file)
+        evaluator = None
+        if self.eval_mode == 'async':
+            evaluator = AsyncEvaluator([(X_train_eval, y_train_eval),
+                                        (X_val_eval, y_val_eval)])
+
+        try:
+            for t in range(first_t, num_iterations):
+                self._timer.begin()
+                self._step()
+
+                # Maybe print training loss
+                #if self.verbose and t % self.print_every == 0:
+                #    print('(Iteration %d / %d) loss: %f' % (
+                #           t + 1, num_iterations, self.loss_history[-1]))
+
+                # At the end of every epoch, increment the epoch counter and decay
+                # the learning rate.
+                epoch_end = (t + 1) % iterations_per_epoch == 0
+                if epoch_end:
+                    self.epoch += 1
+                    for k in self.optim_configs:
+                        self.optim_configs[k]['learning_rate'] *= self.lr_decay
+
+                # Check train and val accuracy on the first iteration, the last
+                # iteration, and at the end of each epoch.
+                first_it = (t == 0)
+                last_it = (t == num_iterations - 1)
+                if first_it or last_it or epoch_end or t % self.print_every == 0:
+                    tag = (self.epoch, t, num_iterations)
+                    start = self._timer.tic()
+                    if evaluator is not None:
+                        evaluator.submit(copy.deepcopy(self.model), tag)
+                        self._timer.toc('eval', start)
+                    else:
+                        train_acc = self.check_accuracy(X_train_eval, y_train_eval,
+                            num_samples=self.num_train_samples)
+                        val_acc = self.check_accuracy(X_val_eval, y_val_eval,
+                            num_samples=self.num_val_samples)
+                        self._timer.toc('eval', start)
+                        self._record_accuracy(train_acc, val_acc, self.model.params, tag)
+
+                if evaluator is not None:
+                    start = self._timer.tic()
+                    results = evaluator.poll()
+                    self._timer.toc('eval', start)
+                    for model, tag, accs in results:
+                        self._record_accuracy(accs[0], accs[1], model.params, tag)
+
+                self._timer.end(t, self.epoch, self.batch_size * self.accum_steps)
+
+            if evaluator is not None:
+                for model, tag, accs in evaluator.close():
+                    self._record_accuracy(accs[0], accs[1], model.params, tag)
+                evaluator = None
+        finally:
+            self._close_batches()
+            if evaluator is not None:
+                evaluator.close()
+            self._close_checkpoints()
+            if self.profile:
+                self._timer.close()
+                self.timing_history = self._timer.records
+                self.timing_summary = self._timer.summary()
+                self._timer = NullTimer()
+
+        if self.profile and self.verbose:
+            print(format_summary(self.timing_summary))
 
         # At the end of training swap the best params into the model
         self.model.params = self.best_params
@@ -0,0 +1,317 @@
+from __future__ import print_function, division
+from builtins import range
+from builtins import object
+import copy
+import csv
+import math
+import multiprocessing
+import time
+
+import numpy as np
+
+from stats232a.solver import Solver
+
+"""
+This file implements hyperparameter sweeps over Solver runs with successive
+halving and Hyperband. Many configurations are trained for a few epochs on a
+process pool, the best fraction 1/eta by validation accuracy is trained for
+eta times as many epochs, and so on, so most of the compute goes to the
+promising configurations.
+
+A search space is a dictionary mapping hyperparameter names to:
+- a list: sample one of the values uniformly
+- ('log', lo, hi): sample log-uniformly between lo and hi
+- ('uniform', lo, hi): sample uniformly between lo and hi
+- ('int', lo, hi): sample an integer uniformly from lo to hi inclusive
+- anything else: use that value for every configuration
+
+Example usage:
+
+space = {
+  'learning_rate': ('log', 1e-4, 1e-1),
+  'weight_scale': ('log', 1e-3, 1e-1),
+  'reg': ('log', 1e-5, 1e-1),
+  'dropout': [0, 0.25, 0.5],
+}
+def make_model(config):
+    return FullyConnectedNet([100, 100], weight_scale=config['weight_scale'],
+                             reg=config['reg'], dropout=config['dropout'])
+results = hyperband(make_model, data, space, max_epochs=9,
+                    solver_kwargs={'update_rule': 'adam'},
+                    out_file='sweep.csv')
+
+Every configuration is passed to the model factory whole. The keys listed in
+optim_keys go to the optim_config of the Solver, and keys that are Solver
+arguments ('update_rule', 'lr_decay', 'batch_size') to the Solver itself.
+"""
+
+SOLVER_KEYS = ('update_rule', 'lr_decay', 'batch_size')
+
+
+def sample_config(space, rng):
+    """
+    Draw one configuration from a search space.
+
+    Inputs:
+    - space: Dictionary describing the search space, see above
+    - rng: numpy RandomState
+
+    Returns a dictionary mapping hyperparameter names to values.
+    """
+    config = {}
+    for k in sorted(space):
+        v = space[k]
+        if isinstance(v, list):
+            config[k] = v[rng.randint(len(v))]
+        elif isinstance(v, tuple) and len(v) == 3 and v[0] == 'log':
+            config[k] = float(np.exp(rng.uniform(np.log(v[1]), np.log(v[2]))))
+        elif isinstance(v, tuple) and len(v) == 3 and v[0] == 'uniform':
+            config[k] = float(rng.uniform(v[1], v[2]))
+        elif isinstance(v, tuple) and len(v) == 3 and v[0] == 'int':
+            config[k] = int(rng.randint(v[1], v[2] + 1))
+        else:
+            config[k] = v
+    return config
+
+
+# Set in every pool process by _init_worker
+_worker_args = None
+
+
+def _init_worker(model_factory, data, solver_kwargs, optim_keys, seed):
+    global _worker_args
+    _worker_args = (model_factory, data, solver_kwargs, optim_keys, seed)
+
+
+def _train_trial(task):
+    """
+    Train one configuration up to a number of epochs, continuing from the
+    state of its previous rung if any. Runs in a pool process.
+
+    Inputs:
+    - task: Tuple (trial, config, epochs, state)
+
+    Returns a tuple (trial, row, state) where row summarizes the rung and
+    state holds what is needed to continue training: the parameters of the
+    last step with their optimizer state, and separately the best parameters.
+    """
+    model_factory, data, solver_kwargs, optim_keys, seed = _worker_args
+    trial, config, epochs, state = task
+    done = state['epoch'] if state is not None else 0
+    np.random.seed([seed, trial, epochs])
+
+    kwargs = dict(solver_kwargs)
+    optim_config = dict(kwargs.pop('optim_config', {}))
+    for k, v in config.items():
+        if k in optim_keys:
+            optim_config[k] = v
+        elif k in SOLVER_KEYS:
+            kwargs[k] = v
+    kwargs['optim_config'] = optim_config
+    kwargs['num_epochs'] = epochs
+    kwargs['verbose'] = False
+
+    start = time.time()
+    model = model_factory(config)
+    solver = Solver(model, data, **kwargs)
+    if state is not None:
+        # Continue where the last rung stopped. The arrays are copied, since
+        # the update rules write into the parameters and optimizer state in
+        # place and must not touch the best parameters.
+        model.params = copy.deepcopy(state['params'])
+        solver.optim_configs = copy.deepcopy(state['optim_configs'])
+        solver.epoch = done
+        solver.best_val_acc = state['best_val_acc']
+        solver.best_params = copy.deepcopy(state['best_params'])
+        solver.val_acc_history = list(state['val_acc_history'])
+        solver.train_acc_history = list(state['train_acc_history'])
+    # train() updates this dictionary and then swaps the best parameters into
+    # the model, so keep it to get the parameters of the last step
+    params = model.params
+    solver.train()
+
+    row = dict(config)
+    row.update({
+      'trial': trial,
+      'epochs': epochs,
+      'train_acc': solver.train_acc_history[-1],
+      'val_acc': solver.val_acc_history[-1],
+      'best_val_acc': solver.best_val_acc,
+      'loss': solver.loss_history[-1] if solver.loss_history else float('nan'),
+      'seconds': time.time() - start,
+    })
+    state = {
+      'epoch': solver.epoch,
+      'params': params,
+      'optim_configs': solver.optim_configs,
+      'best_params': solver.best_params,
+      'best_val_acc': solver.best_val_acc,
+      'val_acc_history': solver.val_acc_history,
+      'train_acc_history': solver.train_acc_history,
+    }
+    return trial, row, state
+
+
+class SweepTable(object):
+    """
+    Collects the rows of a sweep and appends them to a CSV file as they
+    arrive, so a running sweep can be watched.
+    """
+
+    def __init__(self, out_file=None, verbose=True):
+        self.rows = []
+        self.out_file = out_file
+        self.verbose = verbose
+        self._columns = None
+        if out_file is not None:
+            open(out_file, 'w').close()
+
+    def add(self, row):
+        self.rows.append(row)
+        if self.verbose:
+            print('(Trial %d, bracket %d, rung %d, %d epochs) val_acc: %f; best_val_acc: %f' % (
+                   row['trial'], row['bracket'], row['rung'], row['epochs'],
+                   row['val_acc'], row['best_val_acc']))
+        if self.out_file is None:
+            return
+        with open(self.out_file, 'a') as f:
+            if self._columns is None:
+                self._columns = sorted(row)
+                writer = csv.DictWriter(f, self._columns, extrasaction='ignore')
+                writer.writeheader()
+            else:
+                writer = csv.DictWriter(f, self._columns, extrasaction='ignore')
+            writer.writerow(row)
+
+
+def _run_bracket(pool, table, configs, first_trial, bracket, min_epochs, max_epochs, eta):
+    """
+    Successive halving of one set of configurations on a pool.
+
+    Returns a dictionary as successive_halving does, without the rows.
+    """
+    trials = list(range(first_trial, first_trial + len(configs)))
+    states = dict((t, None) for t in trials)
+    final = {}
+    epochs = min_epochs
+    rung = 0
+    while trials:
+        tasks = [(t, configs[t - first_trial], epochs, states[t]) for t in trials]
+        scores = {}
+        for t, row, state in pool.imap_unordered(_train_trial, tasks):
+            row['bracket'], row['rung'] = bracket, rung
+            table.add(row)
+            states[t] = state
+            final[t] = (row, state)
+            scores[t] = row['best_val_acc']
+        if epochs >= max_epochs:
+            break
+        keep = max(1, len(trials) // eta)
+        trials = sorted(trials, key=lambda t: -scores[t])[:keep]
+        epochs = min(epochs * eta, max_epochs)
+        rung += 1
+
+    # The winner is among the configurations trained the longest
+    longest = max(row['epochs'] for row, state in final.values())
+    t = max((t for t in final if final[t][0]['epochs'] == longest),
+            key=lambda t: final[t][0]['best_val_acc'])
+    return {
+      'best_config': configs[t - first_trial],
+      'best_val_acc': final[t][0]['best_val_acc'],
+      'best_params': final[t][1]['best_params'],
+    }
+
+
+def _make_pool(processes, model_factory, data, solver_kwargs, optim_keys, seed):
+    return multiprocessing.Pool(processes, initializer=_init_worker,
+        initargs=(model_factory, data, solver_kwargs or {}, optim_keys, seed))
+
+
+def successive_halving(model_factory, data, space, num_configs, min_epochs=1,
+                       max_epochs=None, eta=3, processes=None, solver_kwargs=None,
+                       optim_keys=('learning_rate',), seed=0, out_file=None,
+                       verbose=True):
+    """
+    Train num_configs random configurations for min_epochs epochs, keep the
+    best 1/eta of them by validation accuracy and train those for eta times
+    as many epochs, until max_epochs is reached or one configuration is left.
+
+    Inputs:
+    - model_factory: Function taking a configuration dictionary and returning
+      a new model. It must be picklable (a module-level function) unless the
+      pool forks.
+    - data: Dictionary of training and validation data, as for Solver
+    - space: Dictionary describing the search space, see above
+    - num_configs: Number of configurations sampled
+    - min_epochs: Epochs of training in the first rung
+    - max_epochs: Most epochs any configuration is trained for; default is
+      min_epochs * eta ** k for the largest k that leaves one configuration.
+    - eta: Factor by which the configurations are cut down at each rung
+    - processes: Size of the process pool; default is the number of CPUs.
+    - solver_kwargs: Dictionary of arguments for every Solver. Pool processes
+      cannot start processes of their own, so num_workers must stay 1.
+    - optim_keys: Hyperparameters that go into optim_config
+    - seed: Seed of the configuration sampling and of every Solver run
+    - out_file: If not None, every finished rung of a trial is appended to
+      this CSV file.
+    - verbose: Boolean; print every finished rung.
+
+    Returns a dictionary with:
+    - rows: List of dictionaries, one per rung of a trial
+    - best_config: Configuration with the highest validation accuracy among
+      those trained the longest
+    - best_val_acc: Its validation accuracy
+    - best_params: Its best parameters
+    """
+    if max_epochs is None:
+        rungs = int(math.floor(math.log(num_configs) / math.log(eta) + 1e-9))
+        max_epochs = min_epochs * eta ** rungs
+    rng = np.random.RandomState(seed)
+    configs = [sample_config(space, rng) for _ in range(num_configs)]
+
+    table = SweepTable(out_file, verbose)
+    pool = _make_pool(processes, model_factory, data, solver_kwargs, optim_keys, seed)
+    try:
+        result = _run_bracket(pool, table, configs, 0, 0, min_epochs, max_epochs, eta)
+    finally:
+        pool.close()
+        pool.join()
+    result['rows'] = table.rows
+    return result
+
+
+def hyperband(model_factory, data, space, max_epochs, eta=3, processes=None,
+              solver_kwargs=None, optim_keys=('learning_rate',), seed=0,
+              out_file=None, verbose=True):
+    """
+    Hyperband: several successive halving brackets that trade the number of
+    configurations against the epochs they start with, from many
+    configurations at max_epochs / eta ** s_max epochs down to a few trained
+    for max_epochs right away. The brackets share one process pool.
+
+    Inputs: as for successive_halving, with max_epochs the most epochs any
+    configuration is trained for. Budgets below one epoch are rounded up.
+
+    Returns a dictionary as successive_halving does, over all brackets.
+    """
+    s_max = int(math.floor(math.log(max_epochs) / math.log(eta) + 1e-9))
+    rng = np.random.RandomState(seed)
+    table = SweepTable(out_file, verbose)
+    pool = _make_pool(processes, model_factory, data, solver_kwargs, optim_keys, seed)
+    best = None
+    first_trial = 0
+    try:
+        for s in range(s_max, -1, -1):
+            n = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+            min_epochs = max(1, int(round(max_epochs / eta ** s)))
+            configs = [sample_config(space, rng) for _ in range(n)]
+            result = _run_bracket(pool, table, configs, first_trial, s,
+                                  min_epochs, max_epochs, eta)
+            first_trial += n
+            if best is None or result['best_val_acc'] > best['best_val_acc']:
+                best = result
+    finally:
+        pool.close()
+        pool.join()
+    best['rows'] = table.rows
+    return best
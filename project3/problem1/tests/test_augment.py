@@ -0,0 +1,23 @@
+from __future__ import print_function, division
+
+import numpy as np
+
+from stats232a.augment import color_jitter
+
+
+def test_color_jitter_integer_images():
+    X = np.random.RandomState(0).randint(0, 256, (16, 3, 8, 8)).astype(np.uint8)
+    out = color_jitter(X, np.random.RandomState(1), brightness=40, contrast=0.5)
+    assert out.dtype == np.uint8
+
+    # The same jitter in float32, rounded and clipped
+    X_float = X.astype(np.float32)
+    expected = color_jitter(X_float, np.random.RandomState(1), brightness=40, contrast=0.5)
+    expected = np.clip(np.rint(expected), 0, 255)
+    assert np.abs(out - expected).max() <= 1
+    assert (out != X).mean() > 0.5
+
+    # In place gives the same result
+    Y = X.copy()
+    color_jitter(Y, np.random.RandomState(1), brightness=40, contrast=0.5, out=Y)
+    np.testing.assert_array_equal(Y, out)
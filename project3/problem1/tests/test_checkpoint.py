@@ -0,0 +1,54 @@
+from __future__ import print_function, division
+import os
+
+import numpy as np
+
+from stats232a.checkpoint import CheckpointWriter, load_npz
+
+
+def write(writer, directory, scores):
+    for i, score in enumerate(scores):
+        filename = os.path.join(directory, 'ckpt_%d.npz' % i)
+        writer.submit(filename, {'w': np.full(3, i)}, {'epoch': i}, score)
+    writer.close()
+
+
+def remaining(directory):
+    return sorted(int(f[5:-4]) for f in os.listdir(directory) if f.endswith('.npz'))
+
+
+def test_retention(tmpdir):
+    scores = [0.1, 0.5, 0.3, 0.2, 0.4, 0.0]
+    cases = [
+        (dict(keep_last=None), [0, 1, 2, 3, 4, 5]),
+        (dict(keep_last=2), [4, 5]),
+        (dict(keep_last=2, keep_best=2), [1, 4, 5]),
+        (dict(keep_last=0, keep_best=2), [1, 4]),
+        (dict(keep_last=None, keep_best=1), [0, 1, 2, 3, 4, 5]),
+    ]
+    for i, (kwargs, expected) in enumerate(cases):
+        for background in [False, True]:
+            directory = os.path.join(str(tmpdir), '%d_%s' % (i, background))
+            os.makedirs(directory)
+            writer = CheckpointWriter(background=background, **kwargs)
+            write(writer, directory, scores)
+            assert remaining(directory) == expected
+            assert sorted(int(w[0][-5]) for w in writer.written) == expected
+
+
+def test_rewrite_replaces_score(tmpdir):
+    directory = str(tmpdir)
+    writer = CheckpointWriter(keep_last=1, keep_best=1, background=False)
+    write(writer, directory, [0.9, 0.1, 0.2])
+    assert remaining(directory) == [0, 2]
+
+    # The best checkpoint is written again with a low score, so it is pruned
+    # once it is no longer among the last
+    writer.submit(os.path.join(directory, 'ckpt_0.npz'), {'w': np.zeros(3)}, {'epoch': 0}, 0.0)
+    assert remaining(directory) == [0, 2]
+    writer.submit(os.path.join(directory, 'ckpt_3.npz'), {'w': np.zeros(3)}, {'epoch': 3}, 0.1)
+    assert remaining(directory) == [2, 3]
+
+    arrays, meta = load_npz(os.path.join(directory, 'ckpt_2.npz'))
+    np.testing.assert_array_equal(arrays['w'], np.full(3, 2))
+    assert meta == {'epoch': 2}
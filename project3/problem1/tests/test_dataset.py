@@ -0,0 +1,61 @@
+from __future__ import print_function, division
+
+import os
+
+import numpy as np
+
+from stats232a.dataset import (write_shards, ShardedDataset, ShardStream,
+                               NormalizedArray)
+
+
+def make_shards(tmpdir, N=230, shard_size=40):
+    rng = np.random.RandomState(0)
+    X = rng.randint(256, size=(N, 3, 4, 4)).astype(np.uint8)
+    # The labels are the sample indices, so served samples can be traced back
+    y = np.arange(N)
+    directory = os.path.join(str(tmpdir), 'shards')
+    write_shards(X, y, directory, shard_size)
+    return X, y, ShardedDataset(directory)
+
+
+def test_sharded_array_matches_source(tmpdir):
+    X, y, shards = make_shards(tmpdir)
+    assert shards.num_samples == 230
+    assert [s['size'] for s in shards.shards] == [40] * 5 + [30]
+    assert shards.X.shape == X.shape and shards.X.dtype == X.dtype
+
+    np.testing.assert_array_equal(np.asarray(shards.X), X)
+    np.testing.assert_array_equal(shards.y[:], y)
+    idx = np.random.RandomState(1).randint(-230, 230, size=(7, 9))
+    np.testing.assert_array_equal(np.take(shards.X, idx, axis=0), X[idx])
+    np.testing.assert_array_equal(shards.X[39:81], X[39:81])
+    np.testing.assert_array_equal(shards.X[229], X[229])
+    out = np.empty((20,) + X.shape[1:], dtype=X.dtype)
+    assert np.take(shards.X, idx[0, :5].repeat(4), axis=0, out=out) is out
+    np.testing.assert_array_equal(out, X[idx[0, :5].repeat(4)])
+
+
+def test_shard_stream_serves_every_sample_once_per_pass(tmpdir):
+    X, y, shards = make_shards(tmpdir)
+    mean = X.mean(axis=0)
+    stream = ShardStream(shards, 15, mean=mean)
+    try:
+        state = np.random.get_state()
+        served = []
+        for _ in range(shards.num_samples // 15):
+            X_batch, y_batch = stream.next_batch()
+            assert X_batch.dtype == np.float32
+            np.testing.assert_allclose(X_batch, NormalizedArray(X, mean)[y_batch],
+                                       rtol=1e-6)
+            served.append(y_batch)
+        # The stream draws from its own random state
+        assert np.all(np.random.get_state()[1] == state[1])
+    finally:
+        stream.close()
+    assert not stream._thread.is_alive()
+
+    counts = np.bincount(np.concatenate(served), minlength=shards.num_samples)
+    # Samples left in the shuffle buffer are carried over, so a few may only
+    # be served after shards of the next pass
+    assert counts.max() <= 2
+    assert np.mean(counts == 1) >= 0.9
@@ -0,0 +1,50 @@
+from __future__ import print_function, division
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from stats232a.parallel import DataParallel
+from test_solver import TwoLayerNet, make_data
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a new interpreter, since the start method can only be set once
+SPAWN_SCRIPT = '''
+import multiprocessing
+from test_parallel import check_data_parallel
+multiprocessing.set_start_method('spawn', force=True)
+check_data_parallel()
+'''
+
+
+def check_data_parallel():
+    data = make_data()
+    X, y = data['X_train'][:100], data['y_train'][:100]
+    model = TwoLayerNet()
+    parallel = DataParallel(model, 3)
+    try:
+        for step in range(2):
+            reference = TwoLayerNet()
+            reference.params = dict((k, v.copy()) for k, v in model.params.items())
+            ref_loss, ref_grads = reference.loss(X, y)
+            loss, grads = parallel.loss(X, y)
+            assert abs(loss - ref_loss) < 1e-12
+            for k in grads:
+                np.testing.assert_allclose(grads[k], ref_grads[k], atol=1e-12)
+            # The workers must see updates made in place by the caller
+            for k in model.params:
+                model.params[k] -= 0.1 * grads[k]
+    finally:
+        parallel.close()
+
+
+def test_data_parallel_matches_model_loss():
+    check_data_parallel()
+
+
+def test_data_parallel_matches_model_loss_under_spawn():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([HERE, os.path.dirname(HERE)])
+    subprocess.check_call([sys.executable, '-c', SPAWN_SCRIPT], env=env)
@@ -0,0 +1,229 @@
+from __future__ import print_function, division
+from builtins import object
+import os
+
+import numpy as np
+
+from stats232a.layers import fc_forward, fc_backward, softmax_loss
+from stats232a.layer_utils import fc_relu_forward, fc_relu_backward
+from stats232a import optim
+from stats232a.solver import Solver
+
+
+class TwoLayerNet(object):
+    def __init__(self, D=3 * 8 * 8, H=20, C=10, seed=0):
+        rng = np.random.RandomState(seed)
+        self.params = {'W1': rng.randn(D, H) * 1e-2, 'b1': np.zeros(H),
+                       'W2': rng.randn(H, C) * 1e-2, 'b2': np.zeros(C)}
+
+    def loss(self, X, y=None):
+        h, cache1 = fc_relu_forward(X, self.params['W1'], self.params['b1'])
+        scores, cache2 = fc_forward(h, self.params['W2'], self.params['b2'])
+        if y is None:
+            return scores
+        loss, dscores = softmax_loss(scores, y)
+        dh, dW2, db2 = fc_backward(dscores, cache2)
+        dx, dW1, db1 = fc_relu_backward(dh, cache1)
+        return loss, {'W1': dW1, 'b1': db1, 'W2': dW2, 'b2': db2}
+
+
+def make_data(N=600, seed=1):
+    rng = np.random.RandomState(seed)
+    y = rng.randint(10, size=N)
+    X = rng.randn(N, 3, 8, 8) + y[:, None, None, None] * 0.3
+    return {'X_train': X[:500], 'y_train': y[:500], 'X_val': X[500:], 'y_val': y[500:]}
+
+
+def make_solver(checkpoint_name, num_epochs=4):
+    return Solver(TwoLayerNet(), make_data(), update_rule='adam',
+                  optim_config={'learning_rate': 1e-3}, num_epochs=num_epochs,
+                  batch_size=25, print_every=1000, verbose=False,
+                  checkpoint_name=checkpoint_name, checkpoint_async=False)
+
+
+def test_resume_matches_uninterrupted_run(tmpdir):
+    np.random.seed(0)
+    full = make_solver(os.path.join(str(tmpdir), 'full'))
+    full.train()
+
+    np.random.seed(1)
+    resumed = make_solver(None)
+    resumed.resume(os.path.join(str(tmpdir), 'full_epoch_2.npz'))
+    assert resumed.epoch == 2
+    assert resumed.best_val_acc == max(resumed.val_acc_history)
+    resumed.train()
+
+    assert resumed.val_acc_history == full.val_acc_history
+    assert resumed.best_val_acc == full.best_val_acc
+    for k in full.model.params:
+        np.testing.assert_array_equal(resumed.best_params[k], full.best_params[k])
+        np.testing.assert_array_equal(resumed.model.params[k], full.model.params[k])
+
+
+def test_interrupted_run_continues_like_uninterrupted_run(tmpdir):
+    np.random.seed(0)
+    full = make_solver(None)
+    full.train()
+
+    # Train 2 of the 4 epochs, as if the run was stopped there
+    np.random.seed(0)
+    first = make_solver(os.path.join(str(tmpdir), 'first'), num_epochs=2)
+    first.train()
+
+    np.random.seed(2)
+    second = make_solver(None)
+    second.resume(os.path.join(str(tmpdir), 'first_epoch_2.npz'))
+    second.train()
+
+    assert second.loss_history == full.loss_history
+    assert second.val_acc_history == full.val_acc_history
+    for k in full.model.params:
+        np.testing.assert_array_equal(second.model.params[k], full.model.params[k])
+
+
+class SliceBatches(object):
+    """
+    Batch source serving consecutive slices of the data, so two Solvers see
+    the same samples.
+    """
+
+    def __init__(self, X, y, batch_size):
+        self.X, self.y, self.batch_size = X, y, batch_size
+        self.num_samples = len(y)
+        self.pos = 0
+
+    def next_batch(self, out=None):
+        start, self.pos = self.pos, self.pos + self.batch_size
+        return self.X[start:self.pos], self.y[start:self.pos]
+
+
+def test_accum_steps_matches_large_batch():
+    data = make_data()
+    X, y = data['X_train'][:100], data['y_train'][:100]
+    params = {}
+    losses = {}
+    for batch_size, accum_steps in [(100, 1), (25, 4)]:
+        solver = Solver(TwoLayerNet(), data, update_rule='sgd',
+                        optim_config={'learning_rate': 1.0},
+                        batch_size=batch_size, accum_steps=accum_steps,
+                        batch_source=SliceBatches(X, y, batch_size), verbose=False)
+        solver._step()
+        params[accum_steps] = solver.model.params
+        losses[accum_steps] = solver.loss_history[0]
+
+    # With a learning rate of 1, the update is the gradient
+    np.testing.assert_allclose(losses[4], losses[1], rtol=1e-12)
+    w0 = TwoLayerNet().params
+    for k in w0:
+        np.testing.assert_allclose(params[4][k] - w0[k], params[1][k] - w0[k],
+                                   rtol=1e-9, atol=1e-15)
+
+
+def reference_trust(w_norm, u_norm):
+    return w_norm / u_norm if w_norm > 0 and u_norm > 0 else 1.0
+
+
+def test_lars_matches_reference():
+    rng = np.random.RandomState(0)
+    cases = [(rng.randn(4, 5), rng.randn(4, 5)),
+             (np.zeros(5), rng.randn(5)),    # Zero weights, e.g. biases
+             (rng.randn(5), np.zeros(5))]    # Zero gradient
+    for w, dw in cases:
+        config = {'learning_rate': 0.1, 'momentum': 0.9, 'trust_coefficient': 0.01,
+                  'weight_decay': 1e-3, 'epsilon': 1e-8}
+        next_w = w.copy()
+        ref_w, ref_v = w.copy(), np.zeros_like(w)
+        for _ in range(2):
+            next_w, config = optim.lars(next_w, dw, config)
+
+            w_norm = np.linalg.norm(ref_w)
+            u_norm = np.linalg.norm(dw) + 1e-3 * w_norm + 1e-8
+            local_lr = 0.01 * reference_trust(w_norm, u_norm)
+            ref_v = 0.9 * ref_v - 0.1 * local_lr * (dw + 1e-3 * ref_w)
+            ref_w = ref_w + ref_v
+            np.testing.assert_allclose(next_w, ref_w, rtol=1e-12, atol=1e-15)
+
+
+def test_lamb_matches_reference():
+    rng = np.random.RandomState(0)
+    cases = [(rng.randn(4, 5), rng.randn(4, 5)),
+             (np.zeros(5), rng.randn(5)),    # Zero weights
+             (np.zeros(5), np.zeros(5))]     # Zero update
+    for x, dx in cases:
+        config = {'learning_rate': 0.01, 'weight_decay': 1e-2}
+        next_x = x.copy()
+        ref_x, m, v = x.copy(), np.zeros_like(x), np.zeros_like(x)
+        for t in range(1, 3):
+            next_x, config = optim.lamb(next_x, dx, config)
+
+            m = 0.9 * m + 0.1 * dx
+            v = 0.999 * v + 0.001 * dx**2
+            r = (m / (1 - 0.9**t)) / (np.sqrt(v / (1 - 0.999**t)) + 1e-6) + 1e-2 * ref_x
+            trust = reference_trust(np.linalg.norm(ref_x), np.linalg.norm(r))
+            ref_x = ref_x - 0.01 * trust * r
+            np.testing.assert_allclose(next_x, ref_x, rtol=1e-12, atol=1e-15)
+            assert config['t'] == t
+
+
+def test_param_arena_step_matches_per_parameter_rules():
+    rng = np.random.RandomState(0)
+    params = TwoLayerNet().params
+    for rule in [optim.sgd_momentum, optim.adam]:
+        arena = optim.ParamArena(params)
+        model = TwoLayerNet()
+        arena.bind(model)
+        ref = dict((k, w.copy()) for k, w in params.items())
+        arena_config = {'learning_rate': 1e-2}
+        ref_configs = dict((k, {'learning_rate': 1e-2}) for k in ref)
+        for _ in range(3):
+            grads = dict((k, rng.randn(*w.shape)) for k, w in ref.items())
+            arena.set_grads(grads)
+            arena_config = arena.step(rule, arena_config)
+            for k in ref:
+                ref[k], ref_configs[k] = rule(ref[k], grads[k], ref_configs[k])
+        for k in ref:
+            assert np.shares_memory(model.params[k], arena.w)
+            np.testing.assert_allclose(model.params[k], ref[k], rtol=1e-12, atol=1e-15)
+
+
+class ArenaCheckingNet(TwoLayerNet):
+    """
+    Records whether every parameter is a view of the arena at each loss call.
+    """
+
+    def __init__(self):
+        super(ArenaCheckingNet, self).__init__()
+        self.arena = None
+        self.in_arena = []
+
+    def loss(self, X, y=None):
+        if y is not None:
+            self.in_arena.append(all(np.shares_memory(w, self.arena.w)
+                                     for w in self.params.values()))
+        return super(ArenaCheckingNet, self).loss(X, y)
+
+
+def test_param_arena_solver_matches_per_parameter_solver():
+    for update_rule in ['sgd_momentum', 'adam']:
+        solvers = []
+        for param_arena in [False, True]:
+            np.random.seed(0)
+            model = ArenaCheckingNet() if param_arena else TwoLayerNet()
+            solver = Solver(model, make_data(), update_rule=update_rule,
+                            optim_config={'learning_rate': 1e-2}, num_epochs=1,
+                            batch_size=50, param_arena=param_arena, verbose=False)
+            if param_arena:
+                model.arena = solver._arena
+            solver.train()
+            # model.params now hold the best parameters; a second train()
+            # must bind them to the arena again
+            solver.num_epochs = 2
+            solver.train()
+            solvers.append(solver)
+
+        plain, arena = solvers
+        assert len(arena.model.in_arena) == 20 and all(arena.model.in_arena)
+        assert arena.loss_history == plain.loss_history
+        for k in plain.model.params:
+            np.testing.assert_allclose(arena.model.params[k], plain.model.params[k],
+                                       rtol=1e-12, atol=1e-15)
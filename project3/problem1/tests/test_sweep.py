@@ -0,0 +1,35 @@
+from __future__ import print_function, division
+import copy
+
+import numpy as np
+
+from stats232a import sweep
+from stats232a.evaluator import accuracy
+from test_solver import TwoLayerNet, make_data
+
+
+def make_model(config):
+    return TwoLayerNet()
+
+
+def test_rungs_keep_best_params_apart_from_training():
+    data = make_data()
+    solver_kwargs = {'update_rule': 'adam', 'batch_size': 25,
+                     'num_train_samples': None}
+    sweep._init_worker(make_model, data, solver_kwargs, ('learning_rate',), 0)
+    config = {'learning_rate': 1e-2}
+
+    _, row, state = sweep._train_trial((0, config, 1, None))
+    before = copy.deepcopy(state)
+    _, row, next_state = sweep._train_trial((0, config, 3, state))
+
+    # The state handed to the next rung is not modified by it
+    for key in ('params', 'best_params'):
+        for k in before[key]:
+            np.testing.assert_array_equal(state[key][k], before[key][k])
+
+    # The best parameters are the ones that reached best_val_acc
+    model = TwoLayerNet()
+    model.params = next_state['best_params']
+    assert accuracy(model, data['X_val'], data['y_val']) == row['best_val_acc']
+    assert next_state['params'] is not next_state['best_params']